@@ -1,51 +1,82 @@
+import logging
 from django.contrib.auth.backends import ModelBackend
+from . import nonces, user_cache
 from .models import User
-from web3.auto import w3
-from eth_account.messages import defunct_hash_message
+from .signatures import arecover_signer, recover_signer, recovery_slot
+
+logger = logging.getLogger(__name__)
+
 
 class WalletBackend(ModelBackend):
     """
     Custom authentication backend to authenticate users via wallet signature.
     """
-    def authenticate(self, request, wallet_address=None, signature=None):
+    def authenticate(self, request, wallet_address=None, signature=None, nonce=None):
         """
         Authenticates a user by verifying a signed message (nonce).
         """
-        # The nonce should be generated and stored in the session in a separate view.
-        nonce = request.session.get("login_nonce")
-        if not nonce or not wallet_address or not signature:
+        if not wallet_address or not signature:
+            return None
+        # The nonce is issued in a separate view, and used up by any attempt
+        if not nonces.consume_nonce(nonce):
             return None
 
         try:
-            # The message that was signed on the frontend
-            message_hash = defunct_hash_message(text=nonce)
-
-            # Recover the address from the signature
-            signer_address = w3.eth.account.recoverHash(message_hash, signature=signature)
+            # Recover the address that signed the nonce on the frontend
+            signer_address = recover_signer(nonce, signature)
 
             # Check if the recovered address matches the provided address
             if signer_address.lower() == wallet_address.lower():
                 # Get or create the user with this wallet address
-                user, created = User.objects.get_or_create(
-                    wallet_address=wallet_address.lower(),
-                    defaults={'username': wallet_address.lower()} # Use wallet address as username if new
-                )
-
-                # Clear the nonce from the session after successful login
-                request.session["login_nonce"] = None
+                user, created = User.objects.get_or_create(**self._wallet_user_lookup(wallet_address))
                 return user
         except Exception as e:
             # Handle exceptions (e.g., invalid signature)
-            print(f"Authentication error: {e}") # For debugging
+            logger.warning(f"Authentication error: {e}")
             return None
 
         return None
 
-    def get_user(self, user_id):
+    async def aauthenticate(self, request, wallet_address=None, signature=None, nonce=None):
         """
-        Standard method to retrieve a user instance.
+        Async authenticate(). The signature is checked in the recovery pool, so the
+        event loop keeps serving other requests meanwhile. Raises RecoveryOverloaded
+        without using up the nonce when the pool is saturated.
         """
-        try:
-            return User.objects.get(pk=user_id)
-        except User.DoesNotExist:
+        if not wallet_address or not signature:
+            return None
+
+        async with recovery_slot():
+            if not await nonces.aconsume_nonce(nonce):
+                return None
+            try:
+                signer_address = await arecover_signer(nonce, signature)
+            except Exception as e:
+                # Handle exceptions (e.g., invalid signature)
+                logger.warning(f"Authentication error: {e}")
+                return None
+
+        if signer_address.lower() != wallet_address.lower():
             return None
+        user, created = await User.objects.aget_or_create(**self._wallet_user_lookup(wallet_address))
+        return user
+
+    def _wallet_user_lookup(self, wallet_address: str) -> dict:
+        # Use wallet address as username if new
+        return {"wallet_address": wallet_address.lower(), "defaults": {"username": wallet_address.lower()}}
+
+    def get_user(self, user_id):
+        """
+        Standard method to retrieve a user instance, through the user cache.
+        """
+        return user_cache.get_user(user_id)
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    The default username/password backend, looking up logged-in users through the
+    user cache instead of the database.
+    """
+    def get_user(self, user_id):
+        user = user_cache.get_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
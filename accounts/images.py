@@ -0,0 +1,37 @@
+import os
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# Output formats for profile image variants: WebP for modern browsers,
+# JPEG as the fallback.
+VARIANT_FORMATS = {
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "jpeg": {"format": "JPEG", "quality": 85, "optimize": True, "progressive": True},
+}
+
+
+def generate_profile_image_variants(image_field) -> dict:
+    """
+    Creates square, metadata-free copies of a profile image in each of
+    PROFILE_IMAGE_SIZES and each variant format, stored next to the original.
+    Returns the stored file names as {format: {size: name}}.
+    """
+    storage = image_field.storage
+    stem, _ = os.path.splitext(image_field.name)
+
+    with image_field.open("rb") as original, Image.open(original) as image:
+        image.seek(0)
+        # Apply the EXIF orientation; re-encoding below drops EXIF and other metadata
+        image = ImageOps.exif_transpose(image).convert("RGB")
+
+        variants = {image_format: {} for image_format in VARIANT_FORMATS}
+        for size in settings.PROFILE_IMAGE_SIZES:
+            resized = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+            for image_format, options in VARIANT_FORMATS.items():
+                output = BytesIO()
+                resized.save(output, **options)
+                name = storage.save(f"{stem}_{size}.{image_format}", ContentFile(output.getvalue()))
+                variants[image_format][str(size)] = name
+    return variants
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from linkus_app.benchmarks import benchmark_database, format_summary, run_concurrently, summarize
+from accounts import nonces, signatures
+
+# Seconds between event loop responsiveness probes during the async run
+PROBE_INTERVAL = 0.01
+
+
+def signed_logins(count: int) -> list[tuple[str, str]]:
+    """
+    Returns (nonce, request body) pairs for `count` first-time logins of new wallets.
+    """
+    from eth_account import Account
+    from eth_account.messages import encode_defunct
+
+    logins = []
+    for _ in range(count):
+        account = Account.create()
+        nonce = nonces.issue_nonce()
+        signature = account.sign_message(encode_defunct(text=nonce)).signature.hex()
+        logins.append((nonce, json.dumps({"wallet_address": account.address, "signature": signature})))
+    return logins
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks wallet logins on a throwaway database: the sync view on concurrent "
+        "threads, as in a threaded sync worker, against the async view on one event "
+        "loop with signature recovery in the recovery pool. Uses the configured caches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logins", type=int, default=400, help="Logins per view.")
+        parser.add_argument("--concurrency", type=int, default=16, help="Logins in flight at once.")
+
+    def handle(self, *args, logins, concurrency, **options):
+        calls_per_worker = max(logins // concurrency, 1)
+        logins = calls_per_worker * concurrency
+        self.stdout.write(
+            f"{logins} logins, {concurrency} at once; recovery pool: "
+            f"{settings.WALLET_RECOVERY_WORKERS} {settings.WALLET_RECOVERY_EXECUTOR} workers"
+        )
+        # The test clients send requests for "testserver"
+        with benchmark_database(), override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            sync_logins = signed_logins(logins)
+            url = reverse("accounts:wallet_login")
+
+            def sync_login(worker, i):
+                nonce, body = sync_logins[worker * calls_per_worker + i]
+                client = Client()
+                client.cookies[nonces.NONCE_COOKIE] = nonce
+                response = client.post(url, body, content_type="application/json")
+                if response.status_code != 200:
+                    raise RuntimeError(f"Login failed with HTTP {response.status_code}")
+
+            self.stdout.write(format_summary("sync", summarize(run_concurrently(sync_login, concurrency, calls_per_worker))))
+
+            async_logins = signed_logins(logins)
+            result, lags = asyncio.run(self.run_async(async_logins, concurrency))
+            self.stdout.write(format_summary("async", summarize(result)))
+            lags.sort()
+            self.stdout.write(
+                f"{'loop lag':<14} p99 {lags[int(0.99 * (len(lags) - 1))] * 1000:.2f}ms  "
+                f"max {lags[-1] * 1000:.2f}ms"
+            )
+            signatures.shutdown_executor()
+
+    async def run_async(self, logins, concurrency) -> tuple[dict, list]:
+        url = reverse("accounts:wallet_login_async")
+        latencies, errors, lags = [], [], []
+        in_flight = asyncio.Semaphore(concurrency)
+
+        # Starts the pool's workers before timing
+        from eth_account import Account
+        from eth_account.messages import encode_defunct
+        account = Account.create()
+        signature = account.sign_message(encode_defunct(text="warm up")).signature.hex()
+        await asyncio.gather(*(
+            signatures.arecover_signer("warm up", signature) for _ in range(settings.WALLET_RECOVERY_WORKERS)
+        ))
+
+        async def login(nonce, body):
+            async with in_flight:
+                started = time.perf_counter()
+                client = AsyncClient()
+                client.cookies[nonces.NONCE_COOKIE] = nonce
+                response = await client.post(url, body, content_type="application/json")
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+                    return
+                latencies.append(time.perf_counter() - started)
+
+        async def probe_loop():
+            # How late the loop runs a callback due every PROBE_INTERVAL
+            while True:
+                expected = time.perf_counter() + PROBE_INTERVAL
+                await asyncio.sleep(PROBE_INTERVAL)
+                lags.append(max(time.perf_counter() - expected, 0.0))
+
+        prober = asyncio.create_task(probe_loop())
+        started = time.perf_counter()
+        await asyncio.gather(*(login(nonce, body) for nonce, body in logins))
+        elapsed = time.perf_counter() - started
+        prober.cancel()
+        return {"latencies": latencies, "errors": errors, "elapsed": elapsed}, lags
@@ -0,0 +1,110 @@
+import json
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What each kind of process imports before it can serve its first request or task
+STARTUP_CODE = {
+    "web": (
+        "import linkus_app.asgi, linkus_app.urls\n"
+        "from django.contrib.auth import get_backends\n"
+        "get_backends()\n"
+    ),
+    "worker": (
+        "from linkus_app.celery import app\n"
+        "import django\n"
+        "django.setup()\n"
+        "app.loader.import_default_modules()\n"
+    ),
+}
+
+# Runs the startup code and prints its wall-clock time and every module it loaded.
+# -X importtime doesn't trace modules loaded with importlib.import_module, as Django
+# loads apps and backends (though it does trace what they import), so the total and
+# the module list come from here.
+MEASURE_CODE = """
+import json, sys, time
+started = time.perf_counter()
+{startup}
+print(json.dumps({{"elapsed": time.perf_counter() - started, "modules": sorted(sys.modules)}}))
+"""
+
+# A line of `python -X importtime` output: self and cumulative microseconds, then
+# the module name indented by two spaces per level of nesting
+IMPORT_TIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def parse_import_times(output: str) -> list[tuple[str, int, int, int]]:
+    """
+    Returns the (module, self µs, cumulative µs, depth) of each import in
+    `python -X importtime` output.
+    """
+    imports = []
+    for line in output.splitlines():
+        match = IMPORT_TIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            imports.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return imports
+
+
+class Command(BaseCommand):
+    help = (
+        "Reports which modules a web or worker process spends its startup importing, "
+        "measured with python -X importtime in a fresh interpreter."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("target", nargs="?", choices=sorted(STARTUP_CODE), default="web")
+        parser.add_argument("--limit", type=int, default=20, help="Rows to show.")
+        parser.add_argument(
+            "--modules", action="store_true",
+            help="List individual modules by cumulative time instead of top-level packages by own time.",
+        )
+        parser.add_argument("--repeat", type=int, default=3, help="Runs to take the fastest of.")
+        parser.add_argument("--budget", type=float, help="Fail if imports take longer than this many milliseconds.")
+
+    def handle(self, *args, target, limit, modules, repeat, budget, **options):
+        run = min((self.measure(target) for _ in range(max(repeat, 1))), key=lambda run: run["elapsed"])
+        imports = run["imports"]
+        total = sum(self_us for _, self_us, _, _ in imports)
+
+        if modules:
+            self.stdout.write(f"{'cumulative':>10}  {'self':>8}  module")
+            rows = sorted(imports, key=lambda item: item[2], reverse=True)[:limit]
+            for module, self_us, cumulative_us, depth in rows:
+                self.stdout.write(f"{cumulative_us / 1000:>8.1f}ms  {self_us / 1000:>6.1f}ms  {module}")
+        else:
+            packages = defaultdict(int)
+            for module, self_us, _, _ in imports:
+                packages[module.split(".")[0]] += self_us
+            self.stdout.write(f"{'self':>8}  {'share':>5}  package")
+            for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:limit]:
+                self.stdout.write(f"{self_us / 1000:>6.1f}ms  {self_us / max(total, 1):>5.0%}  {package}")
+
+        elapsed = run["elapsed"] * 1000
+        self.stdout.write(
+            f"{target}: started in {elapsed:.1f}ms, {len(run['modules'])} modules loaded "
+            f"({total / 1000:.1f}ms in traced imports)"
+        )
+        if budget is not None and elapsed > budget:
+            raise CommandError(f"Startup took {elapsed:.1f}ms, over the budget of {budget:.1f}ms.")
+
+    def measure(self, target: str) -> dict:
+        """
+        Starts a fresh interpreter as a `target` process would and returns its
+        startup time in seconds, the modules it loaded and its traced imports.
+        """
+        # The fresh interpreter inherits DJANGO_SETTINGS_MODULE
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", MEASURE_CODE.format(startup=STARTUP_CODE[target])],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise CommandError(f"Starting a {target} process failed:\n{result.stderr[-2000:]}")
+        run = json.loads(result.stdout.splitlines()[-1])
+        run["imports"] = parse_import_times(result.stderr)
+        return run
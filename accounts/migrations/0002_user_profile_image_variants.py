@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='profile_image_variants',
+            field=models.JSONField(blank=True, default=dict, help_text='Resized copies of the profile picture, as {format: {size: file name}}.'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_user_profile_image_variants'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['-portfolio_value', '-id'], name='user_public_ranking_idx'),
+        ),
+    ]
@@ -1,5 +1,5 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
 
 class User(AbstractUser):
     """
@@ -24,6 +24,11 @@ class User(AbstractUser):
         blank=True,
         help_text="The user's profile picture."
     )
+    profile_image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Resized copies of the profile picture, as {format: {size: file name}}."
+    )
 
     # Web3 related fields
     wallet_address = models.CharField(
@@ -52,13 +57,91 @@ class User(AbstractUser):
         help_text="UI theme customization settings for the user's profile page."
     )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored image so save() can tell when a new one is uploaded
+        instance._loaded_profile_image = instance.__dict__.get("profile_image")
+        return instance
+
     def save(self, *args, **kwargs):
         """
         If nickname is not provided, set it to the username.
+        When a new profile image is set, its resized variants are generated
+        in a background task once the change is committed.
         """
         if not self.nickname:
             self.nickname = self.username
+
+        loaded_image = getattr(self, "_loaded_profile_image", None)
+        image_changed = "profile_image" in self.__dict__ and (self.profile_image.name or None) != (
+            str(loaded_image) if loaded_image else None
+        )
+        if image_changed:
+            self.profile_image_variants = {}
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "profile_image_variants"}
+
         super().save(*args, **kwargs)
 
+        if image_changed:
+            self._loaded_profile_image = self.profile_image.name
+            if self.profile_image:
+                from .tasks import process_profile_image
+
+                user_id, image_name = self.pk, self.profile_image.name
+                transaction.on_commit(lambda: process_profile_image.delay(user_id, image_name))
+
+    def profile_image_variant_url(self, size: int, image_format: str = "jpeg") -> str:
+        """
+        Returns the URL of a resized profile image, falling back to the original
+        image until the variants have been generated.
+        """
+        name = self.profile_image_variants.get(image_format, {}).get(str(size))
+        if name:
+            return self.profile_image.storage.url(name)
+        return self.profile_image.url if self.profile_image else ""
+
+    def _profile_image_srcset(self, image_format: str) -> str:
+        variants = self.profile_image_variants.get(image_format, {})
+        return ", ".join(
+            f"{self.profile_image.storage.url(name)} {size}w" for size, name in variants.items()
+        )
+
+    @property
+    def profile_image_webp_srcset(self) -> str:
+        return self._profile_image_srcset("webp")
+
+    @property
+    def profile_image_jpeg_srcset(self) -> str:
+        return self._profile_image_srcset("jpeg")
+
+    @property
+    def profile_image_url(self) -> str:
+        """The profile image as shown on the profile page."""
+        return self.profile_image_variant_url(150)
+
+    @property
+    def avatar_url(self) -> str:
+        """A small JPEG avatar for lists such as the ranking and the feed."""
+        return self.profile_image_variant_url(64)
+
+    @property
+    def avatar_webp_url(self) -> str:
+        """A small WebP avatar, empty until the variants have been generated."""
+        name = self.profile_image_variants.get("webp", {}).get("64")
+        return self.profile_image.storage.url(name) if name else ""
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Serves the ranking's keyset pagination; partial where the database supports it
+            models.Index(
+                fields=["-portfolio_value", "-id"],
+                name="user_public_ranking_idx",
+                condition=models.Q(is_public=True),
+            ),
+        ]
+
     def __str__(self):
         return self.username
@@ -0,0 +1,45 @@
+import secrets
+from django.conf import settings
+from django.core.cache import caches
+
+# Wallet login nonces are kept in the cache for LOGIN_NONCE_TTL seconds rather than
+# in the session, so starting a wallet login doesn't create a session, and each is
+# handed to the browser in a cookie, which binds it to that browser as the session did.
+# A nonce is consumed by deleting it: delete reports whether the key existed, and
+# only one of any number of concurrent deletes does, so a nonce is used at most once.
+NONCE_COOKIE = "login_nonce"
+
+
+def _nonce_key(nonce: str) -> str:
+    return f"login_nonce_{nonce}"
+
+
+def _cache():
+    return caches[settings.LOGIN_NONCE_CACHE_ALIAS]
+
+
+def issue_nonce() -> str:
+    """
+    Returns a new single-use nonce for a wallet to sign.
+    """
+    nonce = secrets.token_hex(16)
+    _cache().set(_nonce_key(nonce), 1, timeout=settings.LOGIN_NONCE_TTL)
+    return nonce
+
+
+def consume_nonce(nonce: str | None) -> bool:
+    """
+    Uses up a nonce. Returns whether it was issued, unexpired and not used before.
+    """
+    if not nonce:
+        return False
+    return bool(_cache().delete(_nonce_key(nonce)))
+
+
+async def aconsume_nonce(nonce: str | None) -> bool:
+    """
+    Async consume_nonce().
+    """
+    if not nonce:
+        return False
+    return bool(await _cache().adelete(_nonce_key(nonce)))
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import user_cache
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Makes the cached copy of a user stale whenever the user changes. The version is
+    bumped again on commit, as a request may have cached the row it read before the
+    change was committed.
+    """
+    user_cache.invalidate([instance.pk])
+    user_id = instance.pk
+    transaction.on_commit(lambda: user_cache.invalidate([user_id]))
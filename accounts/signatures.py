@@ -0,0 +1,85 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from django.conf import settings
+
+# Wallet signature recovery. Recovering the public key from an ECDSA signature is
+# CPU-bound (about 3.5ms with eth_keys' pure Python backend), so async logins run it
+# in a bounded pool instead of on the event loop. A process pool uses every core;
+# its workers are spawned rather than forked from the server, and only import this
+# module, which needs no configured Django.
+
+
+class RecoveryOverloaded(Exception):
+    """
+    Raised when WALLET_RECOVERY_MAX_PENDING recoveries are already running or queued.
+    """
+
+
+def recover_signer(message: str, signature) -> str:
+    """
+    Returns the address that signed a text message (EIP-191 personal_sign).
+    eth_account is imported on first use: it takes about as long to import as the
+    rest of startup, and only wallet logins need it.
+    """
+    from eth_account import Account
+    from eth_account.messages import encode_defunct
+
+    return Account.recover_message(encode_defunct(text=message), signature=signature)
+
+
+def _load_eth_account() -> None:
+    import eth_account  # noqa: F401
+
+
+_executor = None
+_pending = 0
+
+
+def get_executor():
+    """
+    Returns this process's recovery pool, creating it on first use.
+    """
+    global _executor
+    if _executor is None:
+        if settings.WALLET_RECOVERY_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(
+                settings.WALLET_RECOVERY_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_load_eth_account,
+            )
+        else:
+            _executor = ThreadPoolExecutor(settings.WALLET_RECOVERY_WORKERS, thread_name_prefix="wallet-recovery")
+    return _executor
+
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+
+@asynccontextmanager
+async def recovery_slot():
+    """
+    Reserves a place in the recovery pool's queue for one login, or raises
+    RecoveryOverloaded, so a login storm is turned away before it queues up
+    more work than the pool can finish in time.
+    """
+    global _pending
+    if _pending >= settings.WALLET_RECOVERY_MAX_PENDING:
+        raise RecoveryOverloaded(f"{_pending} signature recoveries are already pending.")
+    _pending += 1
+    try:
+        yield
+    finally:
+        _pending -= 1
+
+
+async def arecover_signer(message: str, signature) -> str:
+    """
+    recover_signer(), run in the recovery pool.
+    """
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), recover_signer, message, signature)
@@ -0,0 +1,29 @@
+import logging
+from celery import shared_task
+from PIL import Image
+from .images import generate_profile_image_variants
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def process_profile_image(user_id: int, image_name: str):
+    """
+    Generates the resized variants of a newly uploaded profile image.
+    Does nothing if the user has since replaced or removed the image.
+    """
+    user = User.objects.filter(pk=user_id).only("id", "profile_image", "profile_image_variants").first()
+    if user is None or user.profile_image.name != image_name:
+        return
+
+    try:
+        variants = generate_profile_image_variants(user.profile_image)
+    except (OSError, Image.DecompressionBombError) as e:
+        logger.warning(f"Could not process profile image {image_name} of user {user_id}: {e}")
+        return
+
+    # Only store the variants if the image wasn't replaced while they were generated
+    if User.objects.filter(pk=user_id, profile_image=image_name).exists():
+        user.profile_image_variants = variants
+        user.save(update_fields=["profile_image_variants"])
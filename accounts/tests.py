@@ -1,8 +1,23 @@
-from django.test import TestCase
-from django.contrib.auth import get_user_model
+import shutil
+import tempfile
+from io import BytesIO
+from unittest.mock import patch
+from PIL import Image
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.contrib.auth import get_user, get_user_model
+from django.core.cache import cache
+from django.http import HttpRequest
+from django.urls import reverse
+from django.contrib.sessions.models import Session
+from . import nonces, signatures, user_cache
+from .management.commands.import_times import Command as ImportTimesCommand
+from .tasks import process_profile_image
 
 User = get_user_model()
 
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
 class UserModelTest(TestCase):
     def test_create_user(self):
         """Test creating a new user."""
@@ -38,3 +53,241 @@ class UserModelTest(TestCase):
             wallet_address=wallet_address.lower()
         )
         self.assertEqual(user.wallet_address, wallet_address.lower())
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ProfileImageVariantsTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def upload(self, user):
+        exif = Image.Exif()
+        exif[0x010F] = "Secret Camera Inc."  # Make
+        image = BytesIO()
+        Image.new("RGB", (800, 600), "teal").save(image, format="JPEG", exif=exif)
+        user.profile_image = SimpleUploadedFile("me.jpg", image.getvalue(), content_type="image/jpeg")
+        user.save()
+
+    @patch('accounts.tasks.process_profile_image.delay')
+    def test_new_image_queues_processing_after_commit(self, mock_delay):
+        """Test that uploading a profile image queues variant generation once."""
+        user = User.objects.create_user(username="pictured")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.bio = "No new image"
+            user.save()
+
+        mock_delay.assert_called_once_with(user.pk, user.profile_image.name)
+
+    def test_process_profile_image_creates_stripped_variants(self):
+        """Test that square WebP and JPEG variants are stored without metadata."""
+        user = User.objects.create_user(username="pictured")
+        self.upload(user)
+
+        process_profile_image(user.pk, user.profile_image.name)
+
+        user.refresh_from_db()
+        for size in settings.PROFILE_IMAGE_SIZES:
+            for image_format in ("webp", "jpeg"):
+                name = user.profile_image_variants[image_format][str(size)]
+                with Image.open(f"{self.media_root}/{name}") as variant:
+                    self.assertEqual(variant.size, (size, size))
+                    self.assertEqual(len(variant.getexif()), 0)
+        self.assertIn(" 300w", user.profile_image_webp_srcset)
+        self.assertTrue(user.avatar_url.endswith("_64.jpeg"))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class WalletLoginTest(TestCase):
+    def test_login_with_signed_nonce(self):
+        """Test that a wallet logs in by signing the nonce from its session."""
+        from eth_account import Account
+        from eth_account.messages import encode_defunct
+
+        account = Account.create()
+        nonce = self.client.get(reverse("accounts:get_nonce")).json()["nonce"]
+        signature = account.sign_message(encode_defunct(text=nonce)).signature.hex()
+
+        response = self.client.post(
+            reverse("accounts:wallet_login"),
+            {"wallet_address": account.address, "signature": signature},
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get(wallet_address=account.address.lower())
+        self.assertEqual(int(self.client.session["_auth_user_id"]), user.pk)
+
+    def test_signature_by_another_wallet_is_rejected(self):
+        from eth_account import Account
+        from eth_account.messages import encode_defunct
+
+        nonce = self.client.get(reverse("accounts:get_nonce")).json()["nonce"]
+        signature = Account.create().sign_message(encode_defunct(text=nonce)).signature.hex()
+
+        response = self.client.post(
+            reverse("accounts:wallet_login"),
+            {"wallet_address": Account.create().address, "signature": signature},
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(User.objects.exists())
+
+    def test_nonces_are_single_use(self):
+        """Test that a signed nonce can't be replayed, even from the same browser."""
+        from eth_account import Account
+        from eth_account.messages import encode_defunct
+
+        account = Account.create()
+        nonce = self.client.get(reverse("accounts:get_nonce")).json()["nonce"]
+        data = {
+            "wallet_address": account.address,
+            "signature": account.sign_message(encode_defunct(text=nonce)).signature.hex(),
+        }
+        url = reverse("accounts:wallet_login")
+        self.assertEqual(self.client.post(url, data, content_type="application/json").status_code, 200)
+
+        self.client.logout()
+        self.client.cookies[nonces.NONCE_COOKIE] = nonce
+        response = self.client.post(url, data, content_type="application/json")
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_nonces_and_sessions_skip_the_database(self):
+        with self.assertNumQueries(0):
+            self.client.get(reverse("accounts:get_nonce"))
+
+        self.client.force_login(User.objects.create_user(username="visitor"))
+
+        self.assertFalse(Session.objects.exists())
+
+    def test_startup_does_not_import_web3(self):
+        """Test that signature recovery libraries are only loaded by wallet logins."""
+        modules = set(ImportTimesCommand().measure("web")["modules"])
+
+        self.assertIn("accounts.backends", modules)
+        self.assertFalse({"web3", "eth_account"} & modules)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class UserCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="cached", password="password")
+
+    def setUp(self):
+        # Drops counts left over from other tests
+        user_cache._counters.flush()
+        cache.clear()
+
+    def logged_in_request(self):
+        request = HttpRequest()
+        request.session = self.client.session
+        request.session.items()  # Loads the session outside the query counts
+        return request
+
+    def test_logged_in_requests_skip_the_database(self):
+        """Test that after the first lookup, authentication makes no queries."""
+        self.client.force_login(self.user)
+        request = self.logged_in_request()
+        with self.assertNumQueries(1):
+            get_user(request)
+
+        request = self.logged_in_request()
+        with self.assertNumQueries(0):
+            user = get_user(request)
+
+        self.assertEqual(user, self.user)
+        self.assertTrue(user.is_authenticated)
+
+    def test_saving_a_user_makes_the_cached_copy_stale(self):
+        user_cache.get_user(self.user.pk)
+        self.user.bio = "Updated"
+        self.user.save()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(user_cache.get_user(self.user.pk).bio, "Updated")
+
+    def test_password_login_sessions_are_cached(self):
+        self.client.login(username="cached", password="password")
+        get_user(self.logged_in_request())
+
+        request = self.logged_in_request()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user(request), self.user)
+
+    def test_stats_are_visible_to_staff_only(self):
+        url = reverse("accounts:user_cache_stats")
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        staff = User.objects.create_user(username="staff", is_staff=True)
+        self.client.force_login(staff)
+        user_cache._counters.flush()
+        cache.delete_many([user_cache.HITS_KEY, user_cache.MISSES_KEY])
+        self.client.get(url)
+        stats = self.client.get(url).json()
+
+        # The first request loaded the staff user, the second found them cached
+        self.assertEqual(stats, {"hits": 1, "misses": 1, "hit_rate": 0.5})
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    WALLET_RECOVERY_EXECUTOR="thread",
+)
+class AsyncWalletLoginTest(TestCase):
+    def setUp(self):
+        self.addCleanup(signatures.shutdown_executor)
+
+    async def signed_login(self):
+        from eth_account import Account
+        from eth_account.messages import encode_defunct
+
+        account = Account.create()
+        nonce = (await self.async_client.get(reverse("accounts:get_nonce"))).json()["nonce"]
+        signature = account.sign_message(encode_defunct(text=nonce)).signature.hex()
+        return account, {"wallet_address": account.address, "signature": signature}
+
+    async def test_login_with_signed_nonce(self):
+        account, data = await self.signed_login()
+
+        response = await self.async_client.post(
+            reverse("accounts:wallet_login_async"), data, content_type="application/json"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        user = await User.objects.aget(wallet_address=account.address.lower())
+        self.assertEqual((await self.async_client.session.aget("_auth_user_id")), str(user.pk))
+
+    async def test_saturated_pool_turns_logins_away_without_using_the_nonce(self):
+        account, data = await self.signed_login()
+        url = reverse("accounts:wallet_login_async")
+
+        with self.settings(WALLET_RECOVERY_MAX_PENDING=0):
+            response = await self.async_client.post(url, data, content_type="application/json")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+
+        response = await self.async_client.post(url, data, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(WALLET_RECOVERY_EXECUTOR="process", WALLET_RECOVERY_WORKERS=1)
+class RecoveryPoolTest(SimpleTestCase):
+    async def test_process_pool_recovers_signers(self):
+        from eth_account import Account
+        from eth_account.messages import encode_defunct
+
+        self.addCleanup(signatures.shutdown_executor)
+        account = Account.create()
+        signature = account.sign_message(encode_defunct(text="nonce")).signature.hex()
+
+        self.assertEqual(await signatures.arecover_signer("nonce", signature), account.address)
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import SignUpView, get_nonce, wallet_login
+from .views import SignUpView, get_nonce, user_cache_stats, wallet_login, wallet_login_async
 
 app_name = "accounts"
 
@@ -10,4 +10,8 @@ urlpatterns = [
     # API endpoints for wallet authentication
     path("api/get-nonce/", get_nonce, name="get_nonce"),
     path("api/wallet-login/", wallet_login, name="wallet_login"),
+    path("api/wallet-login/async/", wallet_login_async, name="wallet_login_async"),
+
+    # Monitoring
+    path("api/user-cache-stats/", user_cache_stats, name="user_cache_stats"),
 ]
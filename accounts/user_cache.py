@@ -0,0 +1,119 @@
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from .models import User
+
+# Users are cached by pk for authentication, which otherwise loads the full user row
+# on every request. Each entry records the user's version when it was loaded. Saving
+# or deleting a user bumps the version (see accounts.signals), so an entry loaded
+# before a change is never served. Versions expire no later than the entries stored
+# with them, and a missing version matches no entry.
+
+HITS_KEY = "user_cache_hits"
+MISSES_KEY = "user_cache_misses"
+# Each process adds its counts to the shared counters after this many lookups or
+# seconds, so counting doesn't cost a cache round trip per lookup
+COUNTER_FLUSH_LOOKUPS = 100
+COUNTER_FLUSH_SECONDS = 10
+
+
+def _user_key(user_id: int) -> str:
+    return f"user_{user_id}"
+
+
+def _version_key(user_id: int) -> str:
+    return f"user_version_{user_id}"
+
+
+def invalidate(user_ids) -> None:
+    """
+    Makes the cached entries of the given users stale.
+    """
+    versions = {_version_key(user_id): uuid.uuid4().hex for user_id in user_ids}
+    if len(versions) == 1:
+        # A plain SET, where set_many is a Redis transaction
+        cache.set(*versions.popitem(), timeout=settings.USER_CACHE_TIMEOUT)
+    elif versions:
+        cache.set_many(versions, timeout=settings.USER_CACHE_TIMEOUT)
+
+
+def get_user(user_id: int) -> User | None:
+    """
+    Returns the user with this pk, or None if there is none. A hit costs a single
+    cache round trip and no queries.
+    """
+    user_key, version_key = _user_key(user_id), _version_key(user_id)
+    found = cache.get_many([user_key, version_key])
+    entry, version = found.get(user_key), found.get(version_key)
+    if entry is not None and version is not None and entry["version"] == version:
+        _counters.record(hit=True)
+        return entry["user"]
+
+    _counters.record(hit=False)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(version_key, version, timeout=settings.USER_CACHE_TIMEOUT):
+            version = cache.get(version_key)
+    try:
+        user = User.objects.get(pk=user_id)
+    except User.DoesNotExist:
+        return None
+    # Stored with the version read before loading: if the user changed meanwhile,
+    # the entry is already stale
+    cache.set(user_key, {"version": version, "user": user}, timeout=settings.USER_CACHE_TIMEOUT)
+    return user
+
+
+class LookupCounters:
+    """
+    Hit and miss counts of this process, added to the shared counters in batches.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {HITS_KEY: 0, MISSES_KEY: 0}
+        self._flushed_at = time.monotonic()
+
+    def record(self, hit: bool) -> None:
+        with self._lock:
+            self._pending[HITS_KEY if hit else MISSES_KEY] += 1
+            if (
+                sum(self._pending.values()) < COUNTER_FLUSH_LOOKUPS
+                and time.monotonic() - self._flushed_at < COUNTER_FLUSH_SECONDS
+            ):
+                return
+        self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {HITS_KEY: 0, MISSES_KEY: 0}
+            self._flushed_at = time.monotonic()
+        for key, count in pending.items():
+            if not count:
+                continue
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                # Counters are kept until the cache is cleared
+                cache.add(key, 0, timeout=None)
+                cache.incr(key, count)
+
+
+_counters = LookupCounters()
+
+
+def get_stats() -> dict:
+    """
+    Returns the hits and misses of all processes since the counters were last reset.
+    Counts other processes haven't added yet are left out.
+    """
+    _counters.flush()
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = counts.get(HITS_KEY, 0), counts.get(MISSES_KEY, 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / (hits + misses) if hits + misses else None,
+    }
@@ -1,12 +1,15 @@
 import json
-import uuid
-from django.contrib.auth import authenticate, login
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth import aauthenticate, alogin, authenticate, login
 from django.http import JsonResponse, HttpResponseBadRequest
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.urls import reverse_lazy
 from django.views.generic import CreateView
+from . import nonces, user_cache
 from .forms import CustomUserCreationForm
+from .signatures import RecoveryOverloaded
 
 class SignUpView(CreateView):
     form_class = CustomUserCreationForm
@@ -16,18 +19,22 @@ class SignUpView(CreateView):
 
 def get_nonce(request):
     """
-    Generate a nonce for the user to sign, and store it in the session.
+    Generate a single-use nonce for the user to sign, and bind it to this browser
+    with a cookie.
     """
-    nonce = uuid.uuid4().hex
-    request.session["login_nonce"] = nonce
-    return JsonResponse({"nonce": nonce})
+    nonce = nonces.issue_nonce()
+    response = JsonResponse({"nonce": nonce})
+    response.set_cookie(
+        nonces.NONCE_COOKIE, nonce, max_age=settings.LOGIN_NONCE_TTL,
+        secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite="Lax",
+    )
+    return response
 
 
-@csrf_exempt
-@require_POST
-def wallet_login(request):
+def _parse_wallet_login(request):
     """
-    Authenticate a user via their wallet signature.
+    Returns the wallet address and signature posted to a wallet login, or a
+    response rejecting the request.
     """
     try:
         data = json.loads(request.body)
@@ -38,11 +45,71 @@ def wallet_login(request):
 
     if not wallet_address or not signature:
         return HttpResponseBadRequest("Missing wallet_address or signature.")
+    return wallet_address, signature
 
-    user = authenticate(request, wallet_address=wallet_address, signature=signature)
 
+def _wallet_login_response(user):
     if user:
-        login(request, user)
-        return JsonResponse({"success": True, "message": "Login successful."})
+        response = JsonResponse({"success": True, "message": "Login successful."})
     else:
-        return JsonResponse({"success": False, "message": "Authentication failed."}, status=401)
+        response = JsonResponse({"success": False, "message": "Authentication failed."}, status=401)
+    # The nonce was used up either way
+    response.delete_cookie(nonces.NONCE_COOKIE, samesite="Lax")
+    return response
+
+
+@csrf_exempt
+@require_POST
+def wallet_login(request):
+    """
+    Authenticate a user via their wallet signature.
+    """
+    parsed = _parse_wallet_login(request)
+    if isinstance(parsed, HttpResponseBadRequest):
+        return parsed
+    wallet_address, signature = parsed
+
+    user = authenticate(
+        request, wallet_address=wallet_address, signature=signature,
+        nonce=request.COOKIES.get(nonces.NONCE_COOKIE),
+    )
+
+    if user:
+        login(request, user)
+    return _wallet_login_response(user)
+
+
+@csrf_exempt
+@require_POST
+async def wallet_login_async(request):
+    """
+    wallet_login for the ASGI deployment. Signature recovery runs in a bounded
+    pool, so a login storm can't tie up the server; when the pool is saturated,
+    logins are turned away with a 503 and can be retried with the same signature.
+    """
+    parsed = _parse_wallet_login(request)
+    if isinstance(parsed, HttpResponseBadRequest):
+        return parsed
+    wallet_address, signature = parsed
+
+    try:
+        user = await aauthenticate(
+            request, wallet_address=wallet_address, signature=signature,
+            nonce=request.COOKIES.get(nonces.NONCE_COOKIE),
+        )
+    except RecoveryOverloaded:
+        response = JsonResponse({"success": False, "message": "Too many logins, try again shortly."}, status=503)
+        response["Retry-After"] = "1"
+        return response
+
+    if user:
+        await alogin(request, user)
+    return _wallet_login_response(user)
+
+
+@staff_member_required
+def user_cache_stats(request):
+    """
+    Hit and miss counts of the user cache, for monitoring.
+    """
+    return JsonResponse(user_cache.get_stats())
@@ -2,6 +2,8 @@
 ASGI config for linkus_app project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Live feed updates (server-sent events) are served by posts.streaming directly;
+everything else goes to Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +15,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "linkus_app.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up
+from posts.streaming import FEED_EVENTS_PATH, feed_events  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "http" and scope["path"] == FEED_EVENTS_PATH:
+        return await feed_events(scope, receive, send)
+    return await django_application(scope, receive, send)
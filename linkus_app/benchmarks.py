@@ -0,0 +1,121 @@
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from django.db import connection, connections
+from django.test.utils import setup_databases, teardown_databases
+
+# Helpers for the bench_* management commands. Benchmarks run against a throwaway
+# copy of the database, created and destroyed the same way the test runner does.
+
+
+@contextmanager
+def benchmark_database():
+    """
+    Creates an empty, migrated test database for the duration of a benchmark.
+    SQLite uses a temporary file instead of memory, so concurrent threads don't
+    contend on a shared-cache in-memory database. It also runs in WAL mode with
+    IMMEDIATE transactions, so readers don't block writers and concurrent writers
+    queue for the lock instead of failing with "database is locked".
+    """
+    settings_dict = connection.settings_dict
+    test_settings = settings_dict.setdefault("TEST", {})
+    if connection.vendor == "sqlite" and not test_settings.get("NAME"):
+        options = settings_dict.setdefault("OPTIONS", {})
+        original_options = dict(options)
+        with tempfile.TemporaryDirectory() as directory:
+            test_settings["NAME"] = f"{directory}/benchmark.sqlite3"
+            options.update({
+                "transaction_mode": "IMMEDIATE",
+                "timeout": 30,
+                "init_command": "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;",
+            })
+            try:
+                with _test_databases():
+                    yield
+            finally:
+                test_settings["NAME"] = None
+                options.clear()
+                options.update(original_options)
+    else:
+        with _test_databases():
+            yield
+
+
+@contextmanager
+def _test_databases():
+    old_config = setup_databases(verbosity=0, interactive=False, aliases={"default"})
+    try:
+        yield
+    finally:
+        connections.close_all()
+        teardown_databases(old_config, verbosity=0)
+
+
+def run_concurrently(func, workers: int, calls_per_worker: int) -> dict:
+    """
+    Calls `func(worker, i)` `calls_per_worker` times from each of `workers` threads
+    at once. Returns the latency of each call and the total wall-clock time.
+    """
+    latencies, errors = [], []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(workers + 1)
+
+    def worker(worker_index):
+        worker_latencies, worker_errors = [], []
+        start_barrier.wait()
+        for i in range(calls_per_worker):
+            started = time.perf_counter()
+            try:
+                func(worker_index, i)
+            except Exception as e:
+                worker_errors.append(e)
+                continue
+            worker_latencies.append(time.perf_counter() - started)
+        connections.close_all()
+        with lock:
+            latencies.extend(worker_latencies)
+            errors.extend(worker_errors)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return {"latencies": latencies, "errors": errors, "elapsed": time.perf_counter() - started}
+
+
+def summarize(result: dict) -> dict:
+    """
+    Returns throughput and latency percentiles (in milliseconds) of a run.
+    """
+    latencies = sorted(result["latencies"])
+    if not latencies:
+        return {"calls": 0, "errors": len(result["errors"]), "throughput": 0.0}
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000
+
+    return {
+        "calls": len(latencies),
+        "errors": len(result["errors"]),
+        "throughput": len(latencies) / result["elapsed"],
+        "mean": statistics.fmean(latencies) * 1000,
+        "p50": percentile(50),
+        "p95": percentile(95),
+        "p99": percentile(99),
+    }
+
+
+def format_summary(label: str, summary: dict) -> str:
+    if not summary["calls"]:
+        return f"{label:<14} no successful calls ({summary['errors']} errors)"
+    return (
+        f"{label:<14} {summary['throughput']:>9.1f}/s  "
+        f"mean {summary['mean']:>7.2f}ms  p50 {summary['p50']:>7.2f}ms  "
+        f"p95 {summary['p95']:>7.2f}ms  p99 {summary['p99']:>7.2f}ms  "
+        f"errors {summary['errors']}"
+    )
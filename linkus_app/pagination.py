@@ -0,0 +1,95 @@
+import base64
+import datetime
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+# Cursor (keyset) pagination. A page is fetched with "WHERE (ordering) is past the
+# last row of the previous page ORDER BY ordering LIMIT n", which an index on the
+# ordering serves at the same cost for every page, unlike OFFSET. Cursors are opaque
+# to clients: URL-safe base64 of a small JSON position.
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    Keeps microseconds, which DjangoJSONEncoder drops, so rows created within the
+    same millisecond aren't skipped.
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised when a cursor can't be decoded.
+    """
+
+
+def encode_cursor(position: dict) -> str:
+    data = json.dumps(position, cls=CursorEncoder, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position = json.loads(data)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+    if not isinstance(position, dict):
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+    return position
+
+
+def keyset_values(obj, ordering) -> list:
+    """
+    Returns the values of the ordering fields of a row, to be stored in a cursor.
+    """
+    return [getattr(obj, field.lstrip("-")) for field in ordering]
+
+
+def keyset_filter(queryset, ordering, values):
+    """
+    Filters a queryset to the rows after `values` in `ordering`, e.g. for
+    ("-portfolio_value", "-id"):
+
+        portfolio_value <= v AND (portfolio_value < v OR (portfolio_value = v AND id < i))
+
+    The leading bound on the first field lets the database seek into the index.
+    The last field must be unique (usually the primary key) so no rows are skipped.
+    """
+    if len(values) != len(ordering):
+        raise InvalidCursor("Cursor does not match the ordering.")
+
+    after = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        condition = Q(**{f"{name}__{lookup}": values[i]})
+        for previous_field, previous_value in zip(ordering[:i], values[:i]):
+            condition &= Q(**{previous_field.lstrip("-"): previous_value})
+        after |= condition
+
+    first = ordering[0]
+    bound = {f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": values[0]}
+    return queryset.filter(Q(**bound) & after)
+
+
+def paginate_keyset(queryset, ordering, values=None, page_size=50) -> tuple[list, list | None]:
+    """
+    Returns one page of `queryset` in `ordering`, starting after the row with the
+    ordering `values` (or from the start), and the values to continue from, or None
+    on the last page. No COUNT query is made.
+    """
+    queryset = queryset.order_by(*ordering)
+    if values is not None:
+        queryset = keyset_filter(queryset, ordering, values)
+
+    items = list(queryset[:page_size + 1])
+    if len(items) <= page_size:
+        return items, None
+    items = items[:page_size]
+    return items, keyset_values(items[-1], ordering)
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
     "accounts.apps.AccountsConfig",
     "profiles.apps.ProfilesConfig",
     "posts.apps.PostsConfig",
+    "search.apps.SearchConfig",
 ]
 
 MIDDLEWARE = [
@@ -134,6 +135,8 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 # Media files (User uploaded files)
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+# Square sizes (in pixels) generated for uploaded profile images.
+PROFILE_IMAGE_SIZES = (64, 150, 300)
 
 
 # Default primary key field type
@@ -152,8 +155,27 @@ CELERY_TIMEZONE = TIME_ZONE
 # Authentication Backends
 AUTHENTICATION_BACKENDS = [
     "accounts.backends.WalletBackend",
-    "django.contrib.auth.backends.ModelBackend", # Default backend for email/password
+    "accounts.backends.CachedModelBackend", # Default backend for email/password
 ]
+# Seconds a logged-in user's record stays cached for authentication (see accounts.user_cache)
+USER_CACHE_TIMEOUT = config("USER_CACHE_TIMEOUT", default=300, cast=int)
+
+# Sessions are stored in Redis, so logins and anonymous visits don't write session
+# rows. "django.contrib.sessions.backends.cached_db" also writes them through to the
+# database, so they survive a Redis flush.
+SESSION_ENGINE = config("SESSION_ENGINE", default="django.contrib.sessions.backends.cache")
+SESSION_CACHE_ALIAS = config("SESSION_CACHE_ALIAS", default="default")
+
+# Wallet login nonces (see accounts.nonces): seconds a nonce can be used for, and
+# the cache they are kept in
+LOGIN_NONCE_TTL = config("LOGIN_NONCE_TTL", default=300, cast=int)
+LOGIN_NONCE_CACHE_ALIAS = config("LOGIN_NONCE_CACHE_ALIAS", default="default")
+
+# Async wallet logins (see accounts.signatures) recover signatures in a pool of
+# "process" or "thread" workers, and turn logins away once this many are pending
+WALLET_RECOVERY_EXECUTOR = config("WALLET_RECOVERY_EXECUTOR", default="process")
+WALLET_RECOVERY_WORKERS = config("WALLET_RECOVERY_WORKERS", default=os.cpu_count() or 1, cast=int)
+WALLET_RECOVERY_MAX_PENDING = config("WALLET_RECOVERY_MAX_PENDING", default=256, cast=int)
 
 # Celery Beat Settings
 CELERY_BEAT_SCHEDULE = {
@@ -161,8 +183,57 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'profiles.tasks.update_all_user_portfolios',
         'schedule': 3600.0,  # Run every hour (in seconds)
     },
+    'rebuild-leaderboard-every-day': {
+        'task': 'profiles.tasks.rebuild_leaderboard',
+        'schedule': 60 * 60 * 24,
+    },
+    'flush-post-likes': {
+        'task': 'posts.tasks.flush_post_likes',
+        'schedule': config("POST_LIKES_FLUSH_INTERVAL", default=5.0, cast=float),
+    },
+    'decay-hot-scores-every-10-minutes': {
+        'task': 'posts.tasks.decay_hot_scores',
+        'schedule': 60 * 10,
+    },
+    'compact-portfolio-history-every-day': {
+        'task': 'profiles.tasks.compact_portfolio_history',
+        'schedule': 60 * 60 * 24,
+    },
 }
 
+# Number of users handled by each portfolio refresh subtask. Bounds worker memory
+# and lets the hourly refresh spread across all Celery workers.
+PORTFOLIO_SHARD_SIZE = config("PORTFOLIO_SHARD_SIZE", default=500, cast=int)
+
+# Portfolio history (see profiles.history): days hourly, daily and weekly snapshots
+# are kept for. Bounds the history to about 800 rows per user.
+PORTFOLIO_HISTORY_HOURLY_DAYS = config("PORTFOLIO_HISTORY_HOURLY_DAYS", default=7, cast=int)
+PORTFOLIO_HISTORY_DAILY_DAYS = config("PORTFOLIO_HISTORY_DAILY_DAYS", default=365, cast=int)
+PORTFOLIO_HISTORY_WEEKLY_DAYS = config("PORTFOLIO_HISTORY_WEEKLY_DAYS", default=365 * 5, cast=int)
+
+# Likes are recorded in Redis and written to the database in batches of this many posts
+POST_LIKES_FLUSH_BATCH_SIZE = config("POST_LIKES_FLUSH_BATCH_SIZE", default=500, cast=int)
+# How long (seconds) a post's likes stay loaded in Redis after its last like
+POST_LIKE_STATE_TTL = config("POST_LIKE_STATE_TTL", default=60 * 60 * 24 * 7, cast=int)
+
+# Hot feed: how fast a post's score decays with age, and how long (hours) posts are kept
+# scored before they drop to 0
+POST_HOT_GRAVITY = config("POST_HOT_GRAVITY", default=1.8, cast=float)
+POST_HOT_WINDOW_HOURS = config("POST_HOT_WINDOW_HOURS", default=24 * 7, cast=int)
+# Decay only rewrites a score that moved by more than this fraction since it was last
+# written, which bounds how far the hot feed's order can lag
+POST_HOT_DECAY_THRESHOLD = config("POST_HOT_DECAY_THRESHOLD", default=0.05, cast=float)
+
+# Search ranks at most this many of the newest matches of a query, which bounds the
+# cost of very common terms
+SEARCH_RANK_WINDOW = config("SEARCH_RANK_WINDOW", default=10_000, cast=int)
+
+# Live feed (server-sent events, see posts.streaming): seconds between updates, which
+# bounds how often a post's like count is pushed, and between heartbeats on idle
+# connections
+FEED_EVENTS_INTERVAL = config("FEED_EVENTS_INTERVAL", default=1.0, cast=float)
+FEED_EVENTS_HEARTBEAT = config("FEED_EVENTS_HEARTBEAT", default=15.0, cast=float)
+
 # Cache Configuration (using Redis)
 CACHES = {
     "default": {
@@ -174,5 +245,66 @@ CACHES = {
     }
 }
 
+# Redis database emptied and used by the tests that run against a real server (see
+# linkus_app.testing.real_redis); they are skipped when it isn't reachable
+REDIS_TEST_URL = config("REDIS_TEST_URL", default="redis://localhost:6379/15")
+
 # External API Keys
 ALCHEMY_API_KEY = config("ALCHEMY_API_KEY")
+
+# External API settings
+# Base URLs can be pointed at a local stand-in server for tests and benchmarks.
+ALCHEMY_BASE_URL = config("ALCHEMY_BASE_URL", default="https://eth-mainnet.g.alchemy.com")
+COINGECKO_API_URL = config("COINGECKO_API_URL", default="https://api.coingecko.com/api/v3")
+# Maximum number of Alchemy requests in flight at once during bulk refreshes.
+# This is also the per-host connection pool size of the shared HTTP client.
+ALCHEMY_MAX_CONCURRENCY = config("ALCHEMY_MAX_CONCURRENCY", default=16, cast=int)
+# Number of wallets packed into a single Alchemy JSON-RPC batch request.
+ALCHEMY_BATCH_SIZE = config("ALCHEMY_BATCH_SIZE", default=50, cast=int)
+# (connect, read) timeouts in seconds for every external API request.
+EXTERNAL_API_TIMEOUT = (
+    config("EXTERNAL_API_CONNECT_TIMEOUT", default=3.05, cast=float),
+    config("EXTERNAL_API_READ_TIMEOUT", default=10.0, cast=float),
+)
+# How many times a request is retried on connection errors, 429 or 5xx responses.
+EXTERNAL_API_MAX_RETRIES = config("EXTERNAL_API_MAX_RETRIES", default=2, cast=int)
+
+# Token balance caching (stale-while-revalidate), in seconds.
+# Younger than the soft TTL: served from cache. Between soft and hard TTL: served
+# from cache while a background refresh runs. Entries are kept up to the
+# stale-if-error TTL so the last good balances can be served if Alchemy fails.
+TOKEN_BALANCES_SOFT_TTL = config("TOKEN_BALANCES_SOFT_TTL", default=60 * 5, cast=int)
+TOKEN_BALANCES_HARD_TTL = config("TOKEN_BALANCES_HARD_TTL", default=60 * 60, cast=int)
+TOKEN_BALANCES_STALE_IF_ERROR = config("TOKEN_BALANCES_STALE_IF_ERROR", default=60 * 60 * 24, cast=int)
+
+# Seconds the profile page waits for token balances and NFTs before rendering without them.
+PROFILE_BALANCES_TIMEOUT = config("PROFILE_BALANCES_TIMEOUT", default=3.0, cast=float)
+PROFILE_NFTS_TIMEOUT = config("PROFILE_NFTS_TIMEOUT", default=3.0, cast=float)
+# Threads running the profile page's upstream calls, kept apart from the default
+# executor so slow upstreams can't starve other sync_to_async calls
+PROFILE_UPSTREAM_WORKERS = config("PROFILE_UPSTREAM_WORKERS", default=ALCHEMY_MAX_CONCURRENCY, cast=int)
+
+# Seconds a rendered profile page stays cached. Pages are also invalidated
+# as soon as the user, their links/addresses or their balances/NFTs change.
+PROFILE_PAGE_CACHE_TIMEOUT = config("PROFILE_PAGE_CACHE_TIMEOUT", default=60 * 5, cast=int)
+
+# Number of NFTs fetched (and shown) per gallery page. Alchemy allows up to 100.
+NFT_PAGE_SIZE = config("NFT_PAGE_SIZE", default=24, cast=int)
+
+# NFT thumbnails, generated once per image and stored under MEDIA_ROOT.
+NFT_THUMBNAIL_SIZES = (128, 256, 512)
+# The size used as the gallery's default image source.
+NFT_GALLERY_THUMBNAIL_SIZE = 256
+# Images larger than this are not downloaded.
+NFT_MEDIA_MAX_BYTES = config("NFT_MEDIA_MAX_BYTES", default=20 * 1024 * 1024, cast=int)
+# Seconds a whole image download may take, and redirects followed to reach it.
+NFT_MEDIA_TIMEOUT = config("NFT_MEDIA_TIMEOUT", default=10.0, cast=float)
+NFT_MEDIA_MAX_REDIRECTS = config("NFT_MEDIA_MAX_REDIRECTS", default=3, cast=int)
+# Failed downloads are retried after NFT_MEDIA_RETRY_DELAY seconds, doubling after
+# each failure, until an image has failed NFT_MEDIA_MAX_ATTEMPTS times.
+NFT_MEDIA_RETRY_DELAY = config("NFT_MEDIA_RETRY_DELAY", default=60 * 60, cast=int)
+NFT_MEDIA_MAX_ATTEMPTS = config("NFT_MEDIA_MAX_ATTEMPTS", default=5, cast=int)
+# Images still pending after this many seconds are assumed lost (e.g. the worker
+# crashed) and queued again
+NFT_MEDIA_PENDING_TIMEOUT = config("NFT_MEDIA_PENDING_TIMEOUT", default=60 * 15, cast=int)
+IPFS_GATEWAY_URL = config("IPFS_GATEWAY_URL", default="https://ipfs.io/ipfs/")
@@ -0,0 +1,137 @@
+import json
+import redis as redis_client
+from unittest import SkipTest
+from django.conf import settings
+
+# Test helpers for code that talks to Redis directly (posts.likes, posts.events and
+# profiles.leaderboard). Most tests run against FakeRedis; the same tests can be run
+# against a real server, and the real Lua scripts, with real_redis.
+
+
+class FakeRedis:
+    """
+    An in-memory stand-in for the Redis commands the apps use. Strings, sets, hashes
+    and sorted sets are all kept in `data`. Scripts are emulated by the functions in
+    `scripts`, keyed by the script's source and called with this client, the keys
+    and the arguments as strings, so each runs atomically as in Redis.
+    """
+
+    def __init__(self, scripts=None):
+        self.data = {}
+        self.published = []
+        self.scripts = dict(scripts or {})
+
+    def register_script(self, script):
+        def call(keys=(), args=(), client=None):
+            run = self.scripts[script]
+            keys, args = list(keys), [str(arg) for arg in args]
+            if client is not None:
+                return client.commands.append((run, (self, keys, args), {}))
+            return run(self, keys, args)
+        return call
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def get(self, key):
+        value = self.data.get(key)
+        return None if value is None else str(value).encode()
+
+    def set(self, key, value):
+        self.data[key] = value
+
+    def exists(self, *keys):
+        return sum(key in self.data for key in keys)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def expire(self, key, seconds):
+        pass
+
+    def flushdb(self):
+        self.data.clear()
+
+    def publish(self, channel, message):
+        self.published.append((channel, json.loads(message)))
+
+    def sismember(self, key, member):
+        return str(member) in self.data.get(key, set())
+
+    def sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(str(m) for m in members)
+
+    def spop(self, key, count):
+        # Lowest ids first, to be deterministic
+        members = self.data.get(key, set())
+        popped = sorted(members, key=int)[:count]
+        members.difference_update(popped)
+        return [member.encode() for member in popped]
+
+    def hset(self, key, field, value):
+        self.data.setdefault(key, {})[str(field)] = str(value)
+
+    def hsetnx(self, key, field, value):
+        self.data.setdefault(key, {}).setdefault(str(field), str(value))
+
+    def zadd(self, key, mapping, xx=False):
+        zset = self.data.setdefault(key, {})
+        for member, score in mapping.items():
+            if not xx or member in zset:
+                zset[member] = float(score)
+
+    def zrem(self, key, *members):
+        for member in members:
+            self.data.get(key, {}).pop(member, None)
+
+    def zscore(self, key, member):
+        return self.data.get(key, {}).get(member)
+
+    def zcard(self, key):
+        return len(self.data.get(key, {}))
+
+    def _ordered(self, key):
+        return sorted(self.data.get(key, {}).items(), key=lambda item: (item[1], item[0]), reverse=True)
+
+    def zrevrange(self, key, start, end):
+        return [member.encode() for member, _ in self._ordered(key)[start:end + 1]]
+
+    def zrevrank(self, key, member):
+        members = [m for m, _ in self._ordered(key)]
+        return members.index(member) if member in members else None
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((getattr(self.redis, name), args, kwargs))
+
+    def execute(self):
+        return [command(*args, **kwargs) for command, args, kwargs in self.commands]
+
+
+def real_redis(test_case):
+    """
+    Returns a client for the empty Redis database at REDIS_TEST_URL, which is
+    emptied again after the test. Skips the test if no Redis server is running.
+    """
+    client = redis_client.Redis.from_url(settings.REDIS_TEST_URL)
+    try:
+        client.ping()
+    except redis_client.exceptions.ConnectionError:
+        client.close()
+        raise SkipTest(f"No Redis server at {settings.REDIS_TEST_URL}")
+    client.flushdb()
+    test_case.addCleanup(client.close)
+    test_case.addCleanup(client.flushdb)
+    return client
@@ -24,4 +24,5 @@ urlpatterns = [
     path("accounts/", include("accounts.urls")),
     path("accounts/", include("django.contrib.auth.urls")), # For login, logout, password management
     path("profile/", include("profiles.urls", namespace="profiles")),
+    path("search/", include("search.urls", namespace="search")),
 ]
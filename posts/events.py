@@ -0,0 +1,58 @@
+import json
+import logging
+from django.conf import settings
+from django.urls import reverse
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# Live feed updates are published on one Redis pub/sub channel and pushed to browsers
+# by posts.streaming. Messages are JSON:
+#   {"type": "post", "post": {...}}             - a new post
+#   {"type": "likes", "counts": {"<id>": n}}    - current like counts of posts
+# Like counts are published at most once per FEED_EVENTS_INTERVAL per post by the
+# toggle itself (see posts.likes.TOGGLE_SCRIPT), and the final counts of a burst
+# when flush_post_likes writes them, so a viral post can't flood the channel.
+FEED_EVENTS_CHANNEL = "feed_events"
+
+
+def _publish(message: dict) -> None:
+    """
+    Publishes a message to the live feed. Best effort: live updates are never worth
+    failing the request that caused them.
+    """
+    try:
+        get_redis_connection("default").publish(FEED_EVENTS_CHANNEL, json.dumps(message, separators=(",", ":")))
+    except NotImplementedError:
+        # The default cache backend isn't Redis (e.g. in tests)
+        pass
+    except RedisError as e:
+        logger.warning(f"Could not publish feed event {message.get('type')}: {e}")
+
+
+def post_message(post) -> dict:
+    return {
+        "type": "post",
+        "post": {
+            "id": post.id,
+            "author": post.author.username,
+            "author_url": reverse("profiles:detail", kwargs={"username": post.author.username}),
+            "content": post.content,
+            "created_at": post.created_at.isoformat(),
+            "likes_count": post.likes_count,
+        },
+    }
+
+
+def publish_post(post) -> None:
+    _publish(post_message(post))
+
+
+def publish_like_counts(counts: dict) -> None:
+    if counts:
+        _publish({"type": "likes", "counts": {str(post_id): count for post_id, count in counts.items()}})
+
+
+def throttle_milliseconds() -> int:
+    return max(1, int(settings.FEED_EVENTS_INTERVAL * 1000))
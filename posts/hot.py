@@ -0,0 +1,53 @@
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from .models import Post
+
+# The "hot" feed is ordered by a precomputed score, (likes + 1) / (age in hours + 2) ^ gravity,
+# stored in Post.hot_score and indexed. Like toggles scale a post's score by the change in
+# (likes + 1), which keeps it exact relative to its last decay. decay_hot_scores recomputes
+# the scores of recent posts as they age, writing only those that moved by more than
+# POST_HOT_DECAY_THRESHOLD, and zeroes posts past the window.
+
+
+def hot_score(likes_count: int, created_at, now=None) -> float:
+    """
+    Returns the hot score of a post, or 0 once it is older than POST_HOT_WINDOW_HOURS.
+    """
+    now = now or timezone.now()
+    age_hours = max((now - created_at).total_seconds() / 3600, 0)
+    if age_hours > settings.POST_HOT_WINDOW_HOURS:
+        return 0.0
+    return (likes_count + 1) / (age_hours + 2) ** settings.POST_HOT_GRAVITY
+
+
+def decay_hot_scores(batch_size: int = 1000) -> int:
+    """
+    Recomputes the hot scores of posts within POST_HOT_WINDOW_HOURS in batches, and
+    zeroes the scores of older posts. A score is only written if it moved by more
+    than POST_HOT_DECAY_THRESHOLD of its new value, so older posts, whose scores
+    barely change between runs, are rewritten rarely. Returns the number of posts
+    updated.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(hours=settings.POST_HOT_WINDOW_HOURS)
+    Post.objects.filter(created_at__lt=cutoff, hot_score__gt=0).update(hot_score=0)
+
+    recent = (
+        Post.objects.filter(created_at__gte=cutoff).order_by("id")
+        .only("id", "likes_count", "created_at", "hot_score")
+    )
+    threshold = settings.POST_HOT_DECAY_THRESHOLD
+    updated, last_id = 0, 0
+    while batch := list(recent.filter(id__gt=last_id)[:batch_size]):
+        changed = []
+        for post in batch:
+            score = hot_score(post.likes_count, post.created_at, now)
+            if abs(score - post.hot_score) > threshold * score:
+                post.hot_score = score
+                changed.append(post)
+        if changed:
+            Post.objects.bulk_update(changed, ["hot_score"])
+        updated += len(changed)
+        last_id = batch[-1].id
+    return updated
@@ -0,0 +1,444 @@
+import logging
+import threading
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count, F, FloatField, Q
+from django.db.models.functions import Cast
+from django.utils import timezone
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+from .events import FEED_EVENTS_CHANNEL, publish_like_counts, throttle_milliseconds
+from .hot import hot_score
+from .models import Post, PostLike
+
+logger = logging.getLogger(__name__)
+
+# Likes are toggled in Redis and written to the database in batches by the
+# flush_post_likes task, so a popular post never serializes its likers on a row lock.
+# Per post, Redis holds:
+#   post_likes:<id>:users   - the set of user ids who like the post
+#   post_likes:<id>:count   - the number of likes (its presence marks the post as loaded)
+#   post_likes:<id>:pending - user id -> 1 (like) / 0 (unlike) not yet written to the database
+#   post_likes:<id>:published - set while the count was published to the live feed recently
+# and POST_LIKES_DIRTY_KEY holds the ids of posts with pending changes.
+POST_LIKES_DIRTY_KEY = "post_likes:dirty"
+
+# KEYS: users, count, pending, dirty, published. ARGV: user id, post id, ttl, feed
+# channel, publish interval (ms).
+# Returns {liked, count}, or -1 if the post's likes haven't been loaded yet.
+# Publishes the new count to the live feed unless it was published within the interval.
+TOGGLE_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    return -1
+end
+local liked, count
+if redis.call('SISMEMBER', KEYS[1], ARGV[1]) == 1 then
+    redis.call('SREM', KEYS[1], ARGV[1])
+    liked, count = 0, redis.call('DECR', KEYS[2])
+else
+    redis.call('SADD', KEYS[1], ARGV[1])
+    liked, count = 1, redis.call('INCR', KEYS[2])
+end
+redis.call('HSET', KEYS[3], ARGV[1], liked)
+redis.call('SADD', KEYS[4], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+if redis.call('SET', KEYS[5], 1, 'PX', ARGV[5], 'NX') then
+    redis.call('PUBLISH', ARGV[4], '{"type":"likes","counts":{"' .. ARGV[2] .. '":' .. count .. '}}')
+end
+return {liked, count}
+"""
+
+# KEYS: users, count, pending. ARGV: ttl, user ids...
+# Loads a post's likes from the database, unless another request already has.
+# Toggles not yet written to the database are applied on top.
+LOAD_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+for i = 2, #ARGV, 5000 do
+    redis.call('SADD', KEYS[1], unpack(ARGV, i, math.min(i + 4999, #ARGV)))
+end
+local pending = redis.call('HGETALL', KEYS[3])
+for i = 1, #pending, 2 do
+    if pending[i + 1] == '1' then
+        redis.call('SADD', KEYS[1], pending[i])
+    else
+        redis.call('SREM', KEYS[1], pending[i])
+    end
+end
+redis.call('SET', KEYS[2], redis.call('SCARD', KEYS[1]), 'EX', ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# KEYS: count, pending. ARGV: count in the database, ttl.
+# Sets a post's count to the one just recounted from the database, unless toggles made
+# since its changes were taken are pending (the next flush syncs it then). A count that
+# isn't loaded is left for the next toggle to load with the likes.
+SYNC_COUNT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 or redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return 1
+"""
+
+# KEYS: pending. Returns the pending changes as a flat list and clears them.
+TAKE_PENDING_SCRIPT = """
+local changes = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+return changes
+"""
+
+
+class LikeStoreUnavailable(Exception):
+    """
+    Raised when likes can't be recorded in Redis, e.g. because it is down.
+    """
+
+
+class LikeStoreNotConfigured(LikeStoreUnavailable):
+    """
+    Raised when the default cache backend isn't Redis (e.g. in tests).
+    """
+
+
+def _users_key(post_id: int) -> str:
+    return f"post_likes:{post_id}:users"
+
+
+def _count_key(post_id: int) -> str:
+    return f"post_likes:{post_id}:count"
+
+
+def _pending_key(post_id: int) -> str:
+    return f"post_likes:{post_id}:pending"
+
+
+def _published_key(post_id: int) -> str:
+    return f"post_likes:{post_id}:published"
+
+
+def _get_redis():
+    """
+    Returns the Redis client behind the default cache.
+    """
+    try:
+        return get_redis_connection("default")
+    except NotImplementedError:
+        raise LikeStoreNotConfigured("The default cache backend is not Redis.")
+
+
+def _load_likes(redis, post_id: int) -> None:
+    """
+    Copies a post's likes from the database into Redis.
+    Raises Post.DoesNotExist if there is no such post.
+    """
+    if not Post.objects.filter(id=post_id).exists():
+        raise Post.DoesNotExist(f"Post {post_id} does not exist.")
+    user_ids = PostLike.objects.filter(post_id=post_id).values_list("user_id", flat=True)
+    redis.register_script(LOAD_SCRIPT)(
+        keys=[_users_key(post_id), _count_key(post_id), _pending_key(post_id)],
+        args=[settings.POST_LIKE_STATE_TTL, *user_ids],
+    )
+
+
+# Posts toggled in the database while Redis was unavailable. The Redis state this
+# process may have left for them is stale, so it is dropped on the next call that
+# reaches Redis, and reloaded from the database on next use.
+_stale_posts = set()
+_stale_posts_lock = threading.Lock()
+
+
+def mark_stale(post_id: int) -> None:
+    """
+    Records that a post's likes changed in the database behind Redis's back.
+    """
+    with _stale_posts_lock:
+        _stale_posts.add(post_id)
+
+
+def _drop_stale_state(redis) -> None:
+    with _stale_posts_lock:
+        post_ids = list(_stale_posts)
+        _stale_posts.clear()
+    if not post_ids:
+        return
+    try:
+        redis.delete(*[key for post_id in post_ids for key in (_users_key(post_id), _count_key(post_id))])
+    except RedisError:
+        with _stale_posts_lock:
+            _stale_posts.update(post_ids)
+        raise
+
+
+def toggle_like(post_id: int, user_id: int) -> tuple[bool, int]:
+    """
+    Likes or unlikes a post for a user in a single atomic Redis call.
+    Returns whether the post is now liked and its like count.
+    Raises Post.DoesNotExist for unknown posts.
+    """
+    redis = _get_redis()
+    toggle = redis.register_script(TOGGLE_SCRIPT)
+    keys = [
+        _users_key(post_id), _count_key(post_id), _pending_key(post_id), POST_LIKES_DIRTY_KEY,
+        _published_key(post_id),
+    ]
+    args = [user_id, post_id, settings.POST_LIKE_STATE_TTL, FEED_EVENTS_CHANNEL, throttle_milliseconds()]
+    try:
+        _drop_stale_state(redis)
+        result = toggle(keys=keys, args=args)
+        if result == -1:
+            # First like of this post since its state expired
+            _load_likes(redis, post_id)
+            result = toggle(keys=keys, args=args)
+    except RedisError as e:
+        raise LikeStoreUnavailable(e) from e
+
+    liked, likes_count = result
+    return bool(liked), int(likes_count)
+
+
+def get_like_state(post_ids: list, user_id: int | None = None) -> tuple[dict, dict]:
+    """
+    Returns the live like counts of the given posts and, for a user, whether they
+    like each post, in one round trip. Posts whose likes aren't loaded in Redis are
+    left out; their database values are current.
+    """
+    if not post_ids:
+        return {}, {}
+    try:
+        redis = _get_redis()
+        _drop_stale_state(redis)
+        with redis.pipeline(transaction=False) as pipe:
+            for post_id in post_ids:
+                pipe.get(_count_key(post_id))
+                if user_id is not None:
+                    pipe.sismember(_users_key(post_id), user_id)
+            results = pipe.execute()
+    except RedisError as e:
+        raise LikeStoreUnavailable(e) from e
+
+    step = 1 if user_id is None else 2
+    counts, liked = {}, {}
+    for post_id, i in zip(post_ids, range(0, len(results), step)):
+        if results[i] is None:
+            continue
+        counts[post_id] = int(results[i])
+        if user_id is not None:
+            liked[post_id] = bool(results[i + 1])
+    return counts, liked
+
+
+def _write_changes(changes: dict) -> dict:
+    """
+    Writes pending likes to the database in one transaction, and sets the posts'
+    like counts from their PostLike rows rather than from Redis, which may have
+    missed toggles made in the database while it was unavailable.
+    `changes` maps post id -> {user id: liked}. Returns the new counts by post id.
+    """
+    created_at = dict(Post.objects.filter(id__in=changes).values_list("id", "created_at"))
+    post_ids = set(created_at)
+    user_ids = {user_id for post_id in post_ids for user_id in changes[post_id]}
+    user_ids = set(get_user_model().objects.filter(id__in=user_ids).values_list("id", flat=True))
+
+    new_likes, removed_likes = [], Q()
+    for post_id in post_ids:
+        liked_by, unliked_by = [], []
+        for user_id, liked in changes[post_id].items():
+            (liked_by if liked else unliked_by).append(user_id)
+        new_likes.extend(PostLike(post_id=post_id, user_id=user_id) for user_id in liked_by if user_id in user_ids)
+        if unliked_by:
+            removed_likes |= Q(post_id=post_id, user_id__in=unliked_by)
+
+    now = timezone.now()
+    with transaction.atomic():
+        PostLike.objects.bulk_create(new_likes, ignore_conflicts=True)
+        if removed_likes:
+            PostLike.objects.filter(removed_likes).delete()
+        counts = dict.fromkeys(post_ids, 0)
+        counts.update(
+            PostLike.objects.filter(post_id__in=post_ids)
+            .values("post_id").annotate(total=Count("id")).values_list("post_id", "total")
+        )
+        Post.objects.bulk_update(
+            [
+                Post(id=post_id, likes_count=count, hot_score=hot_score(count, created_at[post_id], now))
+                for post_id, count in counts.items()
+            ],
+            ["likes_count", "hot_score"],
+            batch_size=500,
+        )
+    return counts
+
+
+def flush_pending_likes(max_posts: int | None = None) -> int:
+    """
+    Writes up to `max_posts` posts' pending likes to the database, sets their Redis
+    counts from the database and publishes them to the live feed, which delivers the
+    last count of a burst the toggles didn't publish. Returns the number of posts
+    taken from the dirty set, some of which may have had nothing left to write.
+    If the write fails, the changes are put back (without overwriting newer ones)
+    to be retried on the next flush.
+    """
+    redis = _get_redis()
+    take_pending = redis.register_script(TAKE_PENDING_SCRIPT)
+    max_posts = max_posts or settings.POST_LIKES_FLUSH_BATCH_SIZE
+    try:
+        post_ids = [int(post_id) for post_id in redis.spop(POST_LIKES_DIRTY_KEY, max_posts) or []]
+        if not post_ids:
+            return 0
+        with redis.pipeline(transaction=False) as pipe:
+            for post_id in post_ids:
+                take_pending(keys=[_pending_key(post_id)], client=pipe)
+            results = pipe.execute()
+    except RedisError as e:
+        raise LikeStoreUnavailable(e) from e
+
+    changes = {}
+    for post_id, flat_changes in zip(post_ids, results):
+        users = {int(user_id): int(liked) == 1 for user_id, liked in zip(flat_changes[::2], flat_changes[1::2])}
+        if users:
+            changes[post_id] = users
+
+    try:
+        counts = _write_changes(changes)
+    except Exception:
+        _restore_changes(redis, changes)
+        raise
+    _sync_counts(redis, counts)
+    publish_like_counts(counts)
+    return len(post_ids)
+
+
+def _sync_counts(redis, counts: dict) -> None:
+    """
+    Corrects the Redis counts of posts from their counts in the database, so a count
+    that drifted isn't served until it expires.
+    """
+    sync_count = redis.register_script(SYNC_COUNT_SCRIPT)
+    try:
+        with redis.pipeline(transaction=False) as pipe:
+            for post_id, count in counts.items():
+                sync_count(
+                    keys=[_count_key(post_id), _pending_key(post_id)],
+                    args=[count, settings.POST_LIKE_STATE_TTL],
+                    client=pipe,
+                )
+            pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Could not sync the like counts of {len(counts)} posts: {e}")
+
+
+def _restore_changes(redis, changes: dict) -> None:
+    with redis.pipeline(transaction=False) as pipe:
+        for post_id, users in changes.items():
+            for user_id, liked in users.items():
+                pipe.hsetnx(_pending_key(post_id), user_id, int(liked))
+            pipe.sadd(POST_LIKES_DIRTY_KEY, post_id)
+        pipe.execute()
+
+
+# Database toggles, used when Redis is unavailable. Each one inserts or deletes the
+# like and reads back the new count with UPDATE ... RETURNING, instead of loading
+# the post, locking in get_or_create and refreshing the post afterwards. The same
+# UPDATE scales the hot score by the change in (likes + 1) (see posts.hot).
+
+def _toggle_like_postgresql(post_id: int, user_id: int) -> tuple[bool, int]:
+    """
+    Toggles a like in a single statement. The like exists afterwards unless it was
+    deleted: if a concurrent toggle inserted it first, ON CONFLICT skips the insert
+    and leaves the count unchanged, and the post is still liked.
+    """
+    likes_table = connection.ops.quote_name(PostLike._meta.db_table)
+    posts_table = connection.ops.quote_name(Post._meta.db_table)
+    sql = f"""
+        WITH deleted AS (
+            DELETE FROM {likes_table} WHERE post_id = %s AND user_id = %s RETURNING 1
+        ), inserted AS (
+            INSERT INTO {likes_table} (post_id, user_id, created_at)
+            SELECT %s, %s, %s WHERE NOT EXISTS (SELECT 1 FROM deleted)
+            ON CONFLICT DO NOTHING
+            RETURNING 1
+        )
+        UPDATE {posts_table}
+        SET likes_count = likes_count + change.delta,
+            hot_score = hot_score * (likes_count + change.delta + 1.0) / (likes_count + 1.0)
+        FROM (SELECT (SELECT count(*) FROM inserted) - (SELECT count(*) FROM deleted) AS delta) AS change
+        WHERE id = %s
+        RETURNING likes_count, NOT EXISTS (SELECT 1 FROM deleted)
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql, [post_id, user_id, post_id, user_id, timezone.now(), post_id])
+        row = cursor.fetchone()
+        if row is None:
+            # Roll back the like of the missing post
+            raise Post.DoesNotExist(f"Post {post_id} does not exist.")
+    likes_count, liked = row
+    return liked, likes_count
+
+
+def _toggle_like_sqlite(post_id: int, user_id: int) -> tuple[bool, int]:
+    """
+    Toggles a like with an insert (or, if the like exists, a delete) and one
+    UPDATE ... RETURNING. SQLite has no data-modifying CTEs, but runs in-process,
+    so the extra statement isn't an extra round trip.
+    """
+    likes_table = connection.ops.quote_name(PostLike._meta.db_table)
+    posts_table = connection.ops.quote_name(Post._meta.db_table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {likes_table} (post_id, user_id, created_at) VALUES (%s, %s, %s) "
+            f"ON CONFLICT DO NOTHING RETURNING id",
+            [post_id, user_id, timezone.now()],
+        )
+        liked = cursor.fetchone() is not None
+        if not liked:
+            cursor.execute(f"DELETE FROM {likes_table} WHERE post_id = %s AND user_id = %s", [post_id, user_id])
+        delta = 1 if liked else -1
+        cursor.execute(
+            f"UPDATE {posts_table} SET likes_count = likes_count + %s, "
+            f"hot_score = hot_score * (likes_count + %s + 1.0) / (likes_count + 1.0) "
+            f"WHERE id = %s RETURNING likes_count",
+            [delta, delta, post_id],
+        )
+        row = cursor.fetchone()
+        if row is None:
+            raise Post.DoesNotExist(f"Post {post_id} does not exist.")
+    return liked, row[0]
+
+
+def _toggle_like_orm(post_id: int, user_id: int) -> tuple[bool, int]:
+    """
+    Toggles a like through the ORM, for databases without RETURNING support.
+    """
+    with transaction.atomic():
+        post = Post.objects.select_for_update().only("id").get(id=post_id)
+        deleted, _ = PostLike.objects.filter(post=post, user_id=user_id).delete()
+        liked = not deleted
+        if liked:
+            PostLike.objects.create(post=post, user_id=user_id)
+        delta = 1 if liked else -1
+        likes_plus_one = Cast("likes_count", FloatField()) + 1.0
+        Post.objects.filter(id=post_id).update(
+            likes_count=F("likes_count") + delta,
+            hot_score=F("hot_score") * (likes_plus_one + delta) / likes_plus_one,
+        )
+        likes_count = Post.objects.values_list("likes_count", flat=True).get(id=post_id)
+    return liked, likes_count
+
+
+def toggle_like_in_db(post_id: int, user_id: int) -> tuple[bool, int]:
+    """
+    Likes or unlikes a post directly in the database.
+    Returns whether the post is now liked and its like count.
+    Raises Post.DoesNotExist for unknown posts.
+    """
+    if connection.vendor == "postgresql":
+        return _toggle_like_postgresql(post_id, user_id)
+    if connection.vendor == "sqlite" and connection.features.can_return_columns_from_insert:
+        return _toggle_like_sqlite(post_id, user_id)
+    return _toggle_like_orm(post_id, user_id)
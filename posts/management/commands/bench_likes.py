@@ -0,0 +1,73 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F
+from django.shortcuts import get_object_or_404
+from django.test.utils import CaptureQueriesContext
+from linkus_app.benchmarks import benchmark_database, format_summary, run_concurrently, summarize
+from posts import likes
+from posts.models import Post, PostLike
+
+
+def legacy_toggle_like(post_id: int, user_id: int) -> tuple[bool, int]:
+    """
+    The database toggle like_post used before toggle_like_in_db, as a baseline.
+    """
+    post = get_object_or_404(Post, id=post_id)
+    with transaction.atomic():
+        like, created = PostLike.objects.get_or_create(user_id=user_id, post=post)
+        if created:
+            Post.objects.filter(id=post_id).update(likes_count=F('likes_count') + 1)
+        else:
+            like.delete()
+            Post.objects.filter(id=post_id).update(likes_count=F('likes_count') - 1)
+    post.refresh_from_db()
+    return created, post.likes_count
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks database like toggles on a throwaway database: concurrent users "
+        "repeatedly liking and unliking the same post."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8, help="Concurrent likers.")
+        parser.add_argument("--toggles", type=int, default=200, help="Toggles per liker.")
+
+    def handle(self, *args, workers, toggles, **options):
+        toggle_paths = {
+            "legacy": legacy_toggle_like,
+            "returning": likes.toggle_like_in_db,
+        }
+        with benchmark_database():
+            User = get_user_model()
+            # bulk_create skips the profile signals, which need the cache
+            author, *likers = User.objects.bulk_create(
+                [User(username="bench_author")] + [User(username=f"bench_liker{i}") for i in range(workers)]
+            )
+            user_ids = [liker.pk for liker in likers]
+            self.stdout.write(f"{connection.vendor}: {workers} likers x {toggles} toggles on one post")
+
+            for label, toggle in toggle_paths.items():
+                post = Post.objects.create(author=author, content=f"Benchmark post ({label})")
+
+                with CaptureQueriesContext(connection) as queries:
+                    toggle(post.id, user_ids[0])
+                    toggle(post.id, user_ids[0])
+                statements = [
+                    q["sql"] for q in queries
+                    if not q["sql"].upper().startswith(("SAVEPOINT", "RELEASE", "BEGIN", "COMMIT"))
+                ]
+
+                result = run_concurrently(
+                    lambda worker, i: toggle(post.id, user_ids[worker]), workers, toggles
+                )
+                post.refresh_from_db()
+                expected = PostLike.objects.filter(post=post).count()
+
+                self.stdout.write(format_summary(label, summarize(result)))
+                self.stdout.write(
+                    f"{'':<14} {len(statements) / 2:.1f} statements per toggle; "
+                    f"likes_count {post.likes_count} vs {expected} likes"
+                )
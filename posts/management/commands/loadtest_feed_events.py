@@ -0,0 +1,144 @@
+import asyncio
+import json
+import resource
+import time
+import aiohttp
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from linkus_app.benchmarks import summarize
+from posts import events
+
+# Key of the like counts published as probes; no real post has it
+PROBE_KEY = "loadtest"
+
+
+class Command(BaseCommand):
+    help = (
+        "Load tests the live feed of a running ASGI server: opens many idle "
+        "server-sent event connections, holds them, and optionally measures how long "
+        "published updates take to reach every connection."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000/events/feed/", help="Live feed URL.")
+        parser.add_argument("--connections", type=int, default=5000, help="Connections to open.")
+        parser.add_argument("--ramp-concurrency", type=int, default=200, help="Connections opened at once.")
+        parser.add_argument("--hold", type=float, default=30.0, help="Seconds to hold the connections open.")
+        parser.add_argument(
+            "--probes", type=int, default=0,
+            help="Like counts to publish through Redis while holding, to measure delivery latency.",
+        )
+
+    def handle(self, *args, url, connections, ramp_concurrency, hold, probes, **options):
+        if probes and not settings.CACHES["default"]["BACKEND"].startswith("django_redis."):
+            raise CommandError("Publishing probes needs the default cache backend to be Redis.")
+
+        # Each connection is a file descriptor
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft != resource.RLIM_INFINITY and soft < connections + 100:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            if hard != resource.RLIM_INFINITY and hard < connections + 100:
+                self.stderr.write(f"The open file limit ({hard}) is below the number of connections.")
+
+        results = asyncio.run(self.run(url, connections, ramp_concurrency, hold, probes))
+
+        self.stdout.write(
+            f"connections    {results['connected']} opened, {len(results['errors'])} failed, "
+            f"{results['open_after_hold']} still open after {hold:.0f}s"
+        )
+        for error in sorted(set(results["errors"]))[:5]:
+            self.stdout.write(f"  {error}")
+        self.write_latencies("connect", results["connect_latencies"], results["ramp_elapsed"])
+        if probes:
+            expected = probes * results["connected"]
+            self.stdout.write(f"probes         {len(results['delivery_latencies'])}/{expected} deliveries")
+            self.write_latencies("delivery", results["delivery_latencies"], results["hold_elapsed"])
+
+    def write_latencies(self, label: str, latencies: list, elapsed: float) -> None:
+        summary = summarize({"latencies": latencies, "errors": [], "elapsed": elapsed or 1.0})
+        if summary["calls"]:
+            self.stdout.write(
+                f"{label:<14} p50 {summary['p50']:>8.2f}ms  p95 {summary['p95']:>8.2f}ms  "
+                f"p99 {summary['p99']:>8.2f}ms  max {max(latencies) * 1000:>8.2f}ms"
+            )
+
+    async def run(self, url, connections, ramp_concurrency, hold, probes) -> dict:
+        connect_latencies, errors, open_streams = [], [], set()
+        published_at, delivery_latencies = {}, []
+        ramp = asyncio.Semaphore(ramp_concurrency)
+        all_started = asyncio.Event()
+
+        async def listen(session, index):
+            async with ramp:
+                started = time.perf_counter()
+                try:
+                    response = await session.get(url, headers={"Accept": "text/event-stream"})
+                except (aiohttp.ClientError, OSError) as e:
+                    errors.append(f"{type(e).__name__}: {e}")
+                    return
+                if response.status != 200:
+                    errors.append(f"HTTP {response.status}")
+                    response.release()
+                    return
+                connect_latencies.append(time.perf_counter() - started)
+            open_streams.add(index)
+            try:
+                event = None
+                async for line in response.content:
+                    line = line.decode().rstrip("\r\n")
+                    if line.startswith("event: "):
+                        event = line[len("event: "):]
+                    elif line.startswith("data: ") and event == "likes":
+                        probe = json.loads(line[len("data: "):]).get(PROBE_KEY)
+                        if probe in published_at:
+                            delivery_latencies.append(time.perf_counter() - published_at[probe])
+            except (aiohttp.ClientError, OSError, asyncio.TimeoutError):
+                pass
+            finally:
+                open_streams.discard(index)
+                response.release()
+
+        async def publish_probes():
+            await all_started.wait()
+            # Probes are spaced out so that updates coalesce none of them away
+            spacing = max(hold / (probes + 1), settings.FEED_EVENTS_INTERVAL * 2)
+            for probe in range(1, probes + 1):
+                await asyncio.sleep(spacing)
+                published_at[probe] = time.perf_counter()
+                await asyncio.to_thread(events.publish_like_counts, {PROBE_KEY: probe})
+
+        connector = aiohttp.TCPConnector(limit=0, force_close=True)
+        timeout = aiohttp.ClientTimeout(total=None, connect=30, sock_read=None)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            ramp_started = time.perf_counter()
+            listeners = [asyncio.create_task(listen(session, i)) for i in range(connections)]
+            while len(connect_latencies) + len(errors) < connections:
+                await asyncio.sleep(0.05)
+            ramp_elapsed = time.perf_counter() - ramp_started
+            connected = len(connect_latencies)
+            self.stdout.write(f"Opened {connected} connections in {ramp_elapsed:.2f}s, holding for {hold:.0f}s")
+
+            all_started.set()
+            publisher = asyncio.create_task(publish_probes()) if probes else None
+            hold_started = time.perf_counter()
+            await asyncio.sleep(hold)
+            if publisher:
+                await publisher
+                # Let the last probe arrive
+                await asyncio.sleep(settings.FEED_EVENTS_INTERVAL * 2)
+            hold_elapsed = time.perf_counter() - hold_started
+            open_after_hold = len(open_streams)
+
+            for listener in listeners:
+                listener.cancel()
+            await asyncio.gather(*listeners, return_exceptions=True)
+
+        return {
+            "connected": connected,
+            "errors": errors,
+            "open_after_hold": open_after_hold,
+            "connect_latencies": connect_latencies,
+            "ramp_elapsed": ramp_elapsed,
+            "delivery_latencies": delivery_latencies,
+            "hold_elapsed": hold_elapsed,
+        }
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:42
+
+from datetime import timedelta
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_hot_scores(apps, schema_editor):
+    """
+    Scores the last week of posts, as decay_hot_scores would. Older posts stay at 0.
+    """
+    Post = apps.get_model('posts', 'Post')
+    now = timezone.now()
+    posts = list(Post.objects.filter(created_at__gte=now - timedelta(days=7)).only('id', 'likes_count', 'created_at'))
+    for post in posts:
+        age_hours = max((now - post.created_at).total_seconds() / 3600, 0)
+        post.hot_score = (post.likes_count + 1) / (age_hours + 2) ** 1.8
+    Post.objects.bulk_update(posts, ['hot_score'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0002_post_feed_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='hot_score',
+            field=models.FloatField(default=0, help_text='Time-decayed popularity for the hot feed, maintained by posts.hot.'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-hot_score', '-id'], name='post_hot_idx'),
+        ),
+        migrations.RunPython(backfill_hot_scores, migrations.RunPython.noop),
+    ]
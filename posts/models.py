@@ -1,5 +1,6 @@
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 class Post(models.Model):
     """
@@ -23,9 +24,29 @@ class Post(models.Model):
         default=0,
         help_text="Cached count of likes for performance."
     )
+    hot_score = models.FloatField(
+        default=0,
+        help_text="Time-decayed popularity for the hot feed, maintained by posts.hot."
+    )
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Keyset pagination of the feed, one index per sort order
+            models.Index(fields=["-created_at", "-id"], name="post_newest_idx"),
+            models.Index(fields=["-likes_count", "-created_at", "-id"], name="post_most_liked_idx"),
+            models.Index(fields=["-hot_score", "-id"], name="post_hot_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        New posts start with the hot score of an unliked post made now.
+        """
+        if self._state.adding and not self.hot_score:
+            from .hot import hot_score
+
+            self.hot_score = hot_score(self.likes_count, timezone.now())
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Post by {self.author.username} at {self.created_at.strftime('%Y-%m-%d %H:%M')}"
@@ -0,0 +1,14 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from . import events
+from .models import Post
+
+
+@receiver(post_save, sender=Post)
+def publish_new_post(sender, instance, created, **kwargs):
+    """
+    Pushes new posts to the live feed once they are committed.
+    """
+    if created:
+        transaction.on_commit(lambda: events.publish_post(instance))
@@ -0,0 +1,207 @@
+import asyncio
+import json
+import logging
+import redis.asyncio as aioredis
+from django.conf import settings
+from redis.exceptions import RedisError
+from .events import FEED_EVENTS_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+# Live feed updates as server-sent events, served by a plain ASGI app mounted in
+# linkus_app/asgi.py. Connections don't touch the database or go through Django's
+# request handling, so an idle one costs a coroutine and a small queue, and a worker
+# can hold thousands of them.
+FEED_EVENTS_PATH = "/events/feed/"
+# Messages buffered per connection. A connection that falls this far behind is
+# closed; the browser reconnects on its own.
+CLIENT_QUEUE_SIZE = 16
+# New posts sent per interval. Clients only need the newest ones.
+MAX_POSTS_PER_INTERVAL = 20
+# Milliseconds browsers wait before reconnecting
+CLIENT_RETRY = 5000
+# Seconds before resubscribing after losing the Redis connection
+RESUBSCRIBE_DELAY = 1.0
+
+HEARTBEAT = b": ping\n\n"
+# Put on a connection's queue to end its response
+CLOSE = None
+
+
+def sse_event(event: str, data) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+def _close(queue: asyncio.Queue) -> None:
+    while not queue.empty():
+        queue.get_nowait()
+    queue.put_nowait(CLOSE)
+
+
+class FeedEventHub:
+    """
+    Fans out live feed events from a single Redis subscription to every connection
+    of this process. Like counts are coalesced per post and new posts are batched,
+    and both are sent once per interval, so a connection receives at most one update
+    per post per interval however busy the post is. Each update is encoded once and
+    shared by all connections.
+    """
+
+    def __init__(self, redis_url: str | None, interval: float, heartbeat: float):
+        self.redis_url = redis_url
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.clients: set[asyncio.Queue] = set()
+        self.like_counts = {}
+        self.new_posts = []
+        self._tasks = []
+
+    def connect(self) -> asyncio.Queue:
+        """
+        Returns a queue receiving the encoded updates for a new connection,
+        ending with CLOSE.
+        """
+        if not self._tasks:
+            self.start()
+        queue = asyncio.Queue(CLIENT_QUEUE_SIZE)
+        self.clients.add(queue)
+        return queue
+
+    def disconnect(self, queue: asyncio.Queue) -> None:
+        self.clients.discard(queue)
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._send_loop())]
+        if self.redis_url:
+            self._tasks.append(asyncio.create_task(self._subscribe_loop()))
+        else:
+            logger.warning("Live feed events are disabled: the default cache backend is not Redis.")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for queue in self.clients:
+            _close(queue)
+        self.clients.clear()
+
+    def receive(self, message: dict) -> None:
+        """
+        Adds a message published by posts.events to the next update.
+        """
+        if message.get("type") == "likes":
+            self.like_counts.update(message["counts"])
+        elif message.get("type") == "post":
+            self.new_posts.append(message["post"])
+            del self.new_posts[:-MAX_POSTS_PER_INTERVAL]
+
+    def take_update(self) -> bytes:
+        """
+        Returns the encoded events received since the last update, and clears them.
+        """
+        update = b"".join(sse_event("post", post) for post in self.new_posts)
+        if self.like_counts:
+            update += sse_event("likes", self.like_counts)
+        self.new_posts, self.like_counts = [], {}
+        return update
+
+    def broadcast(self, update: bytes) -> None:
+        for queue in list(self.clients):
+            try:
+                queue.put_nowait(update)
+            except asyncio.QueueFull:
+                self.clients.discard(queue)
+                _close(queue)
+
+    async def _send_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        last_sent = loop.time()
+        while True:
+            await asyncio.sleep(self.interval)
+            update = self.take_update()
+            if not update and loop.time() - last_sent >= self.heartbeat:
+                # Keeps idle connections from being closed by proxies
+                update = HEARTBEAT
+            if update:
+                self.broadcast(update)
+                last_sent = loop.time()
+
+    async def _subscribe_loop(self) -> None:
+        while True:
+            client = aioredis.Redis.from_url(self.redis_url)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(FEED_EVENTS_CHANNEL)
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        try:
+                            self.receive(json.loads(message["data"]))
+                        except (ValueError, KeyError, TypeError) as e:
+                            logger.warning(f"Ignoring malformed feed event: {e}")
+            except (RedisError, OSError) as e:
+                logger.warning(f"Lost the live feed subscription, resubscribing: {e}")
+            finally:
+                await client.aclose()
+            await asyncio.sleep(RESUBSCRIBE_DELAY)
+
+
+_hub = None
+
+
+def get_hub() -> FeedEventHub:
+    """
+    Returns this process's hub. Pub/sub channels are shared by all databases of a
+    Redis server, so subscribing through the cache's URL receives what posts.events
+    publishes.
+    """
+    global _hub
+    if _hub is None:
+        cache = settings.CACHES["default"]
+        redis_url = cache["LOCATION"] if cache["BACKEND"].startswith("django_redis.") else None
+        _hub = FeedEventHub(redis_url, settings.FEED_EVENTS_INTERVAL, settings.FEED_EVENTS_HEARTBEAT)
+    return _hub
+
+
+async def _wait_for_disconnect(receive, queue: asyncio.Queue) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+    _close(queue)
+
+
+async def feed_events(scope, receive, send) -> None:
+    """
+    ASGI app streaming live feed updates to a browser as server-sent events:
+    "post" events with new posts and "likes" events mapping post ids to like counts.
+    """
+    if scope["method"] != "GET":
+        await send({"type": "http.response.start", "status": 405, "headers": [(b"allow", b"GET")]})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    hub = get_hub()
+    queue = hub.connect()
+    watcher = asyncio.create_task(_wait_for_disconnect(receive, queue))
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                # Stops nginx from buffering the stream
+                (b"x-accel-buffering", b"no"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": f"retry: {CLIENT_RETRY}\n\n".encode(), "more_body": True})
+        while (update := await queue.get()) is not CLOSE:
+            await send({"type": "http.response.body", "body": update, "more_body": True})
+        if not watcher.done():
+            # Closed by the hub rather than the client
+            await send({"type": "http.response.body", "body": b""})
+    except OSError:
+        pass
+    finally:
+        hub.disconnect(queue)
+        watcher.cancel()
@@ -0,0 +1,27 @@
+import logging
+from celery import shared_task
+from . import hot, likes
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def flush_post_likes():
+    """
+    A periodic task that writes likes recorded in Redis to the database.
+    Keeps flushing batches until no posts have pending likes.
+    """
+    total = 0
+    while flushed := likes.flush_pending_likes():
+        total += flushed
+    if total:
+        logger.info(f"Flushed pending likes of {total} posts.")
+
+
+@shared_task(ignore_result=True)
+def decay_hot_scores():
+    """
+    A periodic task that re-decays the hot scores of recent posts as they age.
+    """
+    updated = hot.decay_hot_scores()
+    logger.info(f"Re-decayed hot scores of {updated} posts.")
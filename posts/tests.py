@@ -1,10 +1,79 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+import unittest
+from datetime import timedelta
+from unittest.mock import Mock, patch
+from django.conf import settings
+from asgiref.testing import ApplicationCommunicator
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.db import connection, transaction
 from django.db.utils import IntegrityError
+from redis.exceptions import ConnectionError
 from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+from linkus_app.testing import FakeRedis, real_redis
+from . import events, hot, likes, streaming
 from .models import Post, PostLike
+from .tasks import flush_post_likes
 
 User = get_user_model()
 
+
+# Python emulations of the posts.likes scripts, for FakeRedis. RedisPostLikesTest
+# runs the like tests against the real scripts.
+
+def _toggle(redis, keys, args):
+    users_key, count_key, pending_key, dirty_key, published_key = keys
+    user_id, post_id, _, channel, _ = args
+    if count_key not in redis.data:
+        return -1
+    users = redis.data.setdefault(users_key, set())
+    liked = user_id not in users
+    (users.add if liked else users.discard)(user_id)
+    redis.data[count_key] = int(redis.data[count_key]) + (1 if liked else -1)
+    redis.data.setdefault(pending_key, {})[user_id] = "1" if liked else "0"
+    redis.sadd(dirty_key, post_id)
+    # The publish interval never ends here
+    if published_key not in redis.data:
+        redis.data[published_key] = 1
+        redis.publish(channel, f'{{"type":"likes","counts":{{"{post_id}":{redis.data[count_key]}}}}}')
+    return [int(liked), redis.data[count_key]]
+
+
+def _load(redis, keys, args):
+    users_key, count_key, pending_key = keys
+    if count_key in redis.data:
+        return 0
+    users = redis.data[users_key] = set(args[1:])
+    for user_id, liked in redis.data.get(pending_key, {}).items():
+        (users.add if liked == "1" else users.discard)(user_id)
+    redis.data[count_key] = len(users)
+    return 1
+
+
+def _sync_count(redis, keys, args):
+    count_key, pending_key = keys
+    if count_key not in redis.data or pending_key in redis.data:
+        return 0
+    redis.data[count_key] = int(args[0])
+    return 1
+
+
+def _take_pending(redis, keys, args):
+    pending = redis.data.pop(keys[0], {})
+    return [item.encode() for pair in pending.items() for item in pair]
+
+
+LIKE_SCRIPTS = {
+    likes.TOGGLE_SCRIPT: _toggle,
+    likes.LOAD_SCRIPT: _load,
+    likes.TAKE_PENDING_SCRIPT: _take_pending,
+    likes.SYNC_COUNT_SCRIPT: _sync_count,
+}
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
 class PostModelTest(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -39,3 +108,401 @@ class PostModelTest(TestCase):
         # Second like should fail, which proves the constraint
         with self.assertRaises(IntegrityError):
             PostLike.objects.create(user=self.user, post=post)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PostListViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user(username="viewer", password="password")
+        authors = [User.objects.create_user(username=f"author{i}", password="password") for i in range(5)]
+        cls.posts = [
+            Post.objects.create(author=authors[i % 5], content=f"Post {i}", likes_count=i % 3)
+            for i in range(25)
+        ]
+        PostLike.objects.create(user=cls.viewer, post=cls.posts[-1])
+
+    def walk_feed(self, sort):
+        """Follows the feed's cursors to the end and returns the posts in order."""
+        seen, params = [], {"sort": sort}
+        while True:
+            response = self.client.get(reverse("posts:list"), params)
+            seen.extend(response.context["post_list"])
+            if not response.context["next_cursor"]:
+                return seen
+            params = {"sort": sort, "cursor": response.context["next_cursor"]}
+
+    def test_feed_uses_fixed_number_of_queries(self):
+        """Test that posts, authors and like state come from a fixed number of queries."""
+        self.client.login(username="viewer", password="password")
+        # User, posts with authors, liked posts; sessions are in the cache
+        with self.assertNumQueries(3):
+            self.client.get(reverse("posts:list"))
+        # Then the user is cached too
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("posts:list"))
+
+        self.assertEqual(len(response.context["post_list"]), 20)
+        self.assertEqual(response.context["liked_post_ids"], {self.posts[-1].id})
+        self.assertContains(response, "@author4")
+
+    def test_cursors_walk_each_sort_without_gaps(self):
+        """Test that following cursors returns every post once, including ties on likes."""
+        newest = Post.objects.order_by("-created_at", "-id")
+        most_liked = Post.objects.order_by("-likes_count", "-created_at", "-id")
+
+        self.assertEqual(self.walk_feed("newest"), list(newest))
+        self.assertEqual(self.walk_feed("likes"), list(most_liked))
+
+    def test_cursor_from_another_sort_is_rejected(self):
+        """Test that a cursor is only accepted with the sort it was issued for."""
+        response = self.client.get(reverse("posts:list"), {"sort": "likes"})
+        cursor = response.context["next_cursor"]
+
+        self.assertEqual(self.client.get(reverse("posts:list"), {"sort": "newest", "cursor": cursor}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("posts:list"), {"cursor": "garbage"}).status_code, 400)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PostLikesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="author", password="password")
+        cls.fans = [User.objects.create_user(username=f"fan{i}", password="password") for i in range(3)]
+        cls.post = Post.objects.create(author=cls.author, content="A popular post", likes_count=1)
+        PostLike.objects.create(user=cls.fans[0], post=cls.post)
+
+    def make_redis(self):
+        return FakeRedis(LIKE_SCRIPTS)
+
+    def setUp(self):
+        self.redis = self.make_redis()
+        patcher = patch('posts.likes.get_redis_connection', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def like(self, user):
+        self.client.force_login(user)
+        return self.client.post(reverse("posts:like", args=[self.post.id])).json()
+
+    def test_likes_are_recorded_in_redis_and_flushed_in_batches(self):
+        """Test that toggles skip the database until the flusher writes them in one batch."""
+        self.like(self.fans[1])
+        self.like(self.fans[2])
+        self.like(self.fans[2])
+        data = self.like(self.fans[0])  # Unlikes the like loaded from the database
+
+        self.assertEqual(data, {"success": True, "likes_count": 1, "liked": False})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertTrue(PostLike.objects.filter(user=self.fans[0]).exists())
+
+        flush_post_likes()
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(list(PostLike.objects.values_list("user", flat=True)), [self.fans[1].id])
+        self.assertEqual(likes.flush_pending_likes(), 0)
+
+    def test_feed_shows_unflushed_likes(self):
+        """Test that the feed overlays like counts and state held in Redis."""
+        self.like(self.fans[1])
+
+        response = self.client.get(reverse("posts:list"))
+
+        self.assertEqual(response.context["post_list"][0].likes_count, 2)
+        self.assertEqual(response.context["liked_post_ids"], {self.post.id})
+
+    def test_failed_flush_keeps_pending_likes(self):
+        """Test that likes are put back for the next flush if the database write fails."""
+        self.like(self.fans[1])
+
+        with patch('posts.likes._write_changes', side_effect=RuntimeError("database down")):
+            with self.assertRaises(RuntimeError):
+                likes.flush_pending_likes()
+        likes.flush_pending_likes()
+
+        self.assertTrue(PostLike.objects.filter(user=self.fans[1], post=self.post).exists())
+
+    def test_falls_back_to_database_without_redis(self):
+        """Test that likes are written directly when Redis isn't available."""
+        with patch('posts.likes.get_redis_connection', side_effect=NotImplementedError):
+            data = self.like(self.fans[1])
+
+        self.assertEqual(data, {"success": True, "likes_count": 2, "liked": True})
+        self.assertTrue(PostLike.objects.filter(user=self.fans[1], post=self.post).exists())
+
+    def test_redis_state_reloads_after_database_fallback(self):
+        """Test that likes recorded in the database during a Redis outage aren't lost or miscounted."""
+        self.like(self.fans[1])
+        down = Mock(side_effect=ConnectionError("Redis down"))
+        with patch.object(self.redis, "register_script", return_value=down):
+            data = self.like(self.fans[2])
+        self.assertEqual(data, {"success": True, "likes_count": 2, "liked": True})
+
+        data = self.like(self.fans[2])  # Unlikes the like recorded in the database
+
+        self.assertEqual(data, {"success": True, "likes_count": 2, "liked": False})
+        flush_post_likes()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 2)
+        self.assertEqual(
+            set(PostLike.objects.values_list("user", flat=True)), {self.fans[0].id, self.fans[1].id}
+        )
+
+    def test_flush_recounts_likes_from_database(self):
+        """Test that the flushed count comes from the likes stored, not the Redis counter."""
+        self.like(self.fans[1])
+        self.redis.set(likes._count_key(self.post.id), 7)
+
+        with patch('posts.events.get_redis_connection', return_value=self.redis), \
+                patch.object(self.redis, "publish", wraps=self.redis.publish) as publish:
+            likes.flush_pending_likes()
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 2)
+        channel, message = publish.call_args.args
+        self.assertEqual((channel, json.loads(message)), ("feed_events", {"type": "likes", "counts": {str(self.post.id): 2}}))
+
+    def test_flush_corrects_drifted_redis_counts(self):
+        """Test that the Redis count is set from the database after a flush, unless newer toggles are pending."""
+        self.like(self.fans[1])
+        count_key = likes._count_key(self.post.id)
+        self.redis.set(count_key, 7)
+
+        likes.flush_pending_likes()
+
+        self.assertEqual(self.redis.get(count_key), b"2")
+        self.assertEqual(self.like(self.fans[2])["likes_count"], 3)
+
+    def test_flush_continues_past_posts_with_nothing_pending(self):
+        """Test that a dirty post whose changes were already taken doesn't stop the flush task."""
+        other = Post.objects.create(author=self.author, content="Another post")
+        self.like(self.fans[1])
+        self.client.post(reverse("posts:like", args=[other.id]))
+        self.redis.delete(likes._pending_key(self.post.id))
+
+        with override_settings(POST_LIKES_FLUSH_BATCH_SIZE=1):  # The emptied post is taken first
+            flush_post_likes()
+
+        self.assertTrue(PostLike.objects.filter(user=self.fans[1], post=other).exists())
+
+    def test_liking_missing_post_returns_404(self):
+        self.client.force_login(self.fans[1])
+        self.assertEqual(self.client.post(reverse("posts:like", args=[999])).status_code, 404)
+
+
+class RedisPostLikesTest(PostLikesTest):
+    """
+    Runs the like tests against a real Redis server and the real scripts.
+    """
+
+    def make_redis(self):
+        return real_redis(self)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DatabaseLikeToggleTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="liker", password="password")
+        cls.post = Post.objects.create(author=cls.user, content="A post")
+
+    def test_toggle_returns_new_state_and_count(self):
+        """Test that the database toggle likes, then unlikes, and returns the updated count."""
+        with self.assertNumQueries(4):  # Savepoint, insert, update ... returning, release
+            self.assertEqual(likes.toggle_like_in_db(self.post.id, self.user.id), (True, 1))
+        self.assertTrue(PostLike.objects.filter(user=self.user, post=self.post).exists())
+
+        self.assertEqual(likes.toggle_like_in_db(self.post.id, self.user.id), (False, 0))
+        self.assertFalse(PostLike.objects.exists())
+
+    def test_orm_toggle_matches(self):
+        """Test the fallback for databases without RETURNING."""
+        self.assertEqual(likes._toggle_like_orm(self.post.id, self.user.id), (True, 1))
+        self.assertEqual(likes._toggle_like_orm(self.post.id, self.user.id), (False, 0))
+
+    def test_toggle_of_missing_post_writes_nothing(self):
+        with self.assertRaises(Post.DoesNotExist):
+            likes.toggle_like_in_db(999, self.user.id)
+        self.assertFalse(PostLike.objects.exists())
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "Tests the PostgreSQL toggle")
+class ConcurrentPostgresqlLikeToggleTest(TransactionTestCase):
+    def test_toggle_racing_an_insert_reports_liked(self):
+        """Test that a toggle whose insert conflicts with a concurrent one reports the post as liked."""
+        user = User.objects.create_user(username="liker", password="password")
+        post = Post.objects.create(author=user, content="A post")
+        result = {}
+
+        def toggle():
+            try:
+                result["toggle"] = likes.toggle_like_in_db(post.id, user.id)
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            PostLike.objects.create(user=user, post=post)
+            thread = threading.Thread(target=toggle)
+            thread.start()
+            # The toggle's DELETE doesn't see the uncommitted like, so its INSERT
+            # waits on this transaction and then conflicts
+            thread.join(timeout=0.5)
+        thread.join()
+
+        self.assertEqual(result["toggle"], (True, 0))
+        self.assertTrue(PostLike.objects.filter(user=user, post=post).exists())
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class HotFeedTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="poster", password="password")
+
+    def create_post(self, hours_ago, likes_count):
+        post = Post.objects.create(author=self.user, content=f"{hours_ago}h old, {likes_count} likes")
+        Post.objects.filter(id=post.id).update(
+            created_at=timezone.now() - timedelta(hours=hours_ago), likes_count=likes_count
+        )
+        return post
+
+    def test_decay_orders_by_likes_and_age(self):
+        """Test that recent liked posts outrank old popular ones, and expired posts drop to 0."""
+        fresh = self.create_post(hours_ago=1, likes_count=10)
+        old_favourite = self.create_post(hours_ago=48, likes_count=100)
+        new_unliked = self.create_post(hours_ago=0, likes_count=0)
+        ancient = self.create_post(hours_ago=24 * 30, likes_count=1000)
+
+        self.assertEqual(hot.decay_hot_scores(), 2)  # The new post's score hasn't moved yet
+
+        response = self.client.get(reverse("posts:list"), {"sort": "hot"})
+        self.assertEqual(list(response.context["post_list"]), [fresh, new_unliked, old_favourite, ancient])
+        ancient.refresh_from_db()
+        self.assertEqual(ancient.hot_score, 0)
+
+    def test_decay_skips_scores_that_barely_moved(self):
+        """Test that decay only rewrites scores that moved by more than the threshold."""
+        young = self.create_post(hours_ago=1, likes_count=5)
+        old = self.create_post(hours_ago=100, likes_count=5)
+        hot.decay_hot_scores()
+        old.refresh_from_db()
+        stored = old.hot_score
+
+        # Ten minutes on, the young post's score fell by about 9% and the old one's by under 1%
+        later = timezone.now() + timedelta(minutes=10)
+        with patch('posts.hot.timezone.now', return_value=later):
+            self.assertEqual(hot.decay_hot_scores(), 1)
+
+        young.refresh_from_db()
+        old.refresh_from_db()
+        self.assertAlmostEqual(young.hot_score, hot.hot_score(5, young.created_at, later))
+        self.assertEqual(old.hot_score, stored)
+
+    def test_like_toggle_scales_score(self):
+        """Test that a like updates the hot score in the same statement as the count."""
+        post = self.create_post(hours_ago=5, likes_count=0)
+        hot.decay_hot_scores()
+        post.refresh_from_db()
+        before = post.hot_score
+
+        likes.toggle_like_in_db(post.id, self.user.id)
+
+        post.refresh_from_db()
+        self.assertAlmostEqual(post.hot_score, before * 2)
+        self.assertAlmostEqual(post.hot_score, hot.hot_score(1, post.created_at), places=3)
+
+    def test_new_posts_start_scored(self):
+        post = Post.objects.create(author=self.user, content="Just posted")
+        self.assertAlmostEqual(post.hot_score, 1 / 2 ** settings.POST_HOT_GRAVITY, places=3)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class FeedEventsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="author", password="password")
+        cls.fans = [User.objects.create_user(username=f"fan{i}", password="password") for i in range(3)]
+        cls.post = Post.objects.create(author=cls.author, content="A popular post")
+
+    def setUp(self):
+        self.redis = FakeRedis(LIKE_SCRIPTS)
+        for target in ('posts.likes.get_redis_connection', 'posts.events.get_redis_connection'):
+            patcher = patch(target, return_value=self.redis)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def published(self):
+        return [message for channel, message in self.redis.published if channel == events.FEED_EVENTS_CHANNEL]
+
+    def test_like_counts_are_published_once_per_interval_and_on_flush(self):
+        """Test that a burst of likes publishes its first and, on flush, its final count."""
+        for fan in self.fans:
+            likes.toggle_like(self.post.id, fan.id)
+
+        self.assertEqual(self.published(), [{"type": "likes", "counts": {str(self.post.id): 1}}])
+
+        flush_post_likes()
+
+        self.assertEqual(self.published()[-1], {"type": "likes", "counts": {str(self.post.id): 3}})
+
+    def test_new_posts_are_published_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(author=self.author, content="Fresh")
+            self.assertEqual(self.published(), [])
+
+        message = self.published()[0]
+        self.assertEqual(message["type"], "post")
+        self.assertEqual(message["post"]["id"], post.id)
+        self.assertEqual(message["post"]["author"], "author")
+        self.assertEqual(message["post"]["content"], "Fresh")
+
+
+class FeedEventHubTest(SimpleTestCase):
+    def setUp(self):
+        self.hub = streaming.FeedEventHub(redis_url=None, interval=0.01, heartbeat=60)
+
+    def test_updates_coalesce_like_counts_per_post(self):
+        """Test that any number of like counts of a post in an interval send one update."""
+        for count in range(1, 1001):
+            self.hub.receive({"type": "likes", "counts": {"1": count}})
+        self.hub.receive({"type": "likes", "counts": {"2": 5}})
+        self.hub.receive({"type": "post", "post": {"id": 3}})
+
+        update = self.hub.take_update()
+
+        self.assertEqual(
+            update,
+            b'event: post\ndata: {"id":3}\n\n'
+            b'event: likes\ndata: {"1":1000,"2":5}\n\n'
+        )
+        self.assertEqual(self.hub.take_update(), b"")
+
+    async def test_slow_connections_are_closed(self):
+        queue = asyncio.Queue(2)
+        self.hub.clients.add(queue)
+
+        for _ in range(3):
+            self.hub.broadcast(b"update")
+
+        self.assertNotIn(queue, self.hub.clients)
+        self.assertIs(queue.get_nowait(), streaming.CLOSE)
+
+    async def test_streams_updates_until_the_client_disconnects(self):
+        scope = {"type": "http", "method": "GET", "path": streaming.FEED_EVENTS_PATH}
+        communicator = ApplicationCommunicator(streaming.feed_events, scope)
+        with patch('posts.streaming._hub', self.hub), self.assertLogs('posts.streaming', 'WARNING'):
+            await communicator.send_input({"type": "http.request", "body": b""})
+            start = await communicator.receive_output()
+            self.assertEqual(start["status"], 200)
+            self.assertIn((b"content-type", b"text/event-stream"), start["headers"])
+            self.assertEqual((await communicator.receive_output())["body"], b"retry: 5000\n\n")
+
+            self.hub.receive({"type": "likes", "counts": {"7": 2}})
+            update = await communicator.receive_output(timeout=1)
+            self.assertEqual(update["body"], b'event: likes\ndata: {"7":2}\n\n')
+
+            await communicator.send_input({"type": "http.disconnect"})
+            await communicator.wait(timeout=1)
+            self.assertEqual(self.hub.clients, set())
+            await self.hub.stop()
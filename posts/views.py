@@ -1,45 +1,92 @@
+import logging
 from django.contrib.auth.decorators import login_required
-from django.db import transaction
-from django.db.models import F
-from django.http import JsonResponse
-from django.shortcuts import get_object_or_404
+from django.core.exceptions import SuspiciousOperation, ValidationError
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
 from django.urls import reverse_lazy
 from django.views.decorators.http import require_POST
 from django.views.generic import ListView
 from django.views.generic.edit import FormMixin
+from linkus_app.pagination import InvalidCursor, decode_cursor, encode_cursor, paginate_keyset
+from . import likes
 from .models import Post, PostLike
 from .forms import PostForm
 
+logger = logging.getLogger(__name__)
+
 class PostListView(FormMixin, ListView):
     model = Post
     form_class = PostForm
     template_name = "posts/post_list.html"
     context_object_name = "post_list"
-    paginate_by = 20
+    # Pages are linked by cursors rather than Django's paginator, so no page
+    # costs more than the first one
+    page_size = 20
+    # Keyset orderings for each sort; matching indexes are defined on Post
+    sort_orderings = {
+        "newest": ("-created_at", "-id"),
+        "likes": ("-likes_count", "-created_at", "-id"),
+        "hot": ("-hot_score", "-id"),
+    }
+    cursor_values = None
 
-    def get_queryset(self):
-        queryset = super().get_queryset()
+    def get_sort(self) -> str:
         sort_by = self.request.GET.get('sort', 'newest')
-        if sort_by == 'likes':
-            return queryset.order_by('-likes_count', '-created_at')
-        return queryset.order_by('-created_at') # Default sort
+        return sort_by if sort_by in self.sort_orderings else 'newest'
+
+    def get(self, request, *args, **kwargs):
+        cursor = request.GET.get('cursor')
+        if cursor:
+            try:
+                position = decode_cursor(cursor)
+            except InvalidCursor:
+                return HttpResponseBadRequest("Invalid cursor.")
+            if position.get("s") != self.get_sort():
+                return HttpResponseBadRequest("Invalid cursor.")
+            self.cursor_values = position.get("k")
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        # Load each post's author in the same query, with only the fields the feed shows
+        return Post.objects.select_related('author').only(
+            'id', 'content', 'created_at', 'likes_count', 'hot_score',
+            'author__username', 'author__profile_image', 'author__profile_image_variants',
+        )
 
     def get_success_url(self):
         return reverse_lazy("posts:list")
 
     def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
+        sort_by = self.get_sort()
+        ordering = self.sort_orderings[sort_by]
+        try:
+            posts, next_values = paginate_keyset(self.object_list, ordering, self.cursor_values, self.page_size)
+        except (ValidationError, ValueError, TypeError):
+            raise SuspiciousOperation("Invalid cursor.")
+
+        context = super().get_context_data(object_list=posts, **kwargs)
         context["form"] = self.get_form()
-        context["sort_by"] = self.request.GET.get('sort', 'newest')
-
-        if self.request.user.is_authenticated:
-            liked_post_ids = PostLike.objects.filter(
-                user=self.request.user,
-                post__in=context['post_list']
-            ).values_list('post_id', flat=True)
-            context['liked_post_ids'] = set(liked_post_ids)
+        context["sort_by"] = sort_by
+        context["next_cursor"] = encode_cursor({"s": sort_by, "k": next_values}) if next_values else None
+
+        user_id = self.request.user.pk if self.request.user.is_authenticated else None
+        if user_id and posts:
+            liked_post_ids = set(PostLike.objects.filter(
+                user_id=user_id,
+                post_id__in=[post.id for post in posts]
+            ).values_list('post_id', flat=True))
         else:
-            context['liked_post_ids'] = set()
+            liked_post_ids = set()
+
+        # Likes not yet flushed to the database are only in Redis
+        try:
+            live_counts, live_liked = likes.get_like_state([post.id for post in posts], user_id)
+        except likes.LikeStoreUnavailable:
+            live_counts, live_liked = {}, {}
+        for post in posts:
+            post.likes_count = live_counts.get(post.id, post.likes_count)
+        liked_post_ids -= live_liked.keys()
+        liked_post_ids |= {post_id for post_id, liked in live_liked.items() if liked}
+        context['liked_post_ids'] = liked_post_ids
 
         return context
 
@@ -60,32 +107,35 @@ class PostListView(FormMixin, ListView):
         post.save()
         return super().form_valid(form)
 
+def _toggle_like(post_id: int, user_id: int) -> tuple[bool, int]:
+    """
+    Records a like toggle in Redis, or directly in the database if Redis is unavailable.
+    """
+    try:
+        return likes.toggle_like(post_id, user_id)
+    except likes.LikeStoreUnavailable as e:
+        if isinstance(e, likes.LikeStoreNotConfigured):
+            return likes.toggle_like_in_db(post_id, user_id)
+        logger.warning(f"Recording like of post {post_id} in the database: {e}")
+        result = likes.toggle_like_in_db(post_id, user_id)
+        likes.mark_stale(post_id)
+        return result
+
+
 @login_required
 @require_POST
 def like_post(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-
-    with transaction.atomic():
-        like, created = PostLike.objects.get_or_create(user=request.user, post=post)
-
-        if created:
-            # If the like was just created (user is liking the post)
-            Post.objects.filter(id=post_id).update(likes_count=F('likes_count') + 1)
-            liked = True
-        else:
-            # If the like already existed (user is unliking the post)
-            like.delete()
-            Post.objects.filter(id=post_id).update(likes_count=F('likes_count') - 1)
-            liked = False
-
-    # Refresh the post from the database to get the updated likes_count.
-    # Note: In a very high-concurrency scenario, the returned likes_count might
-    # not be the absolute latest value, but the atomic update guarantees the
-    # database value is correct.
-    post.refresh_from_db()
+    """
+    Likes or unlikes a post. The toggle is recorded in Redis and returned
+    immediately; flush_post_likes writes it to the database shortly after.
+    """
+    try:
+        liked, likes_count = _toggle_like(post_id, request.user.pk)
+    except Post.DoesNotExist:
+        raise Http404("No post found.")
 
     return JsonResponse({
         "success": True,
-        "likes_count": post.likes_count,
+        "likes_count": likes_count,
         "liked": liked,
     })
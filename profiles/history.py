@@ -0,0 +1,153 @@
+import datetime
+from decimal import Decimal
+from django.conf import settings
+from django.db.models import Avg, Max
+from django.db.models.functions import TruncDay, TruncWeek
+from .models import PortfolioSnapshot
+
+# Portfolio value history. The portfolio task records an hourly snapshot of each
+# user it values. Once a day (or week, UTC) is over, its hourly (or daily) snapshots
+# are averaged into one snapshot of the coarser resolution, and each resolution is
+# kept for PORTFOLIO_HISTORY_*_DAYS. Every resolution is complete over the period it
+# is kept for, so a chart reads a single resolution, chosen by its range, and a user
+# has a bounded number of rows however long they stay.
+
+HOUR = PortfolioSnapshot.RESOLUTION_HOUR
+DAY = PortfolioSnapshot.RESOLUTION_DAY
+WEEK = PortfolioSnapshot.RESOLUTION_WEEK
+
+# Chart ranges: the days they cover (None for everything kept) and the resolution read
+CHART_RANGES = {
+    "1w": (7, HOUR),
+    "1m": (30, DAY),
+    "1y": (365, DAY),
+    "all": (None, WEEK),
+}
+
+# Snapshots written per INSERT
+WRITE_BATCH_SIZE = 1000
+
+CENT = Decimal("0.01")
+
+
+def _bucket_start(resolution: str, moment: datetime.datetime) -> datetime.datetime:
+    """
+    Returns the start of the UTC hour, day or week (from Monday) containing `moment`.
+    """
+    start = moment.astimezone(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if resolution == HOUR:
+        return start
+    start = start.replace(hour=0)
+    if resolution == DAY:
+        return start
+    return start - datetime.timedelta(days=start.weekday())
+
+
+def _write(snapshots) -> int:
+    """
+    Saves snapshots in batches, replacing those already stored for the same bucket.
+    Returns the number of snapshots written.
+    """
+    written = 0
+    batch = []
+    for snapshot in snapshots:
+        batch.append(snapshot)
+        if len(batch) == WRITE_BATCH_SIZE:
+            written += _write_batch(batch)
+            batch = []
+    if batch:
+        written += _write_batch(batch)
+    return written
+
+
+def _write_batch(batch: list) -> int:
+    PortfolioSnapshot.objects.bulk_create(
+        batch,
+        update_conflicts=True,
+        unique_fields=["user", "resolution", "bucket"],
+        update_fields=["value"],
+    )
+    return len(batch)
+
+
+def record_snapshots(values: dict, at: datetime.datetime) -> None:
+    """
+    Records the portfolio values of users (a dict of user id to value) as their
+    snapshots for the hour containing `at`. Values recorded again within the same
+    hour replace the earlier ones.
+    """
+    bucket = _bucket_start(HOUR, at)
+    _write(
+        PortfolioSnapshot(user_id=user_id, resolution=HOUR, bucket=bucket, value=value)
+        for user_id, value in values.items()
+    )
+
+
+def _downsample(source: str, target: str, trunc, length: datetime.timedelta, now: datetime.datetime) -> int:
+    """
+    Averages the `source` snapshots of each complete `target` bucket after the
+    latest one already stored into a `target` snapshot per user.
+    Returns the number of snapshots written.
+    """
+    snapshots = PortfolioSnapshot.objects.filter(resolution=source, bucket__lt=_bucket_start(target, now))
+    latest = PortfolioSnapshot.objects.filter(resolution=target).aggregate(latest=Max("bucket"))["latest"]
+    if latest is not None:
+        snapshots = snapshots.filter(bucket__gte=latest + length)
+
+    averages = (
+        snapshots.annotate(target_bucket=trunc("bucket", tzinfo=datetime.timezone.utc))
+        .values("user_id", "target_bucket")
+        .annotate(average=Avg("value"))
+        .order_by()
+    )
+    return _write(
+        PortfolioSnapshot(
+            user_id=row["user_id"],
+            resolution=target,
+            bucket=row["target_bucket"],
+            value=Decimal(row["average"]).quantize(CENT),
+        )
+        for row in averages.iterator()
+    )
+
+
+def downsample(now: datetime.datetime) -> dict:
+    """
+    Creates the daily snapshots of the days, and the weekly snapshots of the
+    weeks, completed since the last run. Returns the number written per resolution.
+    """
+    return {
+        DAY: _downsample(HOUR, DAY, TruncDay, datetime.timedelta(days=1), now),
+        WEEK: _downsample(DAY, WEEK, TruncWeek, datetime.timedelta(weeks=1), now),
+    }
+
+
+def apply_retention(now: datetime.datetime) -> dict:
+    """
+    Deletes the snapshots of each resolution that ended before the period it is
+    kept for. Returns the number deleted per resolution.
+    """
+    retention_days = {
+        HOUR: settings.PORTFOLIO_HISTORY_HOURLY_DAYS,
+        DAY: settings.PORTFOLIO_HISTORY_DAILY_DAYS,
+        WEEK: settings.PORTFOLIO_HISTORY_WEEKLY_DAYS,
+    }
+    deleted = {}
+    for resolution, days in retention_days.items():
+        deleted[resolution], _ = PortfolioSnapshot.objects.filter(
+            resolution=resolution, bucket__lt=_bucket_start(resolution, now - datetime.timedelta(days=days))
+        ).delete()
+    return deleted
+
+
+def get_chart(user_id: int, range_name: str, now: datetime.datetime) -> tuple[str, list]:
+    """
+    Returns the resolution and the (bucket, value) points of a user's chart over
+    one of the CHART_RANGES, oldest first, starting with the bucket the range
+    starts in. Raises KeyError for an unknown range.
+    """
+    days, resolution = CHART_RANGES[range_name]
+    snapshots = PortfolioSnapshot.objects.filter(user_id=user_id, resolution=resolution)
+    if days is not None:
+        snapshots = snapshots.filter(bucket__gte=_bucket_start(resolution, now - datetime.timedelta(days=days)))
+    return resolution, list(snapshots.order_by("bucket").values_list("bucket", "value"))
@@ -0,0 +1,225 @@
+import ipaddress
+import logging
+import random
+import socket
+import time
+from urllib.parse import urlsplit
+import requests
+from django.conf import settings
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Upstream responses that are worth retrying
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+class HttpClient:
+    """
+    A shared HTTP client for external APIs.
+
+    Connections are kept alive in a per-host pool, every request gets connect/read
+    timeouts, and rate-limited (429) or failing (5xx) responses are retried with
+    jittered exponential backoff. A custom `transport` (any requests adapter) can be
+    plugged in so tests and benchmarks can point the client at a local stand-in.
+    """
+
+    def __init__(
+        self,
+        timeout: tuple[float, float] = (3.05, 10.0),
+        max_retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        pool_connections: int = 4,
+        pool_maxsize: int = 16,
+        transport: BaseAdapter | None = None,
+    ):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        if transport is None:
+            # pool_maxsize is a per-host limit; pool_block makes callers wait for a
+            # free connection instead of opening extra ones past the limit.
+            transport = HTTPAdapter(
+                pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=True
+            )
+        self.session = requests.Session()
+        self.session.mount("https://", transport)
+        self.session.mount("http://", transport)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def request(self, method: str, url: str, deadline: float | None = None, **kwargs) -> requests.Response:
+        """
+        Sends a request, retrying connection errors, timeouts and retryable statuses.
+        The last response is returned (or the last exception raised) once retries run out.
+
+        With a `deadline` (seconds), the timeouts of each attempt are capped to the
+        time left, and no retry is started that couldn't finish in time.
+        """
+        timeout = kwargs.pop("timeout", self.timeout)
+        if not isinstance(timeout, tuple):
+            timeout = (timeout, timeout)
+        expires_at = None if deadline is None else time.monotonic() + deadline
+        attempt = 0
+        while True:
+            if expires_at is not None:
+                remaining = expires_at - time.monotonic()
+                if remaining <= 0:
+                    raise requests.exceptions.Timeout(f"{method} {url} exceeded its {deadline}s deadline.")
+                kwargs["timeout"] = tuple(min(t, remaining) for t in timeout)
+            else:
+                kwargs["timeout"] = timeout
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                delay = self._backoff(attempt)
+                if attempt >= self.max_retries or self._past_deadline(expires_at, delay):
+                    raise
+                logger.warning(f"{method} {url} failed ({e}), retrying in {delay:.2f}s.")
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                delay = self._retry_after(response)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                if self._past_deadline(expires_at, delay):
+                    return response
+                logger.warning(f"{method} {url} returned {response.status_code}, retrying in {delay:.2f}s.")
+                response.close()
+
+            time.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def _past_deadline(expires_at: float | None, delay: float) -> bool:
+        """
+        Whether a retry after `delay` seconds would start at or after the deadline.
+        """
+        return expires_at is not None and time.monotonic() + delay >= expires_at
+
+    def _backoff(self, attempt: int) -> float:
+        """
+        Exponential backoff with full jitter, so concurrent callers don't retry in lockstep.
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _retry_after(self, response: requests.Response) -> float | None:
+        """
+        Honours a numeric Retry-After header, capped at backoff_max.
+        """
+        try:
+            return min(float(response.headers["Retry-After"]), self.backoff_max)
+        except (KeyError, ValueError):
+            return None
+
+
+_default_client = None
+
+
+def get_http_client() -> HttpClient:
+    """
+    Returns the process-wide client, creating it from settings on first use.
+    """
+    global _default_client
+    if _default_client is None:
+        _default_client = HttpClient(
+            timeout=settings.EXTERNAL_API_TIMEOUT,
+            max_retries=settings.EXTERNAL_API_MAX_RETRIES,
+            pool_maxsize=settings.ALCHEMY_MAX_CONCURRENCY,
+        )
+    return _default_client
+
+
+def set_http_client(client: HttpClient | None) -> HttpClient | None:
+    """
+    Replaces the process-wide client (e.g. with one using a stub transport).
+    Passing None resets it to be rebuilt from settings. Returns the previous client.
+    """
+    global _default_client
+    previous, _default_client = _default_client, client
+    return previous
+
+
+class UnsafeAddress(requests.exceptions.RequestException):
+    """
+    Raised for requests to hosts that resolve to non-public addresses.
+    """
+
+
+def is_public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not (
+        ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_multicast
+        or ip.is_reserved or ip.is_unspecified
+    )
+
+
+class PublicAddressAdapter(HTTPAdapter):
+    """
+    A transport that only connects to public addresses, for URLs chosen by users.
+
+    The host of each request is resolved once, every address it resolves to must
+    be public, and the connection is made to the first of them, with the original
+    Host header and TLS server name. Connecting by name would resolve the host again,
+    and a host that answers with a public address for the check and an internal one
+    for the connection (DNS rebinding) would get past it.
+    """
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        try:
+            addresses = socket.getaddrinfo(parts.hostname, parts.port, proto=socket.IPPROTO_TCP)
+        except (socket.gaierror, UnicodeError) as e:
+            raise requests.exceptions.ConnectionError(f"Could not resolve {parts.hostname}: {e}", request=request)
+        if not all(is_public_address(sockaddr[0]) for *_, sockaddr in addresses):
+            raise UnsafeAddress(f"{parts.hostname} resolves to a non-public address.", request=request)
+        request.pinned_address = addresses[0][4][0]
+        request.headers.setdefault("Host", parts.netloc.rpartition("@")[2])
+        return super().send(request, **kwargs)
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, pool_kwargs = super().build_connection_pool_key_attributes(request, verify, cert)
+        if host_params["scheme"] == "https":
+            pool_kwargs["server_hostname"] = host_params["host"]
+            pool_kwargs["assert_hostname"] = host_params["host"]
+        host_params["host"] = request.pinned_address
+        return host_params, pool_kwargs
+
+
+_media_client = None
+
+
+def get_media_http_client() -> HttpClient:
+    """
+    Returns the process-wide client for downloading NFT media from arbitrary hosts.
+    It is kept apart from the API client's pool, doesn't retry, and only connects
+    to public addresses.
+    """
+    global _media_client
+    if _media_client is None:
+        _media_client = HttpClient(
+            timeout=(settings.EXTERNAL_API_TIMEOUT[0], settings.NFT_MEDIA_TIMEOUT),
+            max_retries=0,
+            transport=PublicAddressAdapter(pool_connections=4, pool_maxsize=16, pool_block=True),
+        )
+        # Never route media downloads through proxies from the environment
+        _media_client.session.trust_env = False
+    return _media_client
+
+
+def set_media_http_client(client: HttpClient | None) -> HttpClient | None:
+    """
+    Replaces the process-wide media client, like set_http_client().
+    """
+    global _media_client
+    previous, _media_client = _media_client, client
+    return previous
@@ -0,0 +1,270 @@
+import logging
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+from accounts.models import User
+
+logger = logging.getLogger(__name__)
+
+# Sorted set of public users, scored by portfolio value. Members are zero-padded user
+# ids, so users with equal values are ordered by descending id, as in the database.
+LEADERBOARD_KEY = "leaderboard_portfolio_value"
+# Only rebuild() adds this member (scored -inf, so it ranks last). A leaderboard
+# without it, e.g. after Redis was flushed or evicted the key, is incomplete: it isn't
+# read or written until the next rebuild.
+BUILT_MEMBER = "built"
+BUILDING_KEY = f"{LEADERBOARD_KEY}_building"
+# Changes made while a rebuild is loading the database, applied before it is swapped
+# in: member -> "s:<score>", "x:<score>" (only if ranked) or "r" (removed). Its
+# existence marks a rebuild in progress.
+PENDING_KEY = f"{LEADERBOARD_KEY}_pending"
+# Seconds after which an unfinished rebuild stops recording changes
+REBUILD_TIMEOUT = 60 * 60
+# How often the ranking may queue a rebuild of an incomplete leaderboard
+REBUILD_QUEUE_INTERVAL = 60 * 10
+# Number of members written per Redis round trip when (re)building
+WRITE_CHUNK_SIZE = 1000
+
+# KEYS: leaderboard, pending. ARGV: built member, "s" or "x" (only existing members),
+# then score, member pairs. Returns whether the leaderboard is built.
+UPDATE_SCRIPT = """
+local rebuilding = redis.call('EXISTS', KEYS[2]) == 1
+local built = redis.call('ZSCORE', KEYS[1], ARGV[1])
+for i = 3, #ARGV, 2 do
+    if rebuilding then
+        redis.call('HSET', KEYS[2], ARGV[i + 1], ARGV[2] .. ':' .. ARGV[i])
+    end
+    if built then
+        if ARGV[2] == 'x' then
+            redis.call('ZADD', KEYS[1], 'XX', ARGV[i], ARGV[i + 1])
+        else
+            redis.call('ZADD', KEYS[1], ARGV[i], ARGV[i + 1])
+        end
+    end
+end
+return built and 1 or 0
+"""
+
+# KEYS: leaderboard, pending. ARGV: members.
+REMOVE_SCRIPT = """
+local rebuilding = redis.call('EXISTS', KEYS[2]) == 1
+for i = 1, #ARGV do
+    if rebuilding then
+        redis.call('HSET', KEYS[2], ARGV[i], 'r')
+    end
+    redis.call('ZREM', KEYS[1], ARGV[i])
+end
+return 0
+"""
+
+# KEYS: building, pending, leaderboard. ARGV: built member.
+# Applies the changes recorded during the rebuild, marks it built and swaps it in.
+FINISH_REBUILD_SCRIPT = """
+local pending = redis.call('HGETALL', KEYS[2])
+for i = 1, #pending, 2 do
+    local member, change = pending[i], pending[i + 1]
+    if change == 'r' then
+        redis.call('ZREM', KEYS[1], member)
+    elseif change ~= '' then
+        local score = string.sub(change, 3)
+        if string.sub(change, 1, 1) == 'x' then
+            redis.call('ZADD', KEYS[1], 'XX', score, member)
+        else
+            redis.call('ZADD', KEYS[1], score, member)
+        end
+    end
+end
+redis.call('ZADD', KEYS[1], '-inf', ARGV[1])
+redis.call('RENAME', KEYS[1], KEYS[3])
+redis.call('DEL', KEYS[2])
+return 0
+"""
+
+
+class LeaderboardUnavailable(Exception):
+    """
+    Raised when the leaderboard can't be used, e.g. because Redis is down.
+    """
+
+
+class LeaderboardNotConfigured(LeaderboardUnavailable):
+    """
+    Raised when the default cache backend isn't Redis (e.g. in tests).
+    """
+
+
+class LeaderboardNotBuilt(LeaderboardUnavailable):
+    """
+    Raised when the leaderboard hasn't been built since Redis lost it.
+    """
+
+
+def _get_redis():
+    """
+    Returns the Redis client behind the default cache.
+    """
+    try:
+        return get_redis_connection("default")
+    except NotImplementedError:
+        raise LeaderboardNotConfigured("The default cache backend is not Redis.")
+
+
+def _member(user_id: int) -> str:
+    return f"{user_id:020d}"
+
+
+def update_scores(scores: dict, only_existing: bool = False) -> None:
+    """
+    Sets the portfolio values of users on the leaderboard, if it is built.
+    With `only_existing`, users not already on the leaderboard (i.e. non-public users)
+    are left off it.
+    """
+    items = [(_member(user_id), float(value)) for user_id, value in scores.items()]
+    mode = "x" if only_existing else "s"
+    try:
+        redis = _get_redis()
+        update = redis.register_script(UPDATE_SCRIPT)
+        with redis.pipeline(transaction=False) as pipe:
+            for i in range(0, len(items), WRITE_CHUNK_SIZE):
+                args = [BUILT_MEMBER, mode]
+                for member, score in items[i:i + WRITE_CHUNK_SIZE]:
+                    args += [score, member]
+                update(keys=[LEADERBOARD_KEY, PENDING_KEY], args=args, client=pipe)
+            pipe.execute()
+    except RedisError as e:
+        raise LeaderboardUnavailable(e) from e
+
+
+def remove_users(user_ids) -> None:
+    """
+    Removes users from the leaderboard.
+    """
+    members = [_member(user_id) for user_id in user_ids]
+    if not members:
+        return
+    try:
+        redis = _get_redis()
+        redis.register_script(REMOVE_SCRIPT)(keys=[LEADERBOARD_KEY, PENDING_KEY], args=members)
+    except RedisError as e:
+        raise LeaderboardUnavailable(e) from e
+
+
+def get_rank(user_id: int) -> int | None:
+    """
+    Returns the 1-based global rank of a user, or None if they aren't ranked. O(log n).
+    """
+    try:
+        with _get_redis().pipeline(transaction=False) as pipe:
+            pipe.zscore(LEADERBOARD_KEY, BUILT_MEMBER)
+            pipe.zrevrank(LEADERBOARD_KEY, _member(user_id))
+            built, rank = pipe.execute()
+    except RedisError as e:
+        raise LeaderboardUnavailable(e) from e
+    if built is None:
+        raise LeaderboardNotBuilt("The leaderboard hasn't been built.")
+    return None if rank is None else rank + 1
+
+
+def rebuild() -> int:
+    """
+    Rebuilds the leaderboard from the database and atomically swaps it in. Changes
+    made while the database is being read are recorded and applied before the swap.
+    Returns the number of ranked users.
+    """
+    redis = _get_redis()
+    count = 0
+    try:
+        with redis.pipeline(transaction=True) as pipe:
+            pipe.delete(BUILDING_KEY, PENDING_KEY)
+            pipe.hset(PENDING_KEY, "", "")
+            pipe.expire(PENDING_KEY, REBUILD_TIMEOUT)
+            pipe.execute()
+
+        users = User.objects.filter(is_public=True).values_list("id", "portfolio_value")
+        with redis.pipeline(transaction=False) as pipe:
+            chunk = {}
+            for user_id, value in users.iterator(chunk_size=WRITE_CHUNK_SIZE):
+                chunk[_member(user_id)] = float(value)
+                if len(chunk) == WRITE_CHUNK_SIZE:
+                    pipe.zadd(BUILDING_KEY, chunk)
+                    count += len(chunk)
+                    chunk = {}
+            if chunk:
+                pipe.zadd(BUILDING_KEY, chunk)
+                count += len(chunk)
+            pipe.execute()
+
+        redis.register_script(FINISH_REBUILD_SCRIPT)(
+            keys=[BUILDING_KEY, PENDING_KEY, LEADERBOARD_KEY], args=[BUILT_MEMBER]
+        )
+    except RedisError as e:
+        raise LeaderboardUnavailable(e) from e
+    return count
+
+
+def schedule_rebuild() -> None:
+    """
+    Queues a rebuild, at most once per REBUILD_QUEUE_INTERVAL.
+    """
+    if not cache.add(f"{LEADERBOARD_KEY}_rebuild_queued", True, timeout=REBUILD_QUEUE_INTERVAL):
+        return
+
+    from .tasks import rebuild_leaderboard
+
+    try:
+        rebuild_leaderboard.delay()
+    except Exception as e:
+        cache.delete(f"{LEADERBOARD_KEY}_rebuild_queued")
+        logger.error(f"Could not queue a leaderboard rebuild: {e}")
+
+
+class LeaderboardList:
+    """
+    A lazy, sliceable list of ranked users backed by the leaderboard, usable
+    anywhere a queryset would be paginated. Slicing reads one range of the
+    sorted set (O(log n + page size)) and loads only those users, leaving out
+    (and removing) any that are no longer public.
+    """
+
+    def __init__(self):
+        try:
+            self._redis = _get_redis()
+            with self._redis.pipeline(transaction=False) as pipe:
+                pipe.zscore(LEADERBOARD_KEY, BUILT_MEMBER)
+                pipe.zcard(LEADERBOARD_KEY)
+                built, count = pipe.execute()
+        except RedisError as e:
+            raise LeaderboardUnavailable(e) from e
+        if built is None:
+            raise LeaderboardNotBuilt("The leaderboard hasn't been built.")
+        # The built member ranks last, past every user
+        self._count = count - 1
+
+    def count(self) -> int:
+        return self._count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+
+        start, stop, _ = index.indices(self._count)
+        if start >= stop:
+            return []
+        try:
+            user_ids = [int(member) for member in self._redis.zrevrange(LEADERBOARD_KEY, start, stop - 1)]
+        except RedisError as e:
+            raise LeaderboardUnavailable(e) from e
+
+        users = User.objects.filter(is_public=True).in_bulk(user_ids)
+        stale = [user_id for user_id in user_ids if user_id not in users]
+        if stale:
+            # Users deleted or made private whose removal didn't reach the leaderboard.
+            # The page comes out short this once.
+            try:
+                remove_users(stale)
+            except LeaderboardUnavailable as e:
+                logger.warning(f"Could not remove {len(stale)} stale users from the leaderboard: {e}")
+        return [users[user_id] for user_id in user_ids if user_id in users]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenMetadata',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('contract_address', models.CharField(help_text='The token contract address (lowercase).', max_length=42, unique=True)),
+                ('decimals', models.PositiveSmallIntegerField(blank=True, help_text='Number of decimals the token uses, if known.', null=True)),
+                ('symbol', models.CharField(blank=True, help_text="The token's ticker symbol.", max_length=64)),
+                ('name', models.CharField(blank=True, help_text="The token's name.", max_length=255)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Token metadata',
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0002_tokenmetadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NftMedia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_url', models.TextField(help_text='The original URL of the NFT image.')),
+                ('source_url_hash', models.CharField(help_text='SHA-256 of the source URL, used for lookups.', max_length=64, unique=True)),
+                ('content_hash', models.CharField(blank=True, help_text='SHA-256 of the downloaded image, used to name the thumbnails.', max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'NFT media',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-17 21:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0004_walletvaluation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily'), ('week', 'Weekly')], max_length=4)),
+                ('bucket', models.DateTimeField(help_text='The start of the hour, day or week the value covers.')),
+                ('value', models.DecimalField(decimal_places=2, help_text='The average portfolio value over the bucket in USD.', max_digits=20)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='portfolio_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['resolution', 'bucket'], name='portfolio_snapshot_time_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'resolution', 'bucket'), name='portfolio_snapshot_bucket_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 21:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0005_portfoliosnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nftmedia',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Number of failed attempts to generate the thumbnails.'),
+        ),
+        migrations.AddField(
+            model_name='nftmedia',
+            name='retry_after',
+            field=models.DateTimeField(blank=True, help_text="When a failed image may be tried again; empty if it won't be.", null=True),
+        ),
+    ]
@@ -74,3 +74,171 @@ class Address(models.Model):
 
     def __str__(self):
         return f"{self.user.username}'s {self.get_currency_type_display()} Address: {self.address}"
+
+
+class WalletValuation(models.Model):
+    """
+    Stores the USD value of one of a user's ETH wallets (the primary wallet or a
+    verified address) as of the last portfolio update, so profile pages can show
+    the breakdown of the portfolio value without calling external APIs.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="wallet_valuations"
+    )
+    address = models.CharField(
+        max_length=255,
+        help_text="The wallet address, as registered by the user."
+    )
+    value = models.DecimalField(
+        max_digits=20,
+        decimal_places=2,
+        default=0.00,
+        help_text="The value of the wallet's tokens in USD."
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("user", "address")
+
+    def __str__(self):
+        return f"{self.user.username}'s wallet {self.address}: ${self.value}"
+
+
+class PortfolioSnapshot(models.Model):
+    """
+    One point of a user's portfolio value history: the average value over an
+    hour, day or week starting at `bucket` (UTC). Hourly snapshots are written by
+    the portfolio task and downsampled into daily and weekly ones, and each
+    resolution is only kept for a limited time (see profiles.history).
+    """
+    RESOLUTION_HOUR = "hour"
+    RESOLUTION_DAY = "day"
+    RESOLUTION_WEEK = "week"
+    RESOLUTION_CHOICES = [
+        (RESOLUTION_HOUR, "Hourly"),
+        (RESOLUTION_DAY, "Daily"),
+        (RESOLUTION_WEEK, "Weekly"),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="portfolio_snapshots",
+        # Lookups by user are served by the unique index below
+        db_index=False,
+    )
+    resolution = models.CharField(
+        max_length=4,
+        choices=RESOLUTION_CHOICES,
+    )
+    bucket = models.DateTimeField(
+        help_text="The start of the hour, day or week the value covers."
+    )
+    value = models.DecimalField(
+        max_digits=20,
+        decimal_places=2,
+        help_text="The average portfolio value over the bucket in USD."
+    )
+
+    class Meta:
+        constraints = [
+            # Serves chart range scans by (user, resolution, bucket)
+            models.UniqueConstraint(
+                fields=["user", "resolution", "bucket"],
+                name="portfolio_snapshot_bucket_unique",
+            ),
+        ]
+        indexes = [
+            # Serves downsampling and retention, which scan a resolution by time
+            models.Index(fields=["resolution", "bucket"], name="portfolio_snapshot_time_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}'s {self.resolution} from {self.bucket}: ${self.value}"
+
+
+class TokenMetadata(models.Model):
+    """
+    Stores ERC20 token metadata fetched from Alchemy, so balances can be
+    converted with the token's real number of decimals.
+    """
+    contract_address = models.CharField(
+        max_length=42,
+        unique=True,
+        help_text="The token contract address (lowercase)."
+    )
+    decimals = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        help_text="Number of decimals the token uses, if known."
+    )
+    symbol = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="The token's ticker symbol."
+    )
+    name = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text="The token's name."
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Token metadata"
+
+    def __str__(self):
+        return f"{self.symbol or self.contract_address} ({self.decimals} decimals)"
+
+
+class NftMedia(models.Model):
+    """
+    Tracks locally generated thumbnails for an NFT image URL.
+    Thumbnails are stored under content-hash filenames, so identical images
+    shared by many NFTs or wallets are only stored once.
+    """
+    STATUS_PENDING = "pending"
+    STATUS_READY = "ready"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_READY, "Ready"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    source_url = models.TextField(
+        help_text="The original URL of the NFT image."
+    )
+    source_url_hash = models.CharField(
+        max_length=64,
+        unique=True,
+        help_text="SHA-256 of the source URL, used for lookups."
+    )
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="SHA-256 of the downloaded image, used to name the thumbnails."
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="Number of failed attempts to generate the thumbnails."
+    )
+    retry_after = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When a failed image may be tried again; empty if it won't be."
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "NFT media"
+
+    def __str__(self):
+        return f"{self.source_url} ({self.get_status_display()})"
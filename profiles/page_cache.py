@@ -0,0 +1,112 @@
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+
+# Rendered profile pages are cached per username and viewer variant:
+#   "anonymous" - the full page, as seen by logged-out visitors
+#   "visitor"   - the profile content, as seen by other logged-in users
+#   "owner"     - the profile content, as seen by the profile's owner
+# Each entry records the versions it was rendered from: the user's (keyed by username,
+# so it can be read before the user is loaded), the profile's (any change to the user
+# or their links/addresses) and the wallet's (their cached balances/NFTs). Bumping a
+# version makes every entry rendered from the old version a miss.
+
+
+def _page_key(username: str, variant: str) -> str:
+    return f"profile_page_{username}_{variant}"
+
+
+def _user_version_key(username: str) -> str:
+    return f"profile_user_version_{username}"
+
+
+def _profile_version_key(user_id: int) -> str:
+    return f"profile_version_{user_id}"
+
+
+def _wallet_version_key(wallet_address: str) -> str:
+    return f"wallet_version_{wallet_address.lower()}"
+
+
+def _version_keys(user_id: int, wallet_address: str | None) -> list[str]:
+    keys = [_profile_version_key(user_id)]
+    if wallet_address:
+        keys.append(_wallet_version_key(wallet_address))
+    return keys
+
+
+def invalidate_profile(user_id: int, username: str | None = None) -> None:
+    """
+    Invalidates all cached pages of a user's profile. Pass the username when the
+    user itself changed.
+    """
+    invalidate_profiles([(user_id, username)])
+
+
+def invalidate_profiles(users) -> None:
+    """
+    Invalidates all cached pages of several (user id, username) users' profiles at once.
+    """
+    versions = {}
+    for user_id, username in users:
+        versions[_profile_version_key(user_id)] = uuid.uuid4().hex
+        if username:
+            versions[_user_version_key(username)] = uuid.uuid4().hex
+    if versions:
+        # Versions only need to outlive the pages rendered from them
+        cache.set_many(versions, timeout=settings.PROFILE_PAGE_CACHE_TIMEOUT)
+
+
+def invalidate_wallets(wallet_addresses) -> None:
+    """
+    Invalidates cached profile pages showing any of the given wallets' balances or NFTs.
+    """
+    versions = {_wallet_version_key(address): uuid.uuid4().hex for address in wallet_addresses}
+    if versions:
+        cache.set_many(versions, timeout=settings.PROFILE_PAGE_CACHE_TIMEOUT)
+
+
+async def aget_user_version(username: str) -> dict:
+    """
+    Returns the current version of the user a profile page would be rendered from.
+    Read it before loading the user, so a change saved meanwhile invalidates the
+    page being stored.
+    """
+    key = _user_version_key(username)
+    return {key: await cache.aget(key)}
+
+
+async def aget_profile_versions(user_id: int, wallet_address: str | None) -> dict:
+    """
+    Returns the current versions of the profile and wallet a page would be rendered
+    from. Read these before loading the rest of the page's data (links, addresses,
+    balances, NFTs), so changes made while rendering invalidate the page being stored.
+    """
+    keys = _version_keys(user_id, wallet_address)
+    current = await cache.aget_many(keys)
+    return {key: current.get(key) for key in keys}
+
+
+async def aget_cached_profile_page(username: str, variant: str) -> str | None:
+    """
+    Returns the cached HTML for a profile page variant, or None if it is missing or stale.
+    """
+    entry = await cache.aget(_page_key(username, variant))
+    if entry is None:
+        return None
+
+    current = await cache.aget_many(list(entry["versions"]))
+    if any(current.get(key) != version for key, version in entry["versions"].items()):
+        return None
+    return entry["html"]
+
+
+async def aset_cached_profile_page(username: str, variant: str, html: str, versions: dict) -> None:
+    """
+    Caches the HTML for a profile page variant, tagged with the versions it was rendered from.
+    """
+    await cache.aset(
+        _page_key(username, variant),
+        {"html": str(html), "versions": versions},
+        timeout=settings.PROFILE_PAGE_CACHE_TIMEOUT,
+    )
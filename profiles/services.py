@@ -1,18 +1,61 @@
 import logging
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 from django.conf import settings
 from django.core.cache import cache
+from .http_client import get_http_client
+from .models import TokenMetadata
+from .page_cache import invalidate_wallets
 
 logger = logging.getLogger(__name__)
 
-ALCHEMY_URL = f"https://eth-mainnet.g.alchemy.com/v2/{settings.ALCHEMY_API_KEY}"
-COINGECKO_API_URL = "https://api.coingecko.com/api/v3"
+ALCHEMY_URL = f"{settings.ALCHEMY_BASE_URL}/v2/{settings.ALCHEMY_API_KEY}"
+ALCHEMY_NFT_URL = f"{settings.ALCHEMY_BASE_URL}/nft/v2/{settings.ALCHEMY_API_KEY}"
+COINGECKO_API_URL = settings.COINGECKO_API_URL
 
 
-def get_token_balances(wallet_address: str) -> list:
+def _parse_token_balances(wallet_address: str, data: dict) -> list | None:
+    """
+    Extracts the non-zero token balances from a single JSON-RPC response object.
+    Returns None if the response is an error.
+    """
+    if "error" in data:
+        logger.error(f"Alchemy API error for {wallet_address}: {data['error']}")
+        return None
+
+    balances = (data.get("result") or {}).get("tokenBalances", [])
+    # Filter out tokens with a zero balance
+    return [b for b in balances if int(b.get("tokenBalance") or "0x0", 16) > 0]
+
+
+def _token_balances_cache_key(wallet_address: str) -> str:
+    return f"token_balances_{wallet_address.lower()}"
+
+
+def _store_token_balances(balances_by_wallet: dict) -> None:
+    """
+    Caches freshly fetched balances along with the time they were fetched.
+    Entries are kept for TOKEN_BALANCES_STALE_IF_ERROR so a last good value
+    can be served while Alchemy is failing. Cached profile pages showing
+    these wallets are invalidated.
+    """
+    fetched_at = time.time()
+    cache.set_many(
+        {
+            _token_balances_cache_key(wallet_address): {"balances": balances, "fetched_at": fetched_at}
+            for wallet_address, balances in balances_by_wallet.items()
+        },
+        timeout=settings.TOKEN_BALANCES_STALE_IF_ERROR,
+    )
+    invalidate_wallets(balances_by_wallet)
+
+
+def _fetch_token_balances(wallet_address: str, deadline: float | None = None) -> list | None:
     """
     Fetches ERC20 token balances for a given wallet address using Alchemy API.
+    Returns None if the request failed or didn't finish within `deadline` seconds.
     """
     payload = {
         "jsonrpc": "2.0",
@@ -23,20 +66,254 @@ def get_token_balances(wallet_address: str) -> list:
     headers = {"Content-Type": "application/json"}
 
     try:
-        response = requests.post(ALCHEMY_URL, json=payload, headers=headers)
+        response = get_http_client().post(ALCHEMY_URL, json=payload, headers=headers, deadline=deadline)
         response.raise_for_status()
-        data = response.json()
+        return _parse_token_balances(wallet_address, response.json())
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.error(f"Error calling Alchemy API for {wallet_address}: {e}")
+        return None
 
-        if "error" in data:
-            logger.error(f"Alchemy API error for {wallet_address}: {data['error']}")
-            return []
 
-        balances = data.get("result", {}).get("tokenBalances", [])
-        # Filter out tokens with a zero balance
-        return [b for b in balances if int(b.get("tokenBalance", 0), 16) > 0]
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error calling Alchemy API for {wallet_address}: {e}")
+def refresh_token_balances(wallet_address: str, deadline: float | None = None) -> list | None:
+    """
+    Fetches balances for a wallet and stores them in the cache if the fetch succeeded.
+    """
+    balances = _fetch_token_balances(wallet_address, deadline=deadline)
+    if balances is not None:
+        _store_token_balances({wallet_address: balances})
+    return balances
+
+
+def _schedule_token_balances_refresh(wallet_address: str) -> None:
+    """
+    Queues a background refresh of a wallet's balances, at most once per
+    TOKEN_BALANCES_SOFT_TTL for the same wallet.
+    """
+    lock_key = f"{_token_balances_cache_key(wallet_address)}_refreshing"
+    if not cache.add(lock_key, True, timeout=settings.TOKEN_BALANCES_SOFT_TTL):
+        return
+
+    from .tasks import refresh_wallet_token_balances
+
+    try:
+        refresh_wallet_token_balances.delay(wallet_address)
+    except Exception as e:
+        cache.delete(lock_key)
+        logger.error(f"Could not queue a balance refresh for {wallet_address}: {e}")
+
+
+def get_token_balances(wallet_address: str, deadline: float | None = None) -> list:
+    """
+    Returns ERC20 token balances for a given wallet address, with stale-while-revalidate caching.
+
+    Balances younger than TOKEN_BALANCES_SOFT_TTL are served from the cache. Up to
+    TOKEN_BALANCES_HARD_TTL the cached balances are still served, while a background
+    refresh is queued. Older balances are refetched from Alchemy, giving up after
+    `deadline` seconds, and if that fails the last good balances are served instead
+    of an empty list.
+    """
+    entry = cache.get(_token_balances_cache_key(wallet_address))
+    if entry is not None:
+        age = time.time() - entry["fetched_at"]
+        if age < settings.TOKEN_BALANCES_SOFT_TTL:
+            return entry["balances"]
+        if age < settings.TOKEN_BALANCES_HARD_TTL:
+            _schedule_token_balances_refresh(wallet_address)
+            return entry["balances"]
+
+    balances = refresh_token_balances(wallet_address, deadline)
+    if balances is None:
+        if entry is not None:
+            logger.warning(f"Serving balances for {wallet_address} fetched {age:.0f}s ago.")
+            return entry["balances"]
         return []
+    return balances
+
+
+def get_token_balances_fetched_since(wallet_addresses: list[str], since: float) -> dict:
+    """
+    Returns the cached balances of those wallets that were fetched at or after
+    the `since` timestamp, in a single cache round trip. Wallets without such
+    balances are left out.
+    """
+    keys = {_token_balances_cache_key(wallet_address): wallet_address for wallet_address in wallet_addresses}
+    return {
+        keys[key]: entry["balances"]
+        for key, entry in cache.get_many(list(keys)).items()
+        if entry["fetched_at"] >= since
+    }
+
+
+def _alchemy_batch(method: str, params_list: list[list]) -> list[dict]:
+    """
+    Sends one JSON-RPC batch request with a `method` call for each entry of `params_list`.
+    Responses are matched back by their request id and returned in the same order as
+    `params_list`, so an error for one item doesn't affect the others. Items that got
+    no response (or whose whole batch failed) are returned as error objects.
+    """
+    payload = [
+        {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}
+        for request_id, params in enumerate(params_list)
+    ]
+    headers = {"Content-Type": "application/json"}
+    results = [{"error": "No response in batch."}] * len(params_list)
+
+    try:
+        response = get_http_client().post(ALCHEMY_URL, json=payload, headers=headers)
+        response.raise_for_status()
+        data = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.error(f"Error calling Alchemy API {method} for a batch of {len(params_list)}: {e}")
+        return [{"error": str(e)}] * len(params_list)
+
+    if not isinstance(data, list):
+        # The whole batch was rejected, e.g. because it was too large
+        logger.error(f"Alchemy API rejected a {method} batch of {len(params_list)}: {data}")
+        return [{"error": data}] * len(params_list)
+
+    for item in data:
+        request_id = item.get("id")
+        if not isinstance(request_id, int) or not 0 <= request_id < len(params_list):
+            logger.warning(f"Ignoring Alchemy response with unknown id: {request_id!r}")
+            continue
+        results[request_id] = item
+    return results
+
+
+def _run_in_batches(batch_func, items: list, batch_size: int) -> dict:
+    """
+    Splits `items` into batches of `batch_size` and runs `batch_func` on up to
+    ALCHEMY_MAX_CONCURRENCY batches in parallel. Each call returns a dict; the
+    merged dict is returned.
+    """
+    if not items:
+        return {}
+
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    results = {}
+    max_workers = min(settings.ALCHEMY_MAX_CONCURRENCY, len(batches))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="alchemy") as executor:
+        for batch_results in executor.map(batch_func, batches):
+            results.update(batch_results)
+    return results
+
+
+def _get_token_balances_batch(wallet_addresses: list[str]) -> dict:
+    """
+    Fetches token balances for a batch of wallets in a single JSON-RPC batch request.
+    Successfully fetched balances also refresh the per-wallet cache used by profile pages;
+    wallets whose lookup failed get None.
+    """
+    items = _alchemy_batch(
+        "alchemy_getTokenBalances", [[wallet_address, "erc20"] for wallet_address in wallet_addresses]
+    )
+    fetched = {}
+    for wallet_address, item in zip(wallet_addresses, items):
+        balances = _parse_token_balances(wallet_address, item)
+        if balances is not None:
+            fetched[wallet_address] = balances
+    _store_token_balances(fetched)
+    return {wallet_address: fetched.get(wallet_address) for wallet_address in wallet_addresses}
+
+
+def get_token_balances_many(wallet_addresses: list[str], batch_size: int | None = None) -> dict:
+    """
+    Fetches ERC20 token balances for many wallet addresses.
+    Wallets are packed into JSON-RPC batches of `batch_size` (default: ALCHEMY_BATCH_SIZE),
+    and up to ALCHEMY_MAX_CONCURRENCY batches are sent in parallel over the shared client.
+    Returns a dict mapping each wallet address to its list of non-zero balances, or
+    to None if its lookup failed.
+    """
+    # Preserve order while dropping duplicate addresses
+    addresses = list(dict.fromkeys(wallet_addresses))
+    return _run_in_batches(_get_token_balances_batch, addresses, batch_size or settings.ALCHEMY_BATCH_SIZE)
+
+
+# In-process read-through cache of TokenMetadata rows, keyed by lowercase contract address.
+# Token metadata practically never changes, so entries are kept until the cache fills up.
+_token_metadata_cache = {}
+TOKEN_METADATA_CACHE_MAX_SIZE = 50_000
+
+
+def _get_token_metadata_batch(contract_addresses: list[str]) -> dict:
+    """
+    Fetches metadata for a batch of token contracts in a single JSON-RPC batch request.
+    Tokens whose lookup failed are left out, so they are retried on the next call.
+    """
+    items = _alchemy_batch("alchemy_getTokenMetadata", [[address] for address in contract_addresses])
+
+    metadata = {}
+    for address, item in zip(contract_addresses, items):
+        if "error" in item:
+            logger.error(f"Alchemy API error fetching metadata for {address}: {item['error']}")
+            continue
+        result = item.get("result") or {}
+        metadata[address] = TokenMetadata(
+            contract_address=address,
+            decimals=result.get("decimals"),
+            symbol=(result.get("symbol") or "")[:64],
+            name=(result.get("name") or "")[:255],
+        )
+    return metadata
+
+
+def get_token_metadata_many(contract_addresses: list[str], fetch_missing: bool = True) -> dict:
+    """
+    Returns a dict mapping lowercase contract addresses to TokenMetadata.
+    Lookups go through an in-process cache, then the database. Contracts not seen
+    before are fetched from Alchemy in batches and stored, unless `fetch_missing`
+    is False (e.g. while serving a page), in which case they are left out.
+    """
+    addresses = {address.lower() for address in contract_addresses}
+    metadata = {a: _token_metadata_cache[a] for a in addresses if a in _token_metadata_cache}
+
+    missing = sorted(addresses - metadata.keys())
+    if missing:
+        for token in TokenMetadata.objects.filter(contract_address__in=missing):
+            metadata[token.contract_address] = token
+        missing = [a for a in missing if a not in metadata]
+
+    if missing and fetch_missing:
+        logger.info(f"Fetching metadata for {len(missing)} tokens from Alchemy.")
+        fetched = _run_in_batches(_get_token_metadata_batch, missing, settings.ALCHEMY_BATCH_SIZE)
+        TokenMetadata.objects.bulk_create(fetched.values(), ignore_conflicts=True)
+        metadata.update(fetched)
+
+    if len(_token_metadata_cache) + len(metadata) > TOKEN_METADATA_CACHE_MAX_SIZE:
+        _token_metadata_cache.clear()
+    _token_metadata_cache.update(metadata)
+    return metadata
+
+
+def to_token_amount(raw_balance: str, decimals: int) -> Decimal:
+    """
+    Converts a raw hex token balance into a token amount using the token's decimals.
+    """
+    return Decimal(int(raw_balance, 16)).scaleb(-decimals)
+
+
+def describe_token_balances(balances: list) -> list:
+    """
+    Annotates Alchemy token balances with symbol, name and a decimal `amount`,
+    using only stored token metadata (no API calls). `amount` is None when the
+    token's decimals are not known yet.
+    """
+    metadata = get_token_metadata_many(
+        [b["contractAddress"] for b in balances], fetch_missing=False
+    )
+    described = []
+    for balance in balances:
+        token = metadata.get(balance["contractAddress"].lower())
+        described.append({
+            **balance,
+            "symbol": token.symbol if token else "",
+            "name": token.name if token else "",
+            "amount": (
+                to_token_amount(balance["tokenBalance"], token.decimals)
+                if token and token.decimals is not None else None
+            ),
+        })
+    return described
 
 
 def get_token_prices(token_addresses: list[str]) -> dict:
@@ -67,7 +344,7 @@ def get_token_prices(token_addresses: list[str]) -> dict:
         }
 
         try:
-            response = requests.get(url, params=params)
+            response = get_http_client().get(url, params=params)
             response.raise_for_status()
             new_prices_data = response.json()
 
@@ -91,30 +368,71 @@ def get_token_prices(token_addresses: list[str]) -> dict:
     return prices
 
 
-def get_nfts(wallet_address: str) -> list:
+def _compact_nft(nft: dict) -> dict:
+    """
+    Keeps only the NFT fields the gallery needs, so cached pages stay small.
+    """
+    media = nft.get("media") or [{}]
+    metadata = nft.get("metadata") or {}
+    return {
+        "title": nft.get("title") or "",
+        "contractAddress": (nft.get("contract") or {}).get("address", ""),
+        "tokenId": (nft.get("id") or {}).get("tokenId", ""),
+        # Alchemy's gateway URL resolves ipfs:// and similar links
+        "image": media[0].get("gateway") or metadata.get("image") or "",
+    }
+
+
+def get_nft_page(
+    wallet_address: str, page_key: str | None = None, deadline: float | None = None
+) -> tuple[list, str | None]:
     """
-    Fetches NFTs for a given wallet address using Alchemy API.
-    Results are cached for 10 minutes.
+    Fetches one page of NFTs for a given wallet address using Alchemy API, giving
+    up after `deadline` seconds. Returns the page's NFTs and the key of the next
+    page (None on the last page). Each page is cached separately for 10 minutes.
     """
-    cache_key = f"nfts_{wallet_address}"
-    cached_nfts = cache.get(cache_key)
-    if cached_nfts is not None:
-        return cached_nfts
+    cache_key = f"nfts_{wallet_address.lower()}_{page_key or 'first'}"
+    cached_page = cache.get(cache_key)
+    if cached_page is not None:
+        return cached_page
 
-    url = f"https://eth-mainnet.g.alchemy.com/nft/v2/{settings.ALCHEMY_API_KEY}/getNFTs"
-    params = {"owner": wallet_address}
+    url = f"{ALCHEMY_NFT_URL}/getNFTs"
+    params = {"owner": wallet_address, "pageSize": settings.NFT_PAGE_SIZE}
+    if page_key:
+        params["pageKey"] = page_key
 
     try:
-        response = requests.get(url, params=params)
+        response = get_http_client().get(url, params=params, deadline=deadline)
         response.raise_for_status()
         data = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.error(f"Error calling Alchemy NFT API for {wallet_address}: {e}")
+        return [], None
 
-        owned_nfts = data.get("ownedNfts", [])
+    page = ([_compact_nft(nft) for nft in data.get("ownedNfts", [])], data.get("pageKey"))
 
-        # Cache the result
-        cache.set(cache_key, owned_nfts, timeout=60 * 10) # Cache for 10 minutes
+    # Cache the result
+    cache.set(cache_key, page, timeout=60 * 10) # Cache for 10 minutes
+    if not page_key:
+        # Profile pages show the first page of the gallery
+        invalidate_wallets([wallet_address])
+    return page
 
-        return owned_nfts
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error calling Alchemy NFT API for {wallet_address}: {e}")
-        return []
+
+def iter_nfts(wallet_address: str):
+    """
+    Yields all NFTs of a wallet, fetching (or reading from cache) one page at a time.
+    """
+    page_key = None
+    while True:
+        nfts, page_key = get_nft_page(wallet_address, page_key)
+        yield from nfts
+        if not page_key:
+            return
+
+
+def get_nfts(wallet_address: str) -> list:
+    """
+    Returns the first page of NFTs for a given wallet address.
+    """
+    return get_nft_page(wallet_address)[0]
@@ -0,0 +1,61 @@
+import logging
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import leaderboard
+from .models import Address, SnsLink
+from .page_cache import invalidate_profile
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_profile(sender, instance, **kwargs):
+    """
+    Invalidates the cached profile pages of a user whenever the user changes.
+    """
+    invalidate_profile(instance.pk, instance.username)
+
+
+@receiver(post_save, sender=SnsLink)
+@receiver(post_delete, sender=SnsLink)
+@receiver(post_save, sender=Address)
+@receiver(post_delete, sender=Address)
+def invalidate_owner_profile(sender, instance, **kwargs):
+    """
+    Invalidates the cached profile pages of the user owning a link or address.
+    """
+    invalidate_profile(instance.user_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def update_leaderboard_membership(sender, instance, update_fields=None, **kwargs):
+    """
+    Keeps public users on the leaderboard and non-public users off it. Saves that
+    can't have made the user public only update users already on it.
+    """
+    if update_fields is not None and not {"is_public", "portfolio_value"} & set(update_fields):
+        return
+
+    try:
+        if instance.is_public:
+            only_existing = update_fields is not None and "is_public" not in update_fields
+            leaderboard.update_scores({instance.pk: instance.portfolio_value}, only_existing=only_existing)
+        else:
+            leaderboard.remove_users([instance.pk])
+    except leaderboard.LeaderboardNotConfigured:
+        pass
+    except leaderboard.LeaderboardUnavailable as e:
+        # The daily rebuild brings the leaderboard back in sync
+        logger.warning(f"Could not update leaderboard for user {instance.pk}: {e}")
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def remove_from_leaderboard(sender, instance, **kwargs):
+    try:
+        leaderboard.remove_users([instance.pk])
+    except leaderboard.LeaderboardNotConfigured:
+        pass
+    except leaderboard.LeaderboardUnavailable as e:
+        logger.warning(f"Could not remove user {instance.pk} from leaderboard: {e}")
@@ -1,70 +1,321 @@
+import datetime
 import logging
+import time
+import uuid
 from decimal import Decimal
-from celery import shared_task
+from celery import chord, shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from accounts import user_cache
 from accounts.models import User
-from .services import get_token_balances, get_token_prices
+from . import history, leaderboard
+from .models import Address, WalletValuation
+from .page_cache import invalidate_profiles
+from .services import (
+    get_token_balances_fetched_since, get_token_balances_many, get_token_metadata_many, get_token_prices,
+    refresh_token_balances, to_token_amount,
+)
+from .thumbnails import generate_thumbnails
 
 logger = logging.getLogger(__name__)
 
+# How long a shard's balances are kept while waiting for the valuation step
+SHARD_BALANCES_TIMEOUT = 60 * 60 * 2
+
+
+def _verified_addresses():
+    """
+    Returns the queryset of additional addresses counted in portfolios.
+    """
+    return Address.objects.filter(currency_type="eth", is_verified=True)
+
+
+def _portfolio_users():
+    """
+    Returns the queryset of users whose portfolio value should be refreshed:
+    active users with a primary wallet or a verified ETH address.
+    """
+    return User.objects.filter(is_active=True).filter(
+        Q(wallet_address__isnull=False) | Exists(_verified_addresses().filter(user=OuterRef("pk")))
+    )
+
+
+def _unique_addresses(addresses) -> list[str]:
+    """
+    Returns the addresses in order, keeping only the first of those differing only in case.
+    """
+    by_lowercase = {}
+    for address in addresses:
+        by_lowercase.setdefault(address.lower(), address)
+    return list(by_lowercase.values())
+
+
+def _user_wallets(users: list) -> dict:
+    """
+    Returns the wallets of each (id, wallet_address) user: the primary wallet
+    followed by their verified ETH addresses, each address listed once
+    regardless of case.
+    """
+    wallets = {user_id: [wallet_address] if wallet_address else [] for user_id, wallet_address in users}
+    verified = _verified_addresses().filter(user_id__in=list(wallets)).order_by("pk")
+    for user_id, address in verified.values_list("user_id", "address"):
+        wallets[user_id].append(address)
+
+    return {user_id: _unique_addresses(addresses) for user_id, addresses in wallets.items()}
+
+
+def _iter_shard_bounds(shard_size: int):
+    """
+    Yields (first_pk, last_pk) bounds for consecutive shards of `shard_size` users,
+    using keyset pagination on the primary key so each query stays cheap.
+    """
+    last_pk = 0
+    while True:
+        pks = list(
+            _portfolio_users()
+            .filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:shard_size]
+        )
+        if not pks:
+            return
+        yield pks[0], pks[-1]
+        last_pk = pks[-1]
+
+
+def _shard_cache_key(run_id: str, first_pk: int) -> str:
+    return f"portfolio_run_{run_id}_{first_pk}"
+
+
+def _calculate_portfolio_value(balances: list, token_prices: dict, token_metadata: dict) -> Decimal:
+    """
+    Calculates the USD value of a list of Alchemy token balances.
+    Tokens without a price or without known decimals are not counted.
+    """
+    total_value = Decimal("0.0")
+    for balance in balances:
+        contract_address = balance["contractAddress"].lower()
+        price = token_prices.get(contract_address)
+        token = token_metadata.get(contract_address)
+
+        if price and token and token.decimals is not None:
+            # Alchemy returns balance in hex, scaled by the token's decimals.
+            total_value += to_token_amount(balance["tokenBalance"], token.decimals) * price
+    return total_value
+
+
+def _update_leaderboard_scores(users: list) -> None:
+    """
+    Writes new portfolio values to the leaderboard. Only users already on it
+    (public users) are updated.
+    """
+    try:
+        leaderboard.update_scores({user.id: user.portfolio_value for user in users}, only_existing=True)
+    except leaderboard.LeaderboardNotConfigured:
+        pass
+    except leaderboard.LeaderboardUnavailable as e:
+        logger.warning(f"Could not update leaderboard scores: {e}")
+
+
 @shared_task
 def update_all_user_portfolios():
     """
     A periodic task that updates the portfolio value for all active users
-    with a registered wallet address.
+    with a registered wallet address, summed over their primary wallet and
+    verified ETH addresses.
+
+    Users are split into shards of PORTFOLIO_SHARD_SIZE. Each shard fetches its
+    balances in its own subtask, and a final chord step prices all tokens once
+    and updates the users shard by shard.
     """
     logger.info("Starting periodic task: update_all_user_portfolios")
 
-    users = User.objects.filter(is_active=True, wallet_address__isnull=False).only("id", "wallet_address")
-    if not users:
+    run_id = uuid.uuid4().hex
+    started_at = time.time()
+    shard_tasks = [
+        fetch_portfolio_shard.s(run_id, first_pk, last_pk, started_at)
+        for first_pk, last_pk in _iter_shard_bounds(settings.PORTFOLIO_SHARD_SIZE)
+    ]
+    if not shard_tasks:
         logger.info("No users with wallet addresses to update.")
         return "No users to update."
 
-    all_balances = {}
-    all_token_addresses = set()
+    chord(shard_tasks)(value_portfolio_shards.s(run_id, started_at))
 
-    # Step 1: Get all balances for all users
-    for user in users:
-        balances = get_token_balances(user.wallet_address)
-        if balances:
-            all_balances[user.id] = balances
-            for balance in balances:
-                all_token_addresses.add(balance["contractAddress"])
-
-    # Step 2: Get all prices for all unique tokens
-    if not all_token_addresses:
-        logger.info("No tokens found for any user.")
-        return "No tokens to price."
-
-    token_prices = get_token_prices(list(all_token_addresses))
-
-    # Step 3: Calculate portfolio value for each user and prepare for bulk update
-    users_to_update = []
-    for user in users:
-        if user.id not in all_balances:
-            continue
+    logger.info(f"Dispatched {len(shard_tasks)} portfolio shards for run {run_id}.")
+    return f"Dispatched {len(shard_tasks)} portfolio shards."
 
-        total_value = Decimal("0.0")
-        for balance in all_balances[user.id]:
-            contract_address = balance["contractAddress"]
-            price = token_prices.get(contract_address.lower())
 
-            if price:
-                # Alchemy returns balance in hex, needs conversion.
-                # Assuming tokens have 18 decimal places for simplicity.
-                # A more robust solution would fetch token metadata for decimals.
-                token_balance_wei = int(balance["tokenBalance"], 16)
-                token_balance_ether = Decimal(token_balance_wei) / Decimal(10**18)
-                total_value += token_balance_ether * price
+@shared_task
+def fetch_portfolio_shard(run_id: str, first_pk: int, last_pk: int, started_at: float) -> dict:
+    """
+    Fetches the token balances of every wallet of one shard of users and stashes
+    them in the cache for the valuation step. Returns the shard id and the tokens it holds.
+
+    Each address is fetched once per run, however many users share it: addresses
+    repeated within the shard are batched once, and balances another shard fetched
+    since the run started are reused from the cache. Users with a wallet whose
+    lookup failed are left out, so they keep their last value rather than losing
+    that wallet's.
+    """
+    users = list(
+        _portfolio_users()
+        .filter(pk__gte=first_pk, pk__lte=last_pk)
+        .values_list("id", "wallet_address")
+    )
+    wallets_by_user = _user_wallets(users)
+    addresses = _unique_addresses(
+        address for user_addresses in wallets_by_user.values() for address in user_addresses
+    )
+
+    balances_by_address = get_token_balances_fetched_since(addresses, started_at)
+    missing = [address for address in addresses if address not in balances_by_address]
+    if missing:
+        balances_by_address.update(get_token_balances_many(missing))
+
+    shard_balances = {}
+    failed = set()
+    token_addresses = set()
+    for address, balances in balances_by_address.items():
+        if balances is None:
+            failed.add(address.lower())
+        elif balances:
+            # Only keep the fields needed for valuation
+            shard_balances[address.lower()] = [
+                {"contractAddress": b["contractAddress"], "tokenBalance": b["tokenBalance"]}
+                for b in balances
+            ]
+            token_addresses.update(b["contractAddress"].lower() for b in balances)
+    shard_wallets = {
+        user_id: user_addresses
+        for user_id, user_addresses in wallets_by_user.items()
+        if not any(address.lower() in failed for address in user_addresses)
+    }
 
-        user.portfolio_value = total_value
-        users_to_update.append(user)
+    cache.set(
+        _shard_cache_key(run_id, first_pk),
+        {"wallets": shard_wallets, "balances": shard_balances},
+        timeout=SHARD_BALANCES_TIMEOUT,
+    )
+    logger.info(
+        f"Fetched balances for {len(shard_wallets)} of {len(users)} users in shard {first_pk}-{last_pk} "
+        f"({len(missing)} of {len(addresses)} addresses from Alchemy, {len(failed)} failed)."
+    )
+    return {"shard": first_pk, "tokens": sorted(token_addresses)}
 
-    # Step 4: Bulk update all users
-    if users_to_update:
+
+def _save_shard_valuations(users_to_update: list, valuations: list, valued_at: datetime.datetime) -> None:
+    """
+    Writes the new portfolio values of a shard's users, replaces their per-wallet
+    breakdown and records the values in their history.
+    """
+    user_ids = [user.id for user in users_to_update]
+    with transaction.atomic():
         User.objects.bulk_update(users_to_update, ["portfolio_value"])
-        logger.info(f"Successfully updated portfolio value for {len(users_to_update)} users.")
+        WalletValuation.objects.filter(user_id__in=user_ids).delete()
+        WalletValuation.objects.bulk_create(valuations)
+        history.record_snapshots({user.id: user.portfolio_value for user in users_to_update}, valued_at)
+    # bulk_update sends no save signals
+    user_cache.invalidate(user_ids)
+    invalidate_profiles(User.objects.filter(pk__in=user_ids).values_list("pk", "username"))
+
+
+@shared_task
+def value_portfolio_shards(shard_results: list, run_id: str, started_at: float) -> str:
+    """
+    The final chord step: prices every token held across all shards with a single
+    lookup, loads their decimals (fetching only unseen tokens), then values each
+    wallet once and updates the users, their per-wallet breakdown and their history
+    one shard at a time. The history records the values as of the run's start.
+    """
+    all_token_addresses = set()
+    for result in shard_results:
+        all_token_addresses.update(result["tokens"])
+
+    cache_keys = [_shard_cache_key(run_id, result["shard"]) for result in shard_results]
+    token_prices, token_metadata = {}, {}
+    # Without any tokens, every wallet is still valued, at 0
+    if all_token_addresses:
+        token_prices = get_token_prices(sorted(all_token_addresses))
+        token_metadata = get_token_metadata_many(sorted(all_token_addresses))
+
+    updated_count = 0
+    for cache_key in cache_keys:
+        shard = cache.get(cache_key)
+        if shard is None:
+            logger.warning(f"Balances for {cache_key} expired before valuation.")
+            continue
+
+        values_by_address = {
+            address: _calculate_portfolio_value(balances, token_prices, token_metadata)
+            for address, balances in shard["balances"].items()
+        }
+        users_to_update = []
+        valuations = []
+        for user_id, addresses in shard["wallets"].items():
+            wallet_values = {address: values_by_address.get(address.lower(), Decimal("0.0")) for address in addresses}
+            users_to_update.append(User(id=user_id, portfolio_value=sum(wallet_values.values(), Decimal("0.0"))))
+            valuations.extend(
+                WalletValuation(user_id=user_id, address=address, value=value)
+                for address, value in wallet_values.items()
+            )
+        if users_to_update:
+            _save_shard_valuations(
+                users_to_update, valuations, datetime.datetime.fromtimestamp(started_at, datetime.timezone.utc)
+            )
+            updated_count += len(users_to_update)
+            _update_leaderboard_scores(users_to_update)
+        cache.delete(cache_key)
+
+    if updated_count:
+        logger.info(f"Successfully updated portfolio value for {updated_count} users.")
     else:
         logger.info("No user portfolios were updated.")
 
     logger.info("Finished periodic task: update_all_user_portfolios")
-    return f"Updated portfolio value for {len(users_to_update)} users."
+    return f"Updated portfolio value for {updated_count} users."
+
+
+@shared_task(ignore_result=True)
+def refresh_wallet_token_balances(wallet_address: str):
+    """
+    Refreshes the cached token balances of a single wallet.
+    Queued by get_token_balances when it serves stale balances.
+    """
+    refresh_token_balances(wallet_address)
+
+
+@shared_task(ignore_result=True)
+def generate_nft_thumbnails(source_url: str):
+    """
+    Downloads an NFT image and stores its resized thumbnails.
+    Queued the first time an image is shown in a gallery.
+    """
+    generate_thumbnails(source_url)
+
+
+@shared_task
+def compact_portfolio_history():
+    """
+    A periodic task that downsamples the portfolio history of completed days and
+    weeks, then deletes the snapshots that are past their retention.
+    """
+    now = timezone.now()
+    written = history.downsample(now)
+    deleted = history.apply_retention(now)
+    logger.info(f"Compacted portfolio history: wrote {written}, deleted {deleted} snapshots.")
+    return f"Wrote {sum(written.values())} and deleted {sum(deleted.values())} snapshots."
+
+
+@shared_task
+def rebuild_leaderboard():
+    """
+    A periodic task that rebuilds the portfolio leaderboard from the database,
+    correcting any drift from missed updates.
+    """
+    count = leaderboard.rebuild()
+    logger.info(f"Rebuilt leaderboard with {count} users.")
+    return f"Rebuilt leaderboard with {count} users."
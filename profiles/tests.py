@@ -1,8 +1,38 @@
+import datetime
+import hashlib
+import json
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO
 from unittest.mock import patch, MagicMock
 from decimal import Decimal
+import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import BaseAdapter, HTTPAdapter
+from PIL import Image
+from django.conf import settings
 from django.test import TestCase, override_settings
+from django.urls import reverse
 from django.core.cache import cache
-from .services import get_token_balances, get_token_prices, get_nfts
+from django.utils import timezone
+from accounts.models import User
+from linkus_app.celery import app as celery_app
+from linkus_app.testing import FakeRedis, real_redis
+from . import history, leaderboard, page_cache
+from linkus_app.pagination import InvalidCursor, decode_cursor, encode_cursor
+from .http_client import HttpClient, PublicAddressAdapter, set_media_http_client
+from .models import Address, NftMedia, PortfolioSnapshot, SnsLink, TokenMetadata, WalletValuation
+from .services import (
+    _token_metadata_cache, get_token_balances, get_token_balances_many, get_token_metadata_many,
+    get_token_prices, get_nft_page, get_nfts, iter_nfts,
+)
+from .tasks import compact_portfolio_history, update_all_user_portfolios
+from .views import UPSTREAM_DEADLINE_SHARE
+from .thumbnails import attach_thumbnails, generate_thumbnails, thumbnail_name
 
 # A sample successful response from Alchemy's getTokenBalances
 MOCK_ALCHEMY_BALANCES_SUCCESS = {
@@ -31,13 +61,177 @@ MOCK_ALCHEMY_NFTS_SUCCESS = {
     ]
 }
 
+# Python emulations of the profiles.leaderboard scripts, for FakeRedis.
+# RedisLeaderboardTest runs the leaderboard tests against the real scripts.
+
+def _update(redis, keys, args):
+    leaderboard_key, pending_key = keys
+    built_member, mode = args[:2]
+    built = built_member in redis.data.get(leaderboard_key, {})
+    for score, member in zip(args[2::2], args[3::2]):
+        if pending_key in redis.data:
+            redis.hset(pending_key, member, f"{mode}:{score}")
+        if built:
+            redis.zadd(leaderboard_key, {member: score}, xx=mode == "x")
+    return int(built)
+
+
+def _remove(redis, keys, args):
+    leaderboard_key, pending_key = keys
+    for member in args:
+        if pending_key in redis.data:
+            redis.hset(pending_key, member, "r")
+        redis.zrem(leaderboard_key, member)
+    return 0
+
+
+def _finish_rebuild(redis, keys, args):
+    building_key, pending_key, leaderboard_key = keys
+    for member, change in redis.data.pop(pending_key, {}).items():
+        if change == "r":
+            redis.zrem(building_key, member)
+        elif change:
+            redis.zadd(building_key, {member: change[2:]}, xx=change[0] == "x")
+    redis.zadd(building_key, {args[0]: float("-inf")})
+    redis.data[leaderboard_key] = redis.data.pop(building_key)
+    return 0
+
+
+LEADERBOARD_SCRIPTS = {
+    leaderboard.UPDATE_SCRIPT: _update,
+    leaderboard.REMOVE_SCRIPT: _remove,
+    leaderboard.FINISH_REBUILD_SCRIPT: _finish_rebuild,
+}
+
+
+class StubTransport(BaseAdapter):
+    """
+    A requests transport that answers from a list of canned (status, body) or
+    (status, body, headers) responses.
+    """
+    def __init__(self, responses):
+        super().__init__()
+        self.responses = list(responses)
+        self.sent = []
+        self.timeouts = []
+
+    def send(self, request, **kwargs):
+        self.sent.append(request)
+        self.timeouts.append(kwargs.get("timeout"))
+        status_code, body, *headers = self.responses.pop(0)
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers.update(*headers)
+        if isinstance(body, bytes):
+            response.raw = BytesIO(body)
+        else:
+            response._content = json.dumps(body).encode()
+            response.headers["Content-Type"] = "application/json"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class HttpClientTest(TestCase):
+
+    @patch('profiles.http_client.time.sleep')
+    def test_retries_rate_limited_responses(self, mock_sleep):
+        """Test that 429/5xx responses are retried with backoff until success."""
+        transport = StubTransport([(429, {}), (503, {}), (200, {"ok": True})])
+        client = HttpClient(transport=transport, max_retries=2)
+
+        response = client.get("http://stub.local/ping")
+
+        self.assertEqual(response.json(), {"ok": True})
+        self.assertEqual(len(transport.sent), 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    @patch('profiles.http_client.time.sleep')
+    def test_gives_up_after_max_retries(self, mock_sleep):
+        """Test that the last failing response is returned once retries run out."""
+        transport = StubTransport([(500, {}), (500, {})])
+        client = HttpClient(transport=transport, max_retries=1)
+
+        response = client.post("http://stub.local/rpc", json={})
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(transport.sent), 2)
+
+    @patch('profiles.http_client.time.sleep')
+    @patch.object(HttpClient, '_backoff', return_value=5.0)
+    def test_deadline_caps_timeouts_and_retries(self, mock_backoff, mock_sleep):
+        """Test that a request with a deadline doesn't wait or retry past it."""
+        transport = StubTransport([(503, {}), (200, {})])
+        client = HttpClient(transport=transport, timeout=(3.05, 10.0), max_retries=2)
+
+        response = client.get("http://stub.local/ping", deadline=1.0)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(transport.sent), 1)
+        self.assertTrue(all(t <= 1.0 for t in transport.timeouts[0]))
+        mock_sleep.assert_not_called()
+
+    def test_public_address_adapter_connects_to_the_checked_address(self):
+        """Test that the host is resolved once and the connection pinned to it, keeping the Host header."""
+        received_hosts = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                received_hosts.append(self.headers["Host"])
+                self.send_response(200)
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"ok")
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        port = server.server_address[1]
+        client = HttpClient(transport=PublicAddressAdapter(), max_retries=0)
+
+        # The name doesn't exist, so the connection can't have looked it up again
+        real_getaddrinfo = socket.getaddrinfo
+        lookups = []
+
+        def resolve(host, *args, **kwargs):
+            if host != "media.invalid":
+                return real_getaddrinfo(host, *args, **kwargs)
+            lookups.append(host)
+            return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", ("127.0.0.1", port))]
+        with patch('profiles.http_client.socket.getaddrinfo', side_effect=resolve), \
+                patch('profiles.http_client.is_public_address', return_value=True):
+            response = client.get(f"http://media.invalid:{port}/image.png")
+
+        self.assertEqual(response.content, b"ok")
+        self.assertEqual(received_hosts, [f"media.invalid:{port}"])
+        self.assertEqual(lookups, ["media.invalid"])
+
+    def test_public_address_adapter_keeps_the_tls_server_name(self):
+        request = requests.Request("GET", "https://media.example/image.png").prepare()
+        request.pinned_address = "93.184.215.14"
+
+        host_params, pool_kwargs = PublicAddressAdapter().build_connection_pool_key_attributes(request, True)
+
+        self.assertEqual(host_params["host"], "93.184.215.14")
+        self.assertEqual(pool_kwargs["server_hostname"], "media.example")
+        self.assertEqual(pool_kwargs["assert_hostname"], "media.example")
+
+
 @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
 class ServicesTest(TestCase):
 
     def setUp(self):
         cache.clear()
+        _token_metadata_cache.clear()
 
-    @patch('profiles.services.requests.post')
+    @patch('profiles.http_client.HttpClient.post')
     def test_get_token_balances_success(self, mock_post):
         """Test successful fetching of token balances."""
         # Configure the mock to return a success response
@@ -53,7 +247,54 @@ class ServicesTest(TestCase):
         self.assertEqual(balances[0]['contractAddress'], '0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48')
         mock_post.assert_called_once()
 
-    @patch('profiles.services.requests.get')
+    @patch('profiles.http_client.HttpClient.post')
+    def test_get_token_balances_many_batches(self, mock_post):
+        """Test that wallets are batched and responses are mapped back by id."""
+        def batch_response(url, json, **kwargs):
+            # Answer in reverse order, with an error for the first wallet
+            items = []
+            for request in reversed(json):
+                if request["params"][0] == "0x1":
+                    items.append({"jsonrpc": "2.0", "id": request["id"], "error": {"message": "boom"}})
+                else:
+                    items.append({**MOCK_ALCHEMY_BALANCES_SUCCESS, "id": request["id"]})
+            response = MagicMock()
+            response.json.return_value = items
+            response.raise_for_status.return_value = None
+            return response
+        mock_post.side_effect = batch_response
+
+        balances = get_token_balances_many(["0x1", "0x2", "0x3", "0x2"], batch_size=2)
+
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertIsNone(balances["0x1"])
+        self.assertEqual(len(balances["0x2"]), 1)
+        self.assertEqual(len(balances["0x3"]), 1)
+
+    @patch('profiles.http_client.HttpClient.post')
+    def test_get_token_metadata_many_fetches_only_unseen(self, mock_post):
+        """Test that token metadata is read from the database and only unseen tokens are fetched."""
+        TokenMetadata.objects.create(contract_address="0xknown", decimals=18, symbol="KNOWN")
+        mock_response = MagicMock()
+        mock_response.json.return_value = [
+            {"jsonrpc": "2.0", "id": 0, "result": {"decimals": 6, "symbol": "USDC", "name": "USD Coin"}},
+        ]
+        mock_response.raise_for_status.return_value = None
+        mock_post.return_value = mock_response
+
+        metadata = get_token_metadata_many(["0xKnown", "0xusdc"])
+
+        self.assertEqual(metadata["0xknown"].symbol, "KNOWN")
+        self.assertEqual(metadata["0xusdc"].decimals, 6)
+        self.assertEqual(mock_post.call_args.kwargs["json"][0]["params"], ["0xusdc"])
+        self.assertTrue(TokenMetadata.objects.filter(contract_address="0xusdc", decimals=6).exists())
+
+        # Second call is served from the in-process cache without touching the API or database
+        with self.assertNumQueries(0):
+            get_token_metadata_many(["0xknown", "0xusdc"])
+        mock_post.assert_called_once()
+
+    @patch('profiles.http_client.HttpClient.get')
     def test_get_token_prices_caching(self, mock_get):
         """Test that token price results are cached."""
         mock_response = MagicMock()
@@ -73,7 +314,7 @@ class ServicesTest(TestCase):
         self.assertEqual(prices_cached["0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48"], Decimal("1.0"))
         mock_get.assert_called_once() # API was NOT called again
 
-    @patch('profiles.services.requests.get')
+    @patch('profiles.http_client.HttpClient.get')
     def test_get_nfts_success(self, mock_get):
         """Test successful fetching of NFTs."""
         mock_response = MagicMock()
@@ -85,3 +326,798 @@ class ServicesTest(TestCase):
         self.assertEqual(len(nfts), 2)
         self.assertEqual(nfts[0]['title'], 'Test NFT 1')
         mock_get.assert_called_once()
+
+    @patch('profiles.http_client.HttpClient.get')
+    def test_iter_nfts_walks_all_pages(self, mock_get):
+        """Test that all pages are fetched by following pageKey, and each page is cached."""
+        pages = [
+            {"ownedNfts": [{"title": "NFT 1"}], "pageKey": "page-2"},
+            {"ownedNfts": [{"title": "NFT 2"}]},
+        ]
+        mock_get.side_effect = [MagicMock(json=MagicMock(return_value=page)) for page in pages]
+
+        titles = [nft["title"] for nft in iter_nfts("0x123")]
+
+        self.assertEqual(titles, ["NFT 1", "NFT 2"])
+        self.assertEqual(mock_get.call_args.kwargs["params"]["pageKey"], "page-2")
+        # Pages are cached individually
+        self.assertEqual(get_nft_page("0x123", "page-2")[0][0]["title"], "NFT 2")
+        self.assertEqual(mock_get.call_count, 2)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TokenBalancesCacheTest(TestCase):
+    BALANCES = [{"contractAddress": "0xtoken", "tokenBalance": "0x1"}]
+
+    def setUp(self):
+        cache.clear()
+
+    def age_cached_balances(self, seconds):
+        cache.set("token_balances_0xwallet", {"balances": self.BALANCES, "fetched_at": time.time() - seconds})
+
+    @patch('profiles.services._fetch_token_balances')
+    def test_fresh_balances_are_served_from_cache(self, mock_fetch):
+        """Test that balances within the soft TTL don't hit the API."""
+        mock_fetch.return_value = self.BALANCES
+        self.assertEqual(get_token_balances("0xwallet"), self.BALANCES)
+        self.assertEqual(get_token_balances("0xWallet"), self.BALANCES)
+        mock_fetch.assert_called_once()
+
+    @patch('profiles.tasks.refresh_wallet_token_balances.delay')
+    @patch('profiles.services._fetch_token_balances')
+    def test_stale_balances_are_served_while_refreshing(self, mock_fetch, mock_delay):
+        """Test that stale balances are served and a single background refresh is queued."""
+        self.age_cached_balances(settings.TOKEN_BALANCES_SOFT_TTL + 1)
+
+        self.assertEqual(get_token_balances("0xwallet"), self.BALANCES)
+        self.assertEqual(get_token_balances("0xwallet"), self.BALANCES)
+
+        mock_fetch.assert_not_called()
+        mock_delay.assert_called_once_with("0xwallet")
+
+    @patch('profiles.services._fetch_token_balances')
+    def test_last_good_balances_are_served_on_error(self, mock_fetch):
+        """Test that expired balances are refetched, falling back to them if the API fails."""
+        self.age_cached_balances(settings.TOKEN_BALANCES_HARD_TTL + 1)
+        mock_fetch.return_value = None
+
+        self.assertEqual(get_token_balances("0xwallet"), self.BALANCES)
+        mock_fetch.assert_called_once_with("0xwallet", deadline=None)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PortfolioTaskTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        _token_metadata_cache.clear()
+        self.user = User.objects.create_user(username="holder", wallet_address="0xholder")
+        self.empty_user = User.objects.create_user(username="empty", wallet_address="0xempty")
+        # Run subtasks and chords inline
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", False)
+
+    @override_settings(PORTFOLIO_SHARD_SIZE=1)
+    @patch('profiles.tasks.get_token_prices')
+    @patch('profiles.tasks.get_token_balances_many')
+    def test_update_all_user_portfolios(self, mock_balances, mock_prices):
+        """Test that portfolio values are computed from balances and prices."""
+        # USDC uses 6 decimals: 0xF4240 is 1 USDC, and 0xDE0B6B3A7640000 is 10^12 USDC
+        TokenMetadata.objects.create(
+            contract_address="0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48", decimals=6, symbol="USDC"
+        )
+        mock_balances.return_value = {
+            "0xholder": [{"contractAddress": "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48", "tokenBalance": "0x2625A0"}],
+            "0xempty": [],
+        }
+        mock_prices.return_value = {"0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48": Decimal("1.0")}
+
+        update_all_user_portfolios()
+
+        # One shard per user, priced together in the final chord step
+        self.assertEqual(mock_balances.call_count, 2)
+        mock_prices.assert_called_once()
+        self.user.refresh_from_db()
+        self.empty_user.refresh_from_db()
+        self.assertEqual(self.user.portfolio_value, Decimal("2.50"))  # 2.5 USDC
+        self.assertEqual(self.empty_user.portfolio_value, Decimal("0.00"))
+
+    @patch('profiles.tasks.get_token_prices')
+    @patch('profiles.tasks.get_token_balances_many')
+    def test_portfolio_includes_verified_addresses(self, mock_balances, mock_prices):
+        """Test that verified ETH addresses are valued with the primary wallet, and shared ones fetched once."""
+        TokenMetadata.objects.create(contract_address="0xtoken", decimals=0, symbol="TKN")
+        Address.objects.create(user=self.user, address="0xShared", currency_type="eth", is_verified=True)
+        Address.objects.create(user=self.user, address="0xunverified", currency_type="eth")
+        Address.objects.create(user=self.user, address="0xbitcoin", currency_type="btc", is_verified=True)
+        Address.objects.create(user=self.empty_user, address="0xshared", currency_type="eth", is_verified=True)
+        mock_balances.side_effect = lambda addresses: {
+            address: [{"contractAddress": "0xtoken", "tokenBalance": "0x2"}] for address in addresses
+        }
+        mock_prices.return_value = {"0xtoken": Decimal("1.5")}
+
+        update_all_user_portfolios()
+
+        mock_balances.assert_called_once_with(["0xholder", "0xShared", "0xempty"])
+        self.user.refresh_from_db()
+        self.empty_user.refresh_from_db()
+        self.assertEqual(self.user.portfolio_value, Decimal("6.00"))
+        self.assertEqual(self.empty_user.portfolio_value, Decimal("6.00"))
+        self.assertEqual(
+            sorted(WalletValuation.objects.filter(user=self.user).values_list("address", "value")),
+            [("0xShared", Decimal("3.00")), ("0xholder", Decimal("3.00"))],
+        )
+
+    @override_settings(PORTFOLIO_SHARD_SIZE=1)
+    @patch('profiles.tasks.get_token_prices')
+    @patch('profiles.services._alchemy_batch')
+    def test_shards_reuse_balances_fetched_during_the_run(self, mock_batch, mock_prices):
+        """Test that an address shared across shards is fetched from Alchemy once."""
+        Address.objects.create(user=self.user, address="0xshared", currency_type="eth", is_verified=True)
+        Address.objects.create(user=self.empty_user, address="0xshared", currency_type="eth", is_verified=True)
+        mock_batch.side_effect = lambda method, params_list: [
+            {"result": {"tokenBalances": [{"contractAddress": "0xtoken", "tokenBalance": "0x1"}]}}
+            for _ in params_list
+        ]
+        mock_prices.return_value = {}
+
+        update_all_user_portfolios()
+
+        fetched = [
+            params[0]
+            for call in mock_batch.call_args_list if call.args[0] == "alchemy_getTokenBalances"
+            for params in call.args[1]
+        ]
+        self.assertEqual(sorted(fetched), ["0xempty", "0xholder", "0xshared"])
+
+    @patch('profiles.tasks.get_token_prices')
+    @patch('profiles.tasks.get_token_balances_many')
+    def test_breakdown_is_replaced_on_each_run(self, mock_balances, mock_prices):
+        """Test that wallets no longer counted lose their stored value."""
+        TokenMetadata.objects.create(contract_address="0xtoken", decimals=0, symbol="TKN")
+        address = Address.objects.create(user=self.user, address="0xsecond", currency_type="eth", is_verified=True)
+        mock_balances.side_effect = lambda addresses: {
+            address: [{"contractAddress": "0xtoken", "tokenBalance": "0x1"}] for address in addresses
+        }
+        mock_prices.return_value = {"0xtoken": Decimal("1")}
+        update_all_user_portfolios()
+        address.delete()
+
+        update_all_user_portfolios()
+
+        self.assertEqual(list(WalletValuation.objects.filter(user=self.user).values_list("address", flat=True)), ["0xholder"])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.portfolio_value, Decimal("1.00"))
+
+    @patch('profiles.tasks.get_token_prices')
+    @patch('profiles.tasks.get_token_balances_many')
+    def test_failed_fetches_keep_the_last_value(self, mock_balances, mock_prices):
+        """Test that a user with a wallet that couldn't be fetched is skipped, and an emptied wallet is valued at 0."""
+        TokenMetadata.objects.create(contract_address="0xtoken", decimals=0, symbol="TKN")
+        Address.objects.create(user=self.user, address="0xsecond", currency_type="eth", is_verified=True)
+        User.objects.filter(pk__in=[self.user.pk, self.empty_user.pk]).update(portfolio_value=Decimal("5.00"))
+        mock_balances.return_value = {
+            "0xholder": [{"contractAddress": "0xtoken", "tokenBalance": "0x1"}],
+            "0xsecond": None,
+            "0xempty": [],
+        }
+        mock_prices.return_value = {"0xtoken": Decimal("1")}
+
+        update_all_user_portfolios()
+
+        self.user.refresh_from_db()
+        self.empty_user.refresh_from_db()
+        self.assertEqual(self.user.portfolio_value, Decimal("5.00"))
+        self.assertFalse(WalletValuation.objects.filter(user=self.user).exists())
+        self.assertEqual(self.empty_user.portfolio_value, Decimal("0.00"))
+        self.assertEqual(list(WalletValuation.objects.filter(user=self.empty_user).values_list("value", flat=True)), [Decimal("0.00")])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PortfolioHistoryTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="holder", wallet_address="0xholder")
+        self.now = datetime.datetime(2026, 3, 18, 9, 30, tzinfo=datetime.timezone.utc)  # A Wednesday
+
+    def snapshots(self, resolution):
+        return list(
+            PortfolioSnapshot.objects.filter(user=self.user, resolution=resolution)
+            .order_by("bucket").values_list("bucket", "value")
+        )
+
+    def record_hours(self, start, hours, value=lambda hour: Decimal(hour)):
+        for hour in range(hours):
+            history.record_snapshots({self.user.id: value(hour)}, start + datetime.timedelta(hours=hour))
+
+    def test_portfolio_task_records_hourly_snapshots(self):
+        """Test that each run records the values of the users it valued, once per hour."""
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", False)
+        TokenMetadata.objects.create(contract_address="0xtoken", decimals=0, symbol="TKN")
+        balances = {"0xholder": [{"contractAddress": "0xtoken", "tokenBalance": "0x2"}]}
+
+        with patch("profiles.tasks.get_token_balances_many", return_value=balances), \
+                patch("profiles.tasks.get_token_prices", return_value={"0xtoken": Decimal("1")}):
+            update_all_user_portfolios()
+            balances["0xholder"][0]["tokenBalance"] = "0x3"
+            update_all_user_portfolios()
+
+        [(bucket, value)] = self.snapshots(history.HOUR)
+        self.assertEqual(value, Decimal("3.00"))
+        self.assertEqual((bucket.minute, bucket.second), (0, 0))
+
+    def test_completed_days_and_weeks_are_downsampled(self):
+        """Test that hourly snapshots are averaged per day, and daily ones per week."""
+        monday = datetime.datetime(2026, 3, 9, tzinfo=datetime.timezone.utc)
+        # Mon 9 to Wed 18 09:00: a complete week, two complete days and part of today
+        self.record_hours(monday, 9 * 24 + 10, value=lambda hour: Decimal(hour // 24))
+
+        with patch("profiles.tasks.timezone.now", return_value=self.now):
+            compact_portfolio_history()
+
+        days = self.snapshots(history.DAY)
+        self.assertEqual(len(days), 9)
+        self.assertEqual(days[0], (monday, Decimal("0.00")))
+        self.assertEqual(days[-1], (monday + datetime.timedelta(days=8), Decimal("8.00")))
+        self.assertEqual(self.snapshots(history.WEEK), [(monday, Decimal("3.00"))])
+
+        # Nothing already downsampled is written again
+        with patch("profiles.tasks.timezone.now", return_value=self.now):
+            self.assertEqual(compact_portfolio_history(), "Wrote 0 and deleted 0 snapshots.")
+
+    @override_settings(PORTFOLIO_HISTORY_HOURLY_DAYS=2, PORTFOLIO_HISTORY_DAILY_DAYS=3)
+    def test_snapshots_past_retention_are_deleted(self):
+        """Test that each resolution keeps only its retention period."""
+        self.record_hours(self.now - datetime.timedelta(days=5), 5 * 24)
+
+        with patch("profiles.tasks.timezone.now", return_value=self.now):
+            compact_portfolio_history()
+
+        self.assertEqual(self.snapshots(history.HOUR)[0][0], self.now.replace(minute=0) - datetime.timedelta(days=2))
+        self.assertEqual(len(self.snapshots(history.DAY)), 3)
+
+    def test_chart_reads_one_resolution_over_its_range(self):
+        """Test that the chart endpoint returns the buckets of the range's resolution."""
+        self.record_hours(self.now - datetime.timedelta(days=10), 10 * 24)
+        with patch("profiles.tasks.timezone.now", return_value=self.now):
+            compact_portfolio_history()
+        url = reverse("profiles:portfolio_history", kwargs={"username": "holder"})
+
+        with patch("profiles.views.timezone.now", return_value=self.now), self.assertNumQueries(2):
+            response = self.client.get(url, {"range": "1w"})
+        data = response.json()
+        self.assertEqual(data["resolution"], "hour")
+        self.assertEqual(len(data["points"]), 7 * 24)
+        self.assertEqual(data["points"][-1]["value"], "239.00")
+
+        with patch("profiles.views.timezone.now", return_value=self.now):
+            data = self.client.get(url, {"range": "1m"}).json()
+        self.assertEqual(data["resolution"], "day")
+        self.assertEqual(len(data["points"]), 10)
+
+        self.assertEqual(self.client.get(url, {"range": "decade"}).status_code, 400)
+        missing_url = reverse("profiles:portfolio_history", kwargs={"username": "nobody"})
+        self.assertEqual(self.client.get(missing_url).status_code, 404)
+
+    def test_private_history_is_only_shown_to_its_owner(self):
+        """Test that a private user's chart is hidden from others, as if it didn't exist."""
+        self.record_hours(self.now - datetime.timedelta(hours=3), 3)
+        User.objects.filter(pk=self.user.pk).update(is_public=False)
+        User.objects.create_user(username="visitor", password="password")
+        url = reverse("profiles:portfolio_history", kwargs={"username": "holder"})
+
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.login(username="visitor", password="password")
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(self.user)
+        with patch("profiles.views.timezone.now", return_value=self.now):
+            data = self.client.get(url, {"range": "1w"}).json()
+        self.assertEqual(len(data["points"]), 3)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ProfileDetailViewTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        _token_metadata_cache.clear()
+        self.profile_user = User.objects.create_user(username="holder", wallet_address="0xholder")
+        TokenMetadata.objects.create(contract_address="0xtoken", decimals=6, symbol="USDC")
+
+    @patch('profiles.views.get_nft_page')
+    @patch('profiles.views.get_token_balances')
+    def test_profile_page_shows_balances_and_nfts(self, mock_balances, mock_nfts):
+        """Test that the async profile page renders balances and NFTs."""
+        mock_balances.return_value = [{"contractAddress": "0xtoken", "tokenBalance": "0x1E8480"}]
+        mock_nfts.return_value = ([{"title": "Test NFT 2", "contractAddress": "0xnft2", "image": ""}], "next-key")
+
+        response = self.client.get(reverse("profiles:detail", kwargs={"username": "holder"}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["profile_user"], self.profile_user)
+        self.assertEqual(response.context["token_balances"][0]["amount"], Decimal("2"))
+        self.assertContains(response, "Test NFT 2")
+        self.assertContains(response, 'data-page-key="next-key"')
+        deadline = settings.PROFILE_BALANCES_TIMEOUT * UPSTREAM_DEADLINE_SHARE
+        mock_balances.assert_called_once_with("0xholder", deadline=deadline)
+
+    @override_settings(PROFILE_NFTS_TIMEOUT=0.01)
+    @patch('profiles.views.get_nft_page')
+    @patch('profiles.views.get_token_balances')
+    def test_slow_upstream_does_not_block_page(self, mock_balances, mock_nfts):
+        """Test that a slow NFT fetch is cut off by its timeout."""
+        mock_balances.return_value = []
+        mock_nfts.side_effect = lambda address, deadline: time.sleep(0.5) or ([], None)
+        mock_nfts.__name__ = "get_nft_page"
+
+        response = self.client.get(reverse("profiles:detail", kwargs={"username": "holder"}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["nfts"], [])
+
+    @patch('profiles.views.get_nft_page')
+    @patch('profiles.views.get_token_balances')
+    def test_profile_page_shows_public_wallet_breakdown(self, mock_balances, mock_nfts):
+        """Test that the stored per-wallet values are shown, except for private addresses."""
+        mock_balances.return_value = []
+        mock_nfts.return_value = ([], None)
+        self.profile_user.portfolio_value = Decimal("7.00")
+        self.profile_user.save()
+        Address.objects.create(user=self.profile_user, address="0xpublic", currency_type="eth", is_verified=True)
+        Address.objects.create(
+            user=self.profile_user, address="0xprivate", currency_type="eth", is_verified=True, is_public=False
+        )
+        for address, value in [("0xholder", "1.00"), ("0xpublic", "2.00"), ("0xprivate", "4.00")]:
+            WalletValuation.objects.create(user=self.profile_user, address=address, value=Decimal(value))
+
+        response = self.client.get(reverse("profiles:detail", kwargs={"username": "holder"}))
+
+        self.assertEqual(
+            [valuation.address for valuation in response.context["wallet_valuations"]], ["0xpublic", "0xholder"]
+        )
+        self.assertContains(response, "$7.00")
+        self.assertNotContains(response, "0xprivate")
+
+    @patch('profiles.views.get_nft_page')
+    @patch('profiles.views.get_token_balances')
+    def test_private_profile_hides_portfolio_from_visitors(self, mock_balances, mock_nfts):
+        """Test that a private user's portfolio is only shown to themselves."""
+        mock_balances.return_value = []
+        mock_nfts.return_value = ([], None)
+        self.profile_user.portfolio_value = Decimal("7.00")
+        self.profile_user.is_public = False
+        self.profile_user.set_password("password")
+        self.profile_user.save()
+        WalletValuation.objects.create(user=self.profile_user, address="0xholder", value=Decimal("7.00"))
+        User.objects.create_user(username="visitor", password="password")
+        url = reverse("profiles:detail", kwargs={"username": "holder"})
+
+        self.assertNotContains(self.client.get(url), "$7.00")
+        self.client.login(username="visitor", password="password")
+        self.assertNotContains(self.client.get(url), "$7.00")
+        self.client.login(username="holder", password="password")
+        self.assertContains(self.client.get(url), "$7.00")
+
+    def test_unknown_profile_returns_404(self):
+        response = self.client.get(reverse("profiles:detail", kwargs={"username": "nobody"}))
+        self.assertEqual(response.status_code, 404)
+
+    @patch('profiles.views.get_nft_page')
+    def test_nft_gallery_returns_requested_page(self, mock_nfts):
+        """Test that the gallery endpoint returns a page and the key of the next one."""
+        mock_nfts.return_value = ([{"title": "Page 2 NFT"}], None)
+
+        response = self.client.get(
+            reverse("profiles:nft_gallery", kwargs={"username": "holder"}), {"page_key": "abc"}
+        )
+
+        self.assertEqual(response.json(), {"success": True, "nfts": [{"title": "Page 2 NFT"}], "next_page_key": None})
+        mock_nfts.assert_called_once_with(
+            "0xholder", "abc", deadline=settings.PROFILE_NFTS_TIMEOUT * UPSTREAM_DEADLINE_SHARE
+        )
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ProfilePageCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.profile_user = User.objects.create_user(username="holder", password="password", bio="Old bio")
+        self.url = reverse("profiles:detail", kwargs={"username": "holder"})
+
+    def test_anonymous_page_is_served_from_cache(self):
+        """Test that repeat anonymous views don't touch the database."""
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, "Old bio")
+
+    def test_page_is_invalidated_when_profile_changes(self):
+        """Test that saving the user or adding a link invalidates the cached page."""
+        self.client.get(self.url)
+        self.profile_user.bio = "New bio"
+        self.profile_user.save()
+        self.assertContains(self.client.get(self.url), "New bio")
+
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+        SnsLink.objects.create(user=self.profile_user, platform="github", url="https://github.com/holder")
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+    def test_save_while_rendering_invalidates_the_stored_page(self):
+        """Test that a page rendered from a user loaded just before a save isn't served afterwards."""
+        real_aget_profile_versions = page_cache.aget_profile_versions
+
+        async def save_then_get_versions(*args):
+            # The user is already loaded when the bio changes
+            self.profile_user.bio = "New bio"
+            await sync_to_async(self.profile_user.save)()
+            return await real_aget_profile_versions(*args)
+
+        with patch('profiles.views.aget_profile_versions', side_effect=save_then_get_versions):
+            self.assertContains(self.client.get(self.url), "Old bio")
+
+        self.assertContains(self.client.get(self.url), "New bio")
+
+    def test_owner_and_visitor_pages_are_cached_separately(self):
+        """Test that only the owner's cached page has the edit button."""
+        self.client.get(self.url)
+        self.client.login(username="holder", password="password")
+        self.assertContains(self.client.get(self.url), "Edit Profile")
+
+        User.objects.create_user(username="visitor", password="password")
+        self.client.login(username="visitor", password="password")
+        response = self.client.get(self.url)
+        self.assertNotContains(response, "Edit Profile")
+        self.assertContains(response, "visitor's Profile")  # The navigation is the viewer's own
+
+
+class NftThumbnailTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        image = BytesIO()
+        Image.new("RGB", (1024, 768), "purple").save(image, format="PNG")
+        self.image_bytes = image.getvalue()
+
+    def stub_media_server(self, responses, resolves_to="93.184.215.14"):
+        """
+        Answers media requests from `responses` once the PublicAddressAdapter has
+        checked and pinned their address. Hosts resolve to `resolves_to`, an address
+        or a function of the host returning one or a list of them.
+        """
+        transport = StubTransport(responses)
+        previous = set_media_http_client(HttpClient(transport=PublicAddressAdapter(), max_retries=0))
+        self.addCleanup(set_media_http_client, previous)
+
+        def resolve(host, *args, **kwargs):
+            addresses = resolves_to(host) if callable(resolves_to) else resolves_to
+            if isinstance(addresses, str):
+                addresses = [addresses]
+            return [(None, None, None, "", (address, 0)) for address in addresses]
+        for patcher in [
+            patch('profiles.http_client.socket.getaddrinfo', side_effect=resolve),
+            patch.object(HTTPAdapter, 'send', lambda adapter, request, **kwargs: transport.send(request, **kwargs)),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return transport
+
+    def test_thumbnails_are_generated_once_per_image(self):
+        """Test that identical images at different URLs share the same thumbnail files."""
+        transport = self.stub_media_server([(200, self.image_bytes), (200, self.image_bytes)])
+
+        first = generate_thumbnails("https://example.com/a.png")
+        second = generate_thumbnails("https://cdn.example.com/copy-of-a.png")
+        generate_thumbnails("https://example.com/a.png")
+
+        self.assertEqual(first.status, NftMedia.STATUS_READY)
+        self.assertEqual(first.content_hash, second.content_hash)
+        self.assertEqual(len(transport.sent), 2)  # The ready URL isn't downloaded again
+        for size in settings.NFT_THUMBNAIL_SIZES:
+            with Image.open(f"{self.media_root}/{thumbnail_name(first.content_hash, size)}") as thumbnail:
+                self.assertEqual(thumbnail.format, "WEBP")
+                self.assertEqual(thumbnail.width, size)
+
+    def test_internal_hosts_are_never_fetched(self):
+        """Test that URLs resolving to internal addresses are refused for good."""
+        for address in ["127.0.0.1", "10.0.0.5", "169.254.169.254", "::1", "::ffff:192.168.0.1", "224.0.0.1"]:
+            with self.subTest(address=address):
+                transport = self.stub_media_server([], resolves_to=address)
+                media = generate_thumbnails(f"http://internal.example/{address}.png")
+
+                self.assertEqual(transport.sent, [])
+                self.assertEqual(media.status, NftMedia.STATUS_FAILED)
+                self.assertIsNone(media.retry_after)
+
+    def test_redirects_to_internal_hosts_are_refused(self):
+        """Test that each redirect hop is checked before it is followed."""
+        transport = self.stub_media_server(
+            [(302, b"", {"Location": "http://metadata.internal/latest"})],
+            resolves_to=lambda host: "169.254.169.254" if host == "metadata.internal" else "93.184.215.14",
+        )
+
+        media = generate_thumbnails("https://example.com/a.png")
+
+        self.assertEqual(len(transport.sent), 1)
+        self.assertEqual(media.status, NftMedia.STATUS_FAILED)
+
+    def test_hosts_with_any_internal_address_are_refused(self):
+        """Test that a host resolving to a public and an internal address isn't fetched."""
+        transport = self.stub_media_server([], resolves_to=["93.184.215.14", "127.0.0.1"])
+
+        media = generate_thumbnails("https://example.com/a.png")
+
+        self.assertEqual(transport.sent, [])
+        self.assertEqual(media.status, NftMedia.STATUS_FAILED)
+
+    def test_connections_are_pinned_to_the_checked_address(self):
+        """Test that a host is resolved once per hop and reached at the address that was checked."""
+        answers = iter(["93.184.215.14", "127.0.0.1"])  # Rebinds after the first lookup
+        transport = self.stub_media_server([(200, self.image_bytes)], resolves_to=lambda host: next(answers))
+
+        media = generate_thumbnails("https://example.com/a.png")
+
+        self.assertEqual(media.status, NftMedia.STATUS_READY)
+        self.assertEqual(transport.sent[0].pinned_address, "93.184.215.14")
+        self.assertEqual(transport.sent[0].headers["Host"], "example.com")
+
+    def test_redirects_to_public_hosts_are_followed(self):
+        transport = self.stub_media_server([
+            (301, b"", {"Location": "/moved.png"}),
+            (200, self.image_bytes),
+        ])
+
+        media = generate_thumbnails("https://example.com/a.png")
+
+        self.assertEqual(media.status, NftMedia.STATUS_READY)
+        self.assertEqual(transport.sent[1].url, "https://example.com/moved.png")
+
+    @override_settings(NFT_MEDIA_MAX_ATTEMPTS=2)
+    @patch('profiles.tasks.generate_nft_thumbnails.delay')
+    def test_failed_images_are_retried_with_backoff(self, mock_delay):
+        """Test that failed downloads are queued again once due, up to NFT_MEDIA_MAX_ATTEMPTS."""
+        self.stub_media_server([(503, b""), (503, b"")])
+        url = "https://example.com/flaky.png"
+
+        media = generate_thumbnails(url)
+        self.assertEqual((media.status, media.attempts), (NftMedia.STATUS_FAILED, 1))
+        attach_thumbnails([{"image": url}])
+        mock_delay.assert_not_called()  # Not due yet
+
+        NftMedia.objects.filter(pk=media.pk).update(retry_after=media.retry_after - datetime.timedelta(days=1))
+        attach_thumbnails([{"image": url}])
+        attach_thumbnails([{"image": url}])
+        mock_delay.assert_called_once_with(url)
+
+        media = generate_thumbnails(url)
+        self.assertEqual((media.status, media.attempts), (NftMedia.STATUS_FAILED, 2))
+        self.assertIsNone(media.retry_after)  # Given up
+
+    @patch('profiles.tasks.generate_nft_thumbnails.delay')
+    def test_lost_pending_images_are_queued_again(self, mock_delay):
+        """Test that an image left pending by a lost task is queued again after NFT_MEDIA_PENDING_TIMEOUT."""
+        url = "https://example.com/lost.png"
+        attach_thumbnails([{"image": url}])
+        attach_thumbnails([{"image": url}])
+        mock_delay.assert_called_once_with(url)
+
+        stale = timezone.now() - datetime.timedelta(seconds=settings.NFT_MEDIA_PENDING_TIMEOUT + 1)
+        NftMedia.objects.update(updated_at=stale)
+        attach_thumbnails([{"image": url}])
+        attach_thumbnails([{"image": url}])
+
+        self.assertEqual(mock_delay.call_count, 2)
+        self.assertEqual(NftMedia.objects.get().status, NftMedia.STATUS_PENDING)
+
+    @patch('profiles.tasks.generate_nft_thumbnails.delay')
+    def test_attach_thumbnails_uses_ready_images_and_queues_new_ones(self, mock_delay):
+        """Test that processed images get local URLs and unseen ones are queued once."""
+        NftMedia.objects.create(
+            source_url="https://example.com/ready.png",
+            source_url_hash=hashlib.sha256(b"https://example.com/ready.png").hexdigest(),
+            content_hash="ab" * 32,
+            status=NftMedia.STATUS_READY,
+        )
+        nfts = [{"image": "https://example.com/ready.png"}, {"image": "https://example.com/new.png"}]
+
+        with self.assertNumQueries(2):  # One lookup, one insert for the new image
+            attach_thumbnails(nfts)
+        attach_thumbnails([{"image": "https://example.com/new.png"}])
+
+        self.assertEqual(nfts[0]["thumbnail"], f"/media/{thumbnail_name('ab' * 32, settings.NFT_GALLERY_THUMBNAIL_SIZE)}")
+        self.assertIn("512w", nfts[0]["thumbnail_srcset"])
+        self.assertNotIn("thumbnail", nfts[1])
+        mock_delay.assert_called_once_with("https://example.com/new.png")
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class LeaderboardTest(TestCase):
+    def make_redis(self):
+        return FakeRedis(LEADERBOARD_SCRIPTS)
+
+    def setUp(self):
+        self.redis = self.make_redis()
+        patcher = patch('profiles.leaderboard.get_redis_connection', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_users(self, count):
+        return [
+            User.objects.create_user(
+                username=f"user{i}", password="password", is_public=True, portfolio_value=Decimal(i)
+            )
+            for i in range(1, count + 1)
+        ]
+
+    def test_ranking_pages_show_global_ranks(self):
+        """Test that the ranking is read from the leaderboard with global rank numbers."""
+        users = self.create_users(55)
+        leaderboard.rebuild()
+        self.client.login(username="user50", password="password")
+
+        first_page = self.client.get(reverse("profiles:ranking"))
+        with patch('profiles.views.paginate_keyset') as mock_database:
+            response = self.client.get(reverse("profiles:ranking"), {"cursor": first_page.context["next_cursor"]})
+        mock_database.assert_not_called()
+
+        self.assertEqual([u.username for u in response.context["users"]], ["user5", "user4", "user3", "user2", "user1"])
+        self.assertContains(response, "#51")
+        self.assertIsNone(response.context["next_cursor"])
+        self.assertEqual(response.context["my_rank"], 6)
+        self.assertEqual(leaderboard.get_rank(users[-1].pk), 1)
+
+    def test_membership_follows_public_setting(self):
+        """Test that users leave the leaderboard when made private, and updates skip them."""
+        user, other = self.create_users(2)
+        leaderboard.rebuild()
+        user.is_public = False
+        user.save()
+
+        leaderboard.update_scores({user.pk: 100, other.pk: 50}, only_existing=True)
+
+        self.assertIsNone(leaderboard.get_rank(user.pk))
+        self.assertEqual(leaderboard.get_rank(other.pk), 1)
+        self.assertEqual(self.redis.zscore(leaderboard.LEADERBOARD_KEY, leaderboard._member(other.pk)), 50)
+
+        new_user = User.objects.create_user(username="newcomer", is_public=True, portfolio_value=Decimal(200))
+        self.assertEqual(leaderboard.get_rank(new_user.pk), 1)
+
+    def test_private_users_missed_by_removal_are_not_shown(self):
+        """Test that a user made private without leaving the leaderboard is hidden and removed."""
+        user, other = self.create_users(2)
+        leaderboard.rebuild()
+        User.objects.filter(pk=other.pk).update(is_public=False)  # No signal, as if the removal failed
+
+        response = self.client.get(reverse("profiles:ranking"))
+
+        self.assertEqual([u.username for u in response.context["users"]], ["user1"])
+        self.assertNotContains(response, "user2")
+        self.assertIsNone(leaderboard.get_rank(other.pk))
+        self.assertEqual(leaderboard.get_rank(user.pk), 1)
+
+    def test_rebuild_replaces_leaderboard(self):
+        """Test that a rebuild drops stale members and loads scores from the database."""
+        users = self.create_users(3)
+        self.redis.zadd(leaderboard.LEADERBOARD_KEY, {leaderboard._member(999): 1000.0})
+
+        self.assertEqual(leaderboard.rebuild(), 3)
+
+        self.assertIsNone(leaderboard.get_rank(999))
+        self.assertEqual(leaderboard.get_rank(users[2].pk), 1)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    @patch('profiles.tasks.rebuild_leaderboard.delay')
+    def test_lost_leaderboard_is_not_served_until_rebuilt(self, mock_rebuild):
+        """Test that after Redis loses the leaderboard, saves don't recreate a partial one."""
+        self.create_users(3)
+        leaderboard.rebuild()
+        self.redis.flushdb()
+        User.objects.filter(username="user1").get().save()
+
+        self.assertFalse(self.redis.exists(leaderboard.LEADERBOARD_KEY))
+        response = self.client.get(reverse("profiles:ranking"))
+        self.client.get(reverse("profiles:ranking"))
+
+        self.assertEqual([u.username for u in response.context["users"]], ["user3", "user2", "user1"])
+        mock_rebuild.assert_called_once_with()
+        with self.assertRaises(leaderboard.LeaderboardNotBuilt):
+            leaderboard.get_rank(1)
+
+    def test_changes_during_rebuild_are_kept(self):
+        """Test that score updates and removals made while a rebuild reads the database survive it."""
+        first, second, third = self.create_users(3)
+        leaderboard.rebuild()
+        original_iterator = type(User.objects.all()).iterator
+
+        def iterate_then_change(queryset, *args, **kwargs):
+            rows = list(original_iterator(queryset, *args, **kwargs))  # The rebuild's snapshot
+            leaderboard.update_scores({first.pk: 500}, only_existing=True)
+            leaderboard.remove_users([third.pk])
+            return iter(rows)
+
+        with patch.object(type(User.objects.all()), "iterator", iterate_then_change):
+            leaderboard.rebuild()
+
+        self.assertEqual(leaderboard.get_rank(first.pk), 1)
+        self.assertIsNone(leaderboard.get_rank(third.pk))
+        self.assertEqual(leaderboard.get_rank(second.pk), 2)
+
+    def test_ties_are_ordered_like_the_database(self):
+        """Test that equal values rank by descending id in Redis, as in the database fallback."""
+        users = [
+            User.objects.create_user(username=f"tied{i}", is_public=True, portfolio_value=Decimal(5))
+            for i in range(12)
+        ]
+        leaderboard.rebuild()
+
+        redis_order = [u.username for u in leaderboard.LeaderboardList()[0:12]]
+        database_order = [u.username for u in User.objects.filter(is_public=True).order_by("-portfolio_value", "-id")]
+
+        self.assertEqual(redis_order, database_order)
+        self.assertEqual(redis_order[0], users[-1].username)
+
+    def test_ranking_falls_back_to_database(self):
+        """Test that the ranking is served from the database when Redis is down."""
+        self.create_users(2)
+        with patch('profiles.leaderboard.get_redis_connection', side_effect=NotImplementedError):
+            response = self.client.get(reverse("profiles:ranking"))
+
+        self.assertEqual([u.username for u in response.context["users"]], ["user2", "user1"])
+
+
+class RedisLeaderboardTest(LeaderboardTest):
+    """
+    Runs the leaderboard tests against a real Redis server and the real scripts.
+    """
+
+    def make_redis(self):
+        return real_redis(self)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class RankingPaginationTest(TestCase):
+    def setUp(self):
+        # Ties on portfolio value are broken by id, so no user is skipped or repeated
+        for i in range(7):
+            User.objects.create_user(username=f"user{i}", password="password", portfolio_value=Decimal(i // 2))
+        User.objects.create_user(username="private", password="password", is_public=False, portfolio_value=100)
+
+    @patch('profiles.views.RANKING_PAGE_SIZE', 3)
+    def test_api_walks_ranking_with_cursors(self):
+        """Test that following cursors returns every public user once, in rank order, without counting."""
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse("profiles:ranking_api"), {"cursor": cursor} if cursor else {})
+            data = response.json()
+            seen.extend((user["rank"], user["username"]) for user in data["users"])
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+
+        expected = User.objects.filter(is_public=True).order_by("-portfolio_value", "-id")
+        self.assertEqual(seen, [(i, user.username) for i, user in enumerate(expected, start=1)])
+
+    def test_invalid_cursor_is_rejected(self):
+        """Test that malformed cursors get a 400 rather than an error."""
+        self.assertEqual(self.client.get(reverse("profiles:ranking_api"), {"cursor": "not-a-cursor"}).status_code, 400)
+        bad_values = encode_cursor({"r": 3, "k": ["abc", 1]})
+        self.assertEqual(self.client.get(reverse("profiles:ranking"), {"cursor": bad_values}).status_code, 400)
+
+    def test_cursor_round_trip(self):
+        """Test that cursors are opaque, URL-safe and decode to the encoded position."""
+        cursor = encode_cursor({"r": 50, "k": [Decimal("12.50"), 7]})
+
+        self.assertRegex(cursor, r"^[A-Za-z0-9_-]+$")
+        self.assertEqual(decode_cursor(cursor), {"r": 50, "k": ["12.50", 7]})
+        with self.assertRaises(InvalidCursor):
+            decode_cursor(encode_cursor({"r": 1})[:-2] + "!!")
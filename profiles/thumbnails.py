@@ -0,0 +1,214 @@
+import datetime
+import hashlib
+import logging
+import time
+from io import BytesIO
+from urllib.parse import urljoin, urlsplit
+import requests
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+from .http_client import UnsafeAddress, get_media_http_client
+from .models import NftMedia
+
+logger = logging.getLogger(__name__)
+
+# Thumbnails are named after the hash of the image content, so a file never changes
+# once written and can be served with a far-future cache lifetime.
+THUMBNAIL_DIR = "nft_thumbnails"
+
+
+class UnsafeMediaURL(ValueError):
+    """
+    Raised for media URLs that must not be fetched, e.g. ones that aren't HTTP(S).
+    """
+
+
+def url_hash(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def thumbnail_name(content_hash: str, size: int) -> str:
+    return f"{THUMBNAIL_DIR}/{content_hash[:2]}/{content_hash}_{size}.webp"
+
+
+def resolve_media_url(url: str) -> str:
+    """
+    Rewrites ipfs:// links to the configured HTTP gateway.
+    """
+    if url.startswith("ipfs://"):
+        return settings.IPFS_GATEWAY_URL + url.removeprefix("ipfs://").removeprefix("ipfs/")
+    return url
+
+
+def check_media_url(url: str) -> None:
+    """
+    Raises UnsafeMediaURL unless the URL is HTTP(S) with a host.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("https", "http") or not parts.hostname:
+        raise UnsafeMediaURL(f"Unsupported media URL: {url}")
+
+
+def _download(url: str) -> bytes:
+    """
+    Downloads an image, refusing URLs check_media_url() rejects, at every redirect,
+    and images larger than NFT_MEDIA_MAX_BYTES or taking longer than NFT_MEDIA_TIMEOUT.
+    NFT image URLs are chosen by wallet owners, so the media client only connects to
+    public addresses (see http_client.PublicAddressAdapter), at every hop too.
+    """
+    url = resolve_media_url(url)
+    started = time.monotonic()
+    for _ in range(settings.NFT_MEDIA_MAX_REDIRECTS + 1):
+        check_media_url(url)
+        with get_media_http_client().get(url, stream=True, allow_redirects=False) as response:
+            if response.is_redirect:
+                url = urljoin(url, response.headers["Location"])
+                continue
+            response.raise_for_status()
+            if int(response.headers.get("Content-Length") or 0) > settings.NFT_MEDIA_MAX_BYTES:
+                raise ValueError(f"Media at {url} is larger than {settings.NFT_MEDIA_MAX_BYTES} bytes.")
+            content = BytesIO()
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                content.write(chunk)
+                if content.tell() > settings.NFT_MEDIA_MAX_BYTES:
+                    raise ValueError(f"Media at {url} is larger than {settings.NFT_MEDIA_MAX_BYTES} bytes.")
+                if time.monotonic() - started > settings.NFT_MEDIA_TIMEOUT:
+                    raise ValueError(f"Downloading {url} took longer than {settings.NFT_MEDIA_TIMEOUT}s.")
+            return content.getvalue()
+    raise ValueError(f"Media URL redirected more than {settings.NFT_MEDIA_MAX_REDIRECTS} times.")
+
+
+def _record_failure(media: NftMedia, permanent: bool) -> None:
+    """
+    Marks media as failed, scheduling a retry with exponential backoff unless the
+    failure is permanent or it has failed NFT_MEDIA_MAX_ATTEMPTS times.
+    """
+    media.status = NftMedia.STATUS_FAILED
+    media.attempts += 1
+    if permanent or media.attempts >= settings.NFT_MEDIA_MAX_ATTEMPTS:
+        media.retry_after = None
+    else:
+        delay = settings.NFT_MEDIA_RETRY_DELAY * 2 ** (media.attempts - 1)
+        media.retry_after = timezone.now() + datetime.timedelta(seconds=delay)
+
+
+def _write_thumbnails(content_hash: str, data: bytes) -> None:
+    """
+    Resizes an image into each of NFT_THUMBNAIL_SIZES and stores them as WebP.
+    Sizes that already exist (from an identical image) are skipped.
+    """
+    missing_sizes = [
+        size for size in settings.NFT_THUMBNAIL_SIZES
+        if not default_storage.exists(thumbnail_name(content_hash, size))
+    ]
+    if not missing_sizes:
+        return
+
+    with Image.open(BytesIO(data)) as image:
+        # Use the first frame of animations, upright, without metadata
+        image.seek(0)
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        for size in missing_sizes:
+            thumbnail = image.copy()
+            thumbnail.thumbnail((size, size), Image.Resampling.LANCZOS)
+            output = BytesIO()
+            thumbnail.save(output, format="WEBP", quality=80, method=4)
+            default_storage.save(thumbnail_name(content_hash, size), ContentFile(output.getvalue()))
+
+
+def generate_thumbnails(source_url: str) -> NftMedia:
+    """
+    Fetches an NFT image once and stores its thumbnails. Returns the NftMedia row.
+    """
+    media, _ = NftMedia.objects.get_or_create(
+        source_url_hash=url_hash(source_url), defaults={"source_url": source_url}
+    )
+    if media.status == NftMedia.STATUS_READY:
+        return media
+
+    try:
+        data = _download(source_url)
+        media.content_hash = hashlib.sha256(data).hexdigest()
+        _write_thumbnails(media.content_hash, data)
+        media.status = NftMedia.STATUS_READY
+        media.retry_after = None
+    except (requests.exceptions.RequestException, ValueError, OSError, Image.DecompressionBombError) as e:
+        logger.warning(f"Could not generate thumbnails for {source_url}: {e}")
+        _record_failure(media, permanent=isinstance(e, (UnsafeMediaURL, UnsafeAddress)))
+
+    media.save(update_fields=["content_hash", "status", "attempts", "retry_after", "updated_at"])
+    return media
+
+
+def _is_due(media: NftMedia, now: datetime.datetime, pending_cutoff: datetime.datetime) -> bool:
+    """
+    Whether media should be queued again: failed and due for a retry, or pending
+    since before `pending_cutoff`, i.e. its task was lost or its worker crashed.
+    """
+    if media.status == NftMedia.STATUS_FAILED:
+        return media.retry_after is not None and media.retry_after <= now
+    return media.status == NftMedia.STATUS_PENDING and media.updated_at < pending_cutoff
+
+
+def attach_thumbnails(nfts: list) -> list:
+    """
+    Adds `thumbnail` and `thumbnail_srcset` URLs to NFTs whose images have been
+    processed, with a single database query per page of NFTs. Images seen for the
+    first time, failed ones due for a retry, and pending ones whose task was lost
+    (pending for over NFT_MEDIA_PENDING_TIMEOUT) are queued for processing and keep
+    their original URL until then.
+    """
+    hashes = {nft["image"]: url_hash(nft["image"]) for nft in nfts if nft.get("image")}
+    if not hashes:
+        return nfts
+
+    known = {
+        media.source_url_hash: media
+        for media in NftMedia.objects.filter(source_url_hash__in=hashes.values())
+    }
+
+    sizes = settings.NFT_THUMBNAIL_SIZES
+    for nft in nfts:
+        media = known.get(hashes.get(nft.get("image")))
+        if media and media.status == NftMedia.STATUS_READY:
+            urls = {size: default_storage.url(thumbnail_name(media.content_hash, size)) for size in sizes}
+            nft["thumbnail"] = urls[settings.NFT_GALLERY_THUMBNAIL_SIZE]
+            nft["thumbnail_srcset"] = ", ".join(f"{url} {size}w" for size, url in urls.items())
+
+    new_urls = [url for url, digest in hashes.items() if digest not in known]
+    now = timezone.now()
+    pending_cutoff = now - datetime.timedelta(seconds=settings.NFT_MEDIA_PENDING_TIMEOUT)
+    retry_urls = [
+        url for url, digest in hashes.items()
+        if digest in known and _is_due(known[digest], now, pending_cutoff)
+    ]
+    if new_urls:
+        NftMedia.objects.bulk_create(
+            [NftMedia(source_url=url, source_url_hash=hashes[url]) for url in new_urls],
+            ignore_conflicts=True,
+        )
+    if retry_urls:
+        # Pending until the retry has run, so other page views don't queue it again
+        NftMedia.objects.filter(source_url_hash__in=[hashes[url] for url in retry_urls]).update(
+            status=NftMedia.STATUS_PENDING, updated_at=now
+        )
+    if new_urls or retry_urls:
+        from .tasks import generate_nft_thumbnails
+
+        try:
+            for url in new_urls + retry_urls:
+                generate_nft_thumbnails.delay(url)
+        except Exception as e:
+            # Forget the new rows so the images are queued again next time they are shown
+            NftMedia.objects.filter(source_url_hash__in=[hashes[url] for url in new_urls]).delete()
+            failed = [hashes[url] for url in retry_urls if known[hashes[url]].status == NftMedia.STATUS_FAILED]
+            lost = [hashes[url] for url in retry_urls if known[hashes[url]].status == NftMedia.STATUS_PENDING]
+            NftMedia.objects.filter(source_url_hash__in=failed).update(status=NftMedia.STATUS_FAILED)
+            # Lost images stay due
+            NftMedia.objects.filter(source_url_hash__in=lost).update(updated_at=pending_cutoff)
+            logger.error(f"Could not queue thumbnail generation: {e}")
+    return nfts
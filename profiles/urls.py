@@ -1,10 +1,13 @@
 from django.urls import path
-from .views import ProfileDetailView, ProfileEditView, RankingView
+from .views import ProfileDetailView, ProfileEditView, RankingView, nft_gallery, portfolio_history, ranking_api
 
 app_name = "profiles"
 
 urlpatterns = [
     path("ranking/", RankingView.as_view(), name="ranking"),
+    path("api/ranking/", ranking_api, name="ranking_api"),
     path("edit/", ProfileEditView.as_view(), name="edit"),
     path("<str:username>/", ProfileDetailView.as_view(), name="detail"),
+    path("<str:username>/nfts/", nft_gallery, name="nft_gallery"),
+    path("<str:username>/portfolio-history/", portfolio_history, name="portfolio_history"),
 ]
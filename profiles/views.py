@@ -1,28 +1,181 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.urls import reverse_lazy
-from django.views.generic import DetailView, UpdateView, ListView
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from django.template.loader import render_to_string
+from django.template.response import TemplateResponse
+from django.urls import reverse, reverse_lazy
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+from django.views import View
+from django.views.generic import UpdateView
 from accounts.models import User
 from accounts.forms import CustomUserChangeForm
-from .services import get_token_balances, get_nfts
+from linkus_app.pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_values, paginate_keyset
+from . import history, leaderboard
+from .models import Address, WalletValuation
+from .page_cache import (
+    aget_cached_profile_page, aget_profile_versions, aget_user_version, aset_cached_profile_page,
+)
+from .services import describe_token_balances, get_nft_page, get_token_balances
+from .thumbnails import attach_thumbnails
 
-class ProfileDetailView(DetailView):
-    model = User
+logger = logging.getLogger(__name__)
+
+
+# Upstream calls are given this share of the time the page waits for them, so they
+# give up and free their thread before the page stops waiting
+UPSTREAM_DEADLINE_SHARE = 0.8
+
+_upstream_executor = None
+
+
+def _get_upstream_executor() -> ThreadPoolExecutor:
+    """
+    Returns the pool running the profile page's upstream calls, creating it on first use.
+    """
+    global _upstream_executor
+    if _upstream_executor is None:
+        _upstream_executor = ThreadPoolExecutor(settings.PROFILE_UPSTREAM_WORKERS, thread_name_prefix="profile-upstream")
+    return _upstream_executor
+
+
+async def _call_with_timeout(func, *args, timeout: float):
+    """
+    Runs a blocking service call on the upstream pool without blocking the event loop.
+    The call gets a deadline shorter than `timeout`, so it doesn't keep running after
+    the page has stopped waiting. Returns None if it doesn't finish within `timeout` seconds.
+    """
+    call = functools.partial(func, *args, deadline=timeout * UPSTREAM_DEADLINE_SHARE)
+    try:
+        return await asyncio.wait_for(
+            asyncio.get_running_loop().run_in_executor(_get_upstream_executor(), call), timeout=timeout
+        )
+    except asyncio.TimeoutError:
+        logger.warning(f"{func.__name__}{args} timed out after {timeout}s.")
+        return None
+
+
+def _public_wallet_valuations(profile_user):
+    """
+    Returns the values of a user's primary wallet and public verified addresses
+    from the last portfolio update, largest first.
+    """
+    public_addresses = Address.objects.filter(
+        user=profile_user, currency_type="eth", is_verified=True, is_public=True
+    ).values("address")
+    return (
+        WalletValuation.objects.filter(user=profile_user)
+        .filter(Q(address=profile_user.wallet_address) | Q(address__in=public_addresses))
+        .order_by("-value", "address")
+    )
+
+
+class ProfileDetailView(View):
+    """
+    Async profile page. The user is loaded once, and token balances and NFTs
+    are fetched concurrently, each with its own timeout.
+
+    Rendered pages are cached per profile, varying only on whether the viewer is
+    anonymous, another user, or the owner. Anonymous viewers get the whole page
+    from the cache; logged-in viewers get the cached profile content inside a
+    freshly rendered layout (which shows their own navigation).
+    """
     template_name = "profiles/profile_detail.html"
-    context_object_name = "profile_user"
-    slug_field = "username"
-    slug_url_kwarg = "username"
+    content_template_name = "profiles/_profile_content.html"
+
+    async def get(self, request, username):
+        viewer = await request.auser()
+        if not viewer.is_authenticated:
+            variant = "anonymous"
+        elif viewer.username == username:
+            variant = "owner"
+        else:
+            variant = "visitor"
+
+        html = await aget_cached_profile_page(username, variant)
+        if html is not None and variant == "anonymous":
+            return HttpResponse(html)
+
+        if html is None:
+            versions = await aget_user_version(username)
+            profile_user = await aget_object_or_404(User, username=username)
+            versions.update(await aget_profile_versions(profile_user.pk, profile_user.wallet_address))
+            context, complete = await self.get_content_context(profile_user)
+            html = await sync_to_async(render_to_string)(self.content_template_name, context, request)
+
+            if variant == "anonymous":
+                html = await sync_to_async(render_to_string)(
+                    self.template_name, {"profile_username": username, "profile_content": html}, request
+                )
+            # Don't cache pages missing data because an upstream call timed out
+            if complete:
+                await aset_cached_profile_page(username, variant, html, versions)
+            if variant == "anonymous":
+                return HttpResponse(html)
+
+        return TemplateResponse(
+            request, self.template_name, {"profile_username": username, "profile_content": mark_safe(html)}
+        )
+
+    async def get_content_context(self, profile_user) -> tuple[dict, bool]:
+        """
+        Returns the context for the profile content, and whether all of its data was loaded.
+        """
+        context = {"profile_user": profile_user}
+        # Only valued portfolios have a breakdown
+        if profile_user.portfolio_value:
+            context['wallet_valuations'] = [
+                valuation async for valuation in _public_wallet_valuations(profile_user)
+            ]
+        if not profile_user.wallet_address:
+            return context, True
+
+        # Fetch token balances and NFTs from external APIs in parallel.
+        # These service functions have built-in caching.
+        # Only the first page of NFTs is rendered; the rest is loaded incrementally.
+        token_balances, nft_page = await asyncio.gather(
+            _call_with_timeout(
+                get_token_balances, profile_user.wallet_address, timeout=settings.PROFILE_BALANCES_TIMEOUT
+            ),
+            _call_with_timeout(
+                get_nft_page, profile_user.wallet_address, timeout=settings.PROFILE_NFTS_TIMEOUT
+            ),
+        )
+        context['token_balances'] = await sync_to_async(describe_token_balances)(token_balances or [])
+        nfts, context['nfts_next_page_key'] = nft_page or ([], None)
+        context['nfts'] = await sync_to_async(attach_thumbnails)(nfts)
+        return context, token_balances is not None and nft_page is not None
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        profile_user = self.get_object()
 
-        if profile_user.wallet_address:
-            # Fetch token balances and NFTs from external APIs
-            # These service functions have built-in caching
-            context['token_balances'] = get_token_balances(profile_user.wallet_address)
-            context['nfts'] = get_nfts(profile_user.wallet_address)
+async def nft_gallery(request, username):
+    """
+    Returns one page of a user's NFT gallery as JSON, for incremental loading.
+    Pass the `next_page_key` of the previous page as `page_key` to get the next one.
+    """
+    wallet_address = await (
+        User.objects.filter(username=username).values_list("wallet_address", flat=True).afirst()
+    )
+    if not wallet_address:
+        raise Http404("No wallet found for this user.")
 
-        return context
+    page_key = request.GET.get("page_key") or None
+    nft_page = await _call_with_timeout(
+        get_nft_page, wallet_address, page_key, timeout=settings.PROFILE_NFTS_TIMEOUT
+    )
+    if nft_page is None:
+        return JsonResponse({"success": False, "message": "NFT service timed out."}, status=504)
+
+    nfts, next_page_key = nft_page
+    nfts = await sync_to_async(attach_thumbnails)(nfts)
+    return JsonResponse({"success": True, "nfts": nfts, "next_page_key": next_page_key})
 
 class ProfileEditView(LoginRequiredMixin, UpdateView):
     model = User
@@ -37,14 +190,127 @@ class ProfileEditView(LoginRequiredMixin, UpdateView):
         """Redirect to the user's profile page after a successful edit."""
         return reverse_lazy("profiles:detail", kwargs={"username": self.request.user.username})
 
-class RankingView(ListView):
-    model = User
+# Ranking order; the partial index on public users in accounts serves it
+RANKING_ORDERING = ("-portfolio_value", "-id")
+RANKING_PAGE_SIZE = 50
+
+
+def _ranking_page(cursor: str | None, page_size: int) -> tuple[list, str | None]:
+    """
+    Returns one page of public users, each with its global `rank`, and the cursor
+    of the next page (None on the last page).
+
+    Pages are read from the Redis leaderboard by rank, falling back to keyset
+    pagination on the database if it is unavailable or hasn't been built since
+    Redis lost it, in which case a rebuild is queued. Both order users with equal
+    values by descending id, and cursors carry both the rank offset and the last
+    row's ordering values, so either source can continue a page from the other.
+    """
+    position = decode_cursor(cursor) if cursor else {}
+    offset = position.get("r", 0)
+    if not isinstance(offset, int) or offset < 0:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+
+    users = None
+    try:
+        ranked_users = leaderboard.LeaderboardList()
+        users = ranked_users[offset:offset + page_size]
+        has_next = offset + page_size < len(ranked_users)
+    except leaderboard.LeaderboardNotBuilt:
+        leaderboard.schedule_rebuild()
+    except leaderboard.LeaderboardUnavailable:
+        pass
+
+    if users is None:
+        try:
+            users, next_values = paginate_keyset(
+                User.objects.filter(is_public=True), RANKING_ORDERING, position.get("k"), page_size
+            )
+        except (ValidationError, ValueError, TypeError) as e:
+            raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+        has_next = next_values is not None
+
+    for i, user in enumerate(users, start=offset + 1):
+        user.rank = i
+
+    next_cursor = None
+    if has_next and users:
+        next_cursor = encode_cursor({"r": offset + len(users), "k": keyset_values(users[-1], RANKING_ORDERING)})
+    return users, next_cursor
+
+
+class RankingView(View):
+    """
+    Public users, ordered by their portfolio value in descending order.
+    Pages are linked by an opaque `cursor`, so every page costs the same to load.
+    """
     template_name = "profiles/ranking.html"
-    context_object_name = "users"
-    paginate_by = 50
 
-    def get_queryset(self):
-        """
-        Return public users, ordered by their portfolio value in descending order.
-        """
-        return User.objects.filter(is_public=True).order_by('-portfolio_value')
+    def get(self, request):
+        try:
+            users, next_cursor = _ranking_page(request.GET.get("cursor"), RANKING_PAGE_SIZE)
+        except InvalidCursor:
+            return HttpResponseBadRequest("Invalid cursor.")
+
+        my_rank = None
+        if request.user.is_authenticated and request.user.is_public:
+            try:
+                my_rank = leaderboard.get_rank(request.user.pk)
+            except leaderboard.LeaderboardUnavailable:
+                pass
+
+        return TemplateResponse(request, self.template_name, {
+            "users": users,
+            "next_cursor": next_cursor,
+            "is_first_page": not request.GET.get("cursor"),
+            "my_rank": my_rank,
+        })
+
+
+def ranking_api(request):
+    """
+    Returns one page of the ranking as JSON, for infinite scrolling.
+    Pass the `next_cursor` of the previous page as `cursor` to get the next one.
+    """
+    try:
+        users, next_cursor = _ranking_page(request.GET.get("cursor"), RANKING_PAGE_SIZE)
+    except InvalidCursor:
+        return JsonResponse({"success": False, "message": "Invalid cursor."}, status=400)
+
+    return JsonResponse({
+        "success": True,
+        "users": [
+            {
+                "rank": user.rank,
+                "username": user.username,
+                "nickname": user.nickname,
+                "portfolio_value": str(user.portfolio_value),
+                "avatar_url": user.avatar_url,
+                "profile_url": reverse("profiles:detail", kwargs={"username": user.username}),
+            }
+            for user in users
+        ],
+        "next_cursor": next_cursor,
+    })
+
+
+def portfolio_history(request, username):
+    """
+    Returns a user's portfolio value history as JSON chart points, read from the
+    pre-aggregated snapshots of the resolution matching the requested `range`
+    (one of history.CHART_RANGES, default "1m"). Private users' history is only
+    returned to themselves.
+    """
+    user_id, is_public = get_object_or_404(User.objects.values_list("pk", "is_public"), username=username)
+    if not is_public and request.user.pk != user_id:
+        raise Http404("No history found for this user.")
+    try:
+        resolution, points = history.get_chart(user_id, request.GET.get("range", "1m"), timezone.now())
+    except KeyError:
+        return JsonResponse({"success": False, "message": "Invalid range."}, status=400)
+
+    return JsonResponse({
+        "success": True,
+        "resolution": resolution,
+        "points": [{"time": bucket.isoformat(), "value": str(value)} for bucket, value in points],
+    })
@@ -0,0 +1,70 @@
+from django.contrib.auth import get_user_model
+from posts.models import Post
+from profiles.models import SnsLink
+from .models import SearchEntry
+from .tokens import segment
+
+
+def post_content(post) -> str:
+    return post.content
+
+
+def user_content(user, sns_urls=()) -> str:
+    return " ".join(filter(None, [user.username, user.nickname, user.bio, *sns_urls]))
+
+
+def _upsert(kind: str, contents: dict) -> None:
+    """
+    Inserts or updates the entries for {object id: content} in a single statement.
+    The full-text index is updated by the database along with the rows.
+    """
+    if contents:
+        SearchEntry.objects.bulk_create(
+            [
+                SearchEntry(kind=kind, object_id=object_id, content=segment(content))
+                for object_id, content in contents.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["kind", "object_id"],
+            update_fields=["content", "updated_at"],
+        )
+
+
+def remove(kind: str, object_ids) -> None:
+    SearchEntry.objects.filter(kind=kind, object_id__in=list(object_ids)).delete()
+
+
+def index_posts(posts) -> None:
+    _upsert(SearchEntry.KIND_POST, {post.pk: post_content(post) for post in posts})
+
+
+def index_users(users) -> None:
+    """
+    Indexes public users with their SNS links, and removes non-public users.
+    """
+    users = list(users)
+    public_users = [user for user in users if user.is_public]
+    sns_urls = {}
+    for user_id, url in SnsLink.objects.filter(user__in=public_users).values_list("user_id", "url"):
+        sns_urls.setdefault(user_id, []).append(url)
+
+    _upsert(SearchEntry.KIND_USER, {user.pk: user_content(user, sns_urls.get(user.pk, [])) for user in public_users})
+    remove(SearchEntry.KIND_USER, [user.pk for user in users if not user.is_public])
+
+
+def rebuild(batch_size: int = 1000) -> int:
+    """
+    Reindexes every post and user in batches. Returns the number of objects indexed.
+    """
+    SearchEntry.objects.all().delete()
+    count = 0
+    for queryset, index in [
+        (Post.objects.only("id", "content"), index_posts),
+        (get_user_model().objects.only("id", "username", "nickname", "bio", "is_public"), index_users),
+    ]:
+        last_pk = 0
+        while batch := list(queryset.filter(pk__gt=last_pk).order_by("pk")[:batch_size]):
+            index(batch)
+            count += len(batch)
+            last_pk = batch[-1].pk
+    return count
@@ -0,0 +1,77 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from linkus_app.benchmarks import benchmark_database, format_summary, run_concurrently, summarize
+from search.models import SearchEntry
+from search.query import _search_fallback, query_terms, search
+
+SYLLABLES = ["ka", "ri", "to", "mu", "sen", "lo", "bit", "eth", "nor", "va", "chi", "del", "qua", "zen", "pol", "ur"]
+
+
+def generate_vocabulary(rng, size: int) -> list[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    return sorted(words)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks search on a throwaway database over a generated corpus of posts "
+        "whose words follow a Zipf-like distribution."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=1_000_000, help="Posts in the corpus.")
+        parser.add_argument("--queries", type=int, default=200, help="Queries per term class.")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, posts, queries, seed, **options):
+        rng = random.Random(seed)
+        vocabulary = generate_vocabulary(rng, 20_000)
+        weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+
+        with benchmark_database():
+            started = time.perf_counter()
+            for first in range(0, posts, 10_000):
+                SearchEntry.objects.bulk_create([
+                    SearchEntry(kind=SearchEntry.KIND_POST, object_id=i,
+                                content=" ".join(rng.choices(vocabulary, weights, k=rng.randint(8, 30))))
+                    for i in range(first, min(first + 10_000, posts))
+                ])
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{connection.vendor}: indexed {posts} posts in {elapsed:.1f}s ({posts / elapsed:.0f}/s)"
+            )
+
+            term_classes = {
+                "common": vocabulary[:10],
+                "mid": vocabulary[500:510],
+                "rare": vocabulary[15_000:15_010],
+                "two terms": [f"{a} {b}" for a, b in zip(vocabulary[:10], vocabulary[100:110])],
+                "prefix": [word[:5] + "*" for word in vocabulary[1000:1010]],
+            }
+            for label, terms in term_classes.items():
+                result = run_concurrently(lambda worker, i: search(terms[i % len(terms)]), 1, queries)
+                self.stdout.write(format_summary(label, summarize(result)))
+
+            # An unindexed LIKE scan over the same rows, for comparison (a few runs only).
+            # Rare terms have too few matches to stop the scan early.
+            terms = term_classes["rare"]
+            result = run_concurrently(
+                lambda worker, i: _search_fallback(query_terms(terms[i]), None, None, 21), 1, 5
+            )
+            self.stdout.write(format_summary("rare, no index", summarize(result)))
+
+            # Cost of a deep page: follow cursors 50 pages into a common term
+            after, page_times = None, []
+            for _ in range(50):
+                started = time.perf_counter()
+                _, after = search(term_classes["common"][0], after=after)
+                page_times.append((time.perf_counter() - started) * 1000)
+                if after is None:
+                    break
+            self.stdout.write(
+                f"{'deep pages':<14} page 1 {page_times[0]:.2f}ms, page {len(page_times)} {page_times[-1]:.2f}ms"
+            )
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from search import index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the search index from all posts and users."
+
+    def handle(self, *args, **options):
+        count = index.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} posts and users."))
@@ -0,0 +1,56 @@
+from django.db import migrations
+
+# The full-text index depends on the database, so it is created with vendor-specific SQL.
+# Other databases get no index, and search falls back to a LIKE scan.
+
+POSTGRESQL_FORWARDS = [
+    # 'simple' doesn't stem, so it works the same for every language
+    "ALTER TABLE search_searchentry ADD COLUMN search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED",
+    "CREATE INDEX search_entry_vector_idx ON search_searchentry USING gin (search_vector)",
+]
+POSTGRESQL_BACKWARDS = [
+    "DROP INDEX IF EXISTS search_entry_vector_idx",
+    "ALTER TABLE search_searchentry DROP COLUMN IF EXISTS search_vector",
+]
+
+# An external-content FTS5 table: it stores only the index, and reads content from
+# search_searchentry. Triggers keep it in sync with every insert, update and delete.
+SQLITE_FORWARDS = [
+    "CREATE VIRTUAL TABLE search_searchentry_fts USING fts5("
+    "content, content='search_searchentry', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER search_searchentry_fts_insert AFTER INSERT ON search_searchentry BEGIN "
+    "INSERT INTO search_searchentry_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER search_searchentry_fts_delete AFTER DELETE ON search_searchentry BEGIN "
+    "INSERT INTO search_searchentry_fts(search_searchentry_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER search_searchentry_fts_update AFTER UPDATE OF content ON search_searchentry BEGIN "
+    "INSERT INTO search_searchentry_fts(search_searchentry_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO search_searchentry_fts(rowid, content) VALUES (new.id, new.content); END",
+]
+SQLITE_BACKWARDS = [
+    "DROP TRIGGER IF EXISTS search_searchentry_fts_update",
+    "DROP TRIGGER IF EXISTS search_searchentry_fts_delete",
+    "DROP TRIGGER IF EXISTS search_searchentry_fts_insert",
+    "DROP TABLE IF EXISTS search_searchentry_fts",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({"postgresql": POSTGRESQL_FORWARDS, "sqlite": SQLITE_FORWARDS}),
+            _run({"postgresql": POSTGRESQL_BACKWARDS, "sqlite": SQLITE_BACKWARDS}),
+        ),
+    ]
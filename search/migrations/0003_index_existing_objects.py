@@ -0,0 +1,54 @@
+from itertools import islice
+from django.conf import settings
+from django.db import migrations
+from search.tokens import segment
+
+BATCH_SIZE = 1000
+
+
+def _create_in_batches(SearchEntry, entries):
+    while batch := list(islice(entries, BATCH_SIZE)):
+        SearchEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def index_existing_objects(apps, schema_editor):
+    """
+    Indexes the posts and public users created before search existed, streaming
+    them in batches so memory doesn't grow with the number of rows.
+    """
+    SearchEntry = apps.get_model('search', 'SearchEntry')
+    Post = apps.get_model('posts', 'Post')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    SnsLink = apps.get_model('profiles', 'SnsLink')
+
+    _create_in_batches(SearchEntry, (
+        SearchEntry(kind='post', object_id=post_id, content=segment(content))
+        for post_id, content in Post.objects.values_list('id', 'content').iterator(chunk_size=BATCH_SIZE)
+    ))
+
+    sns_urls = {}
+    for user_id, url in SnsLink.objects.filter(user__is_public=True).values_list('user_id', 'url').iterator():
+        sns_urls.setdefault(user_id, []).append(url)
+    users = User.objects.filter(is_public=True).only('id', 'username', 'nickname', 'bio')
+    _create_in_batches(SearchEntry, (
+        SearchEntry(
+            kind='user',
+            object_id=user.id,
+            content=segment(" ".join(filter(None, [user.username, user.nickname, user.bio, *sns_urls.get(user.id, [])]))),
+        )
+        for user in users.iterator(chunk_size=BATCH_SIZE)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0002_full_text_index'),
+        ('posts', '0001_initial'),
+        ('profiles', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(index_existing_objects, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+from django.db import models
+
+
+class SearchEntry(models.Model):
+    """
+    The searchable text of a post or a public user, kept in sync by signals, with
+    Japanese text split into words (see search.tokens).
+    The full-text index over `content` is database-specific and created by the
+    migrations: a generated tsvector column with a GIN index on PostgreSQL, and
+    an FTS5 table kept up to date by triggers on SQLite.
+    """
+    KIND_POST = "post"
+    KIND_USER = "user"
+    KIND_CHOICES = [
+        (KIND_POST, "Post"),
+        (KIND_USER, "User"),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField(help_text="The id of the post or user.")
+    content = models.TextField(help_text="The text that is searched.")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "object_id"], name="search_entry_unique_object"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.object_id}"
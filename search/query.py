@@ -0,0 +1,128 @@
+import re
+from typing import NamedTuple
+from django.conf import settings
+from django.db import connection
+from .models import SearchEntry
+from .tokens import is_cjk_character, segment
+
+# Queries are reduced to plain word terms, so user input can never be interpreted as
+# full-text query syntax. All terms must match. A term ending in "*" matches as a
+# prefix ("sato*"); only on request, as a prefix merges the matches of every word
+# starting with it. Japanese words are matched as the bigrams they are indexed as
+# (see search.tokens).
+#
+# Scoring every match of a very common term costs as much as the number of matches,
+# so only the newest SEARCH_RANK_WINDOW matches (by id, the primary key) are scored
+# and ranked. SQLite's FTS5 index is ordered by rowid, so it stops after the window
+# however common the term is. PostgreSQL's GIN index returns matches unordered: all of
+# them are still fetched and sorted by id, or the planner walks the primary key
+# backwards and filters, but only the window is ranked with ts_rank, which reads each
+# row's tsvector and dominates the cost.
+TERM_RE = re.compile(r"(\w+)(\*?)")
+MAX_TERMS = 10
+
+
+class SearchHit(NamedTuple):
+    id: int
+    kind: str
+    object_id: int
+    score: float
+
+
+def query_terms(query: str) -> list[tuple[str, bool]]:
+    """
+    Returns the (word, is prefix) terms of a query. A Japanese word becomes its
+    bigrams, and a single Japanese character a prefix.
+    """
+    terms = []
+    for word, star in TERM_RE.findall(query):
+        pieces = segment(word.lower(), query=True).split()
+        for i, piece in enumerate(pieces):
+            terms.append((piece, (bool(star) and i == len(pieces) - 1) or is_cjk_character(piece)))
+    return terms[:MAX_TERMS]
+
+
+def _run(sql: str, params: list) -> list[SearchHit]:
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [SearchHit(*row) for row in cursor.fetchall()]
+
+
+def _page_sql(matches_sql: str, after) -> str:
+    """
+    Wraps a query of matches with their scores into one page, ordered by score
+    and then id, starting after the (score, id) of the previous page.
+    """
+    after_sql = "WHERE score < %s OR (score = %s AND id < %s)" if after else ""
+    return f"SELECT id, kind, object_id, score FROM ({matches_sql}) matches {after_sql} ORDER BY score DESC, id DESC LIMIT %s"
+
+
+def _search_postgresql(terms, kind, after, limit) -> list[SearchHit]:
+    tsquery = " & ".join(word + (":*" if prefix else "") for word, prefix in terms)
+    kind_sql = "AND kind = %s" if kind else ""
+    matches_sql = (
+        "SELECT id, kind, object_id, ts_rank(search_vector, query)::float8 AS score FROM ("
+        "SELECT id, kind, object_id, search_vector, query "
+        "FROM search_searchentry, to_tsquery('simple', %s) query "
+        f"WHERE search_vector @@ query {kind_sql} ORDER BY id DESC LIMIT %s"
+        ") recent"
+    )
+    params = [
+        tsquery, *([kind] if kind else []), settings.SEARCH_RANK_WINDOW,
+        *([after[0], after[0], after[1]] if after else []), limit,
+    ]
+    return _run(_page_sql(matches_sql, after), params)
+
+
+def _search_sqlite(terms, kind, after, limit) -> list[SearchHit]:
+    # bm25 ranks better matches lower, so its negation is the score
+    match = " ".join(f'"{word}"' + ("*" if prefix else "") for word, prefix in terms)
+    kind_sql = "AND e.kind = %s" if kind else ""
+    matches_sql = (
+        "SELECT e.id AS id, e.kind AS kind, e.object_id AS object_id, -f.rank AS score "
+        "FROM search_searchentry_fts f JOIN search_searchentry e ON e.id = f.rowid "
+        f"WHERE search_searchentry_fts MATCH %s {kind_sql} ORDER BY f.rowid DESC LIMIT %s"
+    )
+    params = [
+        match, *([kind] if kind else []), settings.SEARCH_RANK_WINDOW,
+        *([after[0], after[0], after[1]] if after else []), limit,
+    ]
+    return _run(_page_sql(matches_sql, after), params)
+
+
+def _search_fallback(terms, kind, after, limit) -> list[SearchHit]:
+    """
+    An unindexed scan, for databases without a full-text index. Newest matches first.
+    """
+    entries = SearchEntry.objects.order_by("-id")
+    for word, _ in terms:
+        entries = entries.filter(content__icontains=word)
+    if kind:
+        entries = entries.filter(kind=kind)
+    if after:
+        entries = entries.filter(id__lt=after[1])
+    return [SearchHit(id, kind, object_id, 0.0) for id, kind, object_id in entries.values_list("id", "kind", "object_id")[:limit]]
+
+
+def search(query: str, kind: str | None = None, after=None, limit: int = 20) -> tuple[list[SearchHit], list | None]:
+    """
+    Returns one page of entries matching `query`, best matches first, optionally of
+    one `kind`, starting after the (score, id) `after` of the previous page.
+    Also returns the (score, id) to continue from, or None on the last page.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return [], None
+
+    if connection.vendor == "postgresql":
+        search_func = _search_postgresql
+    elif connection.vendor == "sqlite":
+        search_func = _search_sqlite
+    else:
+        search_func = _search_fallback
+    hits = search_func(terms, kind, after, limit + 1)
+
+    if len(hits) <= limit:
+        return hits, None
+    hits = hits[:limit]
+    return hits, [hits[-1].score, hits[-1].id]
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from posts.models import Post
+from profiles.models import SnsLink
+from . import index
+from .models import SearchEntry
+
+# Fields of a user that are searched, or decide whether they are
+USER_INDEXED_FIELDS = {"username", "nickname", "bio", "is_public"}
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    index.index_posts([instance])
+
+
+@receiver(post_delete, sender=Post)
+def remove_post(sender, instance, **kwargs):
+    index.remove(SearchEntry.KIND_POST, [instance.pk])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def index_user(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not USER_INDEXED_FIELDS & set(update_fields):
+        return
+    index.index_users([instance])
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def remove_user(sender, instance, **kwargs):
+    index.remove(SearchEntry.KIND_USER, [instance.pk])
+
+
+@receiver(post_save, sender=SnsLink)
+@receiver(post_delete, sender=SnsLink)
+def index_link_owner(sender, instance, **kwargs):
+    """
+    Reindexes the user owning a link, whose links are part of their entry.
+    """
+    index.index_users(get_user_model().objects.filter(pk=instance.user_id))
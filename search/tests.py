@@ -0,0 +1,105 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from posts.models import Post
+from profiles.models import SnsLink
+from .models import SearchEntry
+from .query import query_terms, search
+
+User = get_user_model()
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SearchIndexTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="satoshi", password="password", bio="Bitcoin enthusiast")
+
+    def found(self, query, kind=None):
+        hits, _ = search(query, kind)
+        return [(hit.kind, hit.object_id) for hit in hits]
+
+    def test_posts_are_indexed_on_save_and_removed_on_delete(self):
+        """Test that posts are searchable as soon as they are saved, until deleted."""
+        post = Post.objects.create(author=self.user, content="Minting my first NFT collection today")
+
+        self.assertEqual(self.found("nft collection"), [("post", post.id)])
+        self.assertEqual(self.found("collect*"), [("post", post.id)])
+        self.assertEqual(self.found("collect"), [])
+
+        post.delete()
+        self.assertEqual(self.found("nft"), [])
+
+    def test_users_are_indexed_with_links_while_public(self):
+        """Test that profiles are found by name, bio and links, and hidden when private."""
+        SnsLink.objects.create(user=self.user, platform="github", url="https://github.com/nakamoto")
+
+        self.assertEqual(self.found("nakamoto"), [("user", self.user.id)])
+        self.assertEqual(self.found("bitcoin", kind=SearchEntry.KIND_USER), [("user", self.user.id)])
+
+        self.user.bio = "Ethereum now"
+        self.user.save()
+        self.assertEqual(self.found("bitcoin"), [])
+
+        self.user.is_public = False
+        self.user.save(update_fields=["is_public"])
+        self.assertEqual(self.found("satoshi"), [])
+
+    @override_settings(SEARCH_RANK_WINDOW=5)
+    def test_ranking_is_bounded_to_newest_matches(self):
+        """Test that only the newest SEARCH_RANK_WINDOW matches are ranked."""
+        posts = [Post.objects.create(author=self.user, content=f"gm {i}") for i in range(8)]
+
+        self.assertCountEqual(self.found("gm"), [("post", post.id) for post in posts[-5:]])
+
+    def test_japanese_words_are_found(self):
+        """Test that words inside Japanese text, which has no spaces, are searchable."""
+        post = Post.objects.create(author=self.user, content="東京タワーでNFTを発行しました")
+
+        for query in ["東京", "タワー", "発行", "nft", "東京タワー nft", "京", "た"]:
+            self.assertEqual(self.found(query), [("post", post.id)], query)
+        self.assertEqual(self.found("大阪"), [])
+        self.assertEqual(self.found("東タ"), [])
+
+    def test_japanese_query_terms_are_bigrams(self):
+        self.assertEqual(query_terms("タワー"), [("タワ", False), ("ワー", False)])
+        self.assertEqual(query_terms("猫 cat*"), [("猫", True), ("cat", True)])
+
+    def test_query_syntax_is_not_interpreted(self):
+        """Test that full-text operators and quotes in a query are treated as plain words."""
+        Post.objects.create(author=self.user, content="NEAR or solana")
+
+        self.assertEqual(self.found('"near" OR -(solana*'), self.found("near or solana"))
+        self.assertEqual(self.found('"*'), [])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SearchViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="poster", password="password")
+        cls.posts = [
+            Post.objects.create(author=cls.user, content="gm " * (i % 4 + 1) + f"post number {i}")
+            for i in range(45)
+        ]
+
+    def test_results_are_cursor_paginated(self):
+        """Test that following cursors returns every match once, in a fixed number of queries per page."""
+        seen, params = [], {"q": "gm", "type": "posts"}
+        while True:
+            with self.assertNumQueries(2):  # Search, load posts with authors
+                response = self.client.get(reverse("search:search"), params)
+            seen.extend(result["object"].id for result in response.context["results"])
+            if not response.context["next_cursor"]:
+                break
+            params["cursor"] = response.context["next_cursor"]
+
+        self.assertEqual(sorted(seen), sorted(post.id for post in self.posts))
+        self.assertContains(response, "@poster")
+
+    def test_cursor_must_match_query(self):
+        response = self.client.get(reverse("search:search"), {"q": "gm"})
+        cursor = response.context["next_cursor"]
+
+        self.assertEqual(self.client.get(reverse("search:search"), {"q": "post", "cursor": cursor}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("search:search"), {"q": "gm", "cursor": "junk"}).status_code, 400)
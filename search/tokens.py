@@ -0,0 +1,33 @@
+import re
+
+# The full-text indexes split words at spaces and punctuation, which Japanese (and
+# Chinese) text doesn't have, so a whole sentence would be a single word. Before text
+# is indexed or searched, each run of CJK characters is replaced by its overlapping
+# bigrams and its last character: "東京タワー" becomes "東京 京タ タワ ワー ー". A query
+# word of two or more CJK characters then matches as all its bigrams, and a single
+# character as a prefix of them (see query.query_terms).
+CJK_RE = re.compile(
+    r"[\u3040-\u30ff"  # Hiragana, Katakana
+    r"\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"  # CJK ideographs
+    r"\uac00-\ud7af"  # Hangul syllables
+    r"\uff66-\uff9f]+"  # Halfwidth Katakana
+)
+
+
+def _split_run(run: str, query: bool) -> str:
+    words = [run[i:i + 2] for i in range(len(run) - 1)]
+    if not (query and words):
+        words.append(run[-1])
+    return " " + " ".join(words) + " "
+
+
+def segment(text: str, query: bool = False) -> str:
+    """
+    Returns `text` with every run of CJK characters split into words. A query's
+    runs are split into their bigrams only.
+    """
+    return CJK_RE.sub(lambda match: _split_run(match.group(), query), text)
+
+
+def is_cjk_character(word: str) -> bool:
+    return len(word) == 1 and CJK_RE.fullmatch(word) is not None
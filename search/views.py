@@ -0,0 +1,65 @@
+from django.contrib.auth import get_user_model
+from django.http import HttpResponseBadRequest
+from django.template.response import TemplateResponse
+from django.views import View
+from linkus_app.pagination import InvalidCursor, decode_cursor, encode_cursor
+from posts.models import Post
+from .models import SearchEntry
+from .query import search
+
+
+class SearchView(View):
+    """
+    Full-text search over posts and public profiles, best matches first.
+    Pages are linked by an opaque `cursor` holding the last result's score and id.
+    """
+    template_name = "search/search.html"
+    page_size = 20
+    kinds = {"all": None, "posts": SearchEntry.KIND_POST, "people": SearchEntry.KIND_USER}
+
+    def get(self, request):
+        query = request.GET.get("q", "").strip()
+        kind = request.GET.get("type", "all")
+        if kind not in self.kinds:
+            kind = "all"
+
+        after = None
+        cursor = request.GET.get("cursor")
+        if cursor:
+            try:
+                position = decode_cursor(cursor)
+            except InvalidCursor:
+                return HttpResponseBadRequest("Invalid cursor.")
+            after = position.get("k")
+            if position.get("q") != query or position.get("t") != kind or not _is_position(after):
+                return HttpResponseBadRequest("Invalid cursor.")
+
+        hits, next_position = search(query, self.kinds[kind], after, self.page_size)
+        return TemplateResponse(request, self.template_name, {
+            "query": query,
+            "type": kind,
+            "results": self.load_results(hits),
+            "next_cursor": encode_cursor({"q": query, "t": kind, "k": next_position}) if next_position else None,
+        })
+
+    def load_results(self, hits) -> list:
+        """
+        Loads the posts and users behind the hits, with one query per kind.
+        """
+        post_ids = [hit.object_id for hit in hits if hit.kind == SearchEntry.KIND_POST]
+        user_ids = [hit.object_id for hit in hits if hit.kind == SearchEntry.KIND_USER]
+        objects = {
+            SearchEntry.KIND_POST: Post.objects.select_related("author").in_bulk(post_ids) if post_ids else {},
+            SearchEntry.KIND_USER: get_user_model().objects.in_bulk(user_ids) if user_ids else {},
+        }
+        return [
+            {"kind": hit.kind, "object": objects[hit.kind][hit.object_id]}
+            for hit in hits if hit.object_id in objects[hit.kind]
+        ]
+
+
+def _is_position(after) -> bool:
+    return (
+        isinstance(after, list) and len(after) == 2
+        and isinstance(after[0], (int, float)) and isinstance(after[1], int)
+    )